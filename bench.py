@@ -0,0 +1,739 @@
+#!/usr/bin/env python3
+"""Offline micro-benchmarks for the PC Express MCP server.
+
+Nothing here talks to the real API. Payloads are either recorded responses you pass in
+(save them from test_api.py or the browser's network tab; strip anything personal first)
+or synthetic ones shaped like the documented pcx-bff responses.
+
+    python bench.py json [cart.json orders.json ...]
+    python bench.py importtime [--budget-ms 60]
+    python bench.py startup [--budget-ms 1500]
+    python bench.py history-mem [--orders 5000] [--limit 10]
+    python bench.py limiter [--threshold 6] [--clients 32] [--requests 600]
+    python bench.py hedge [--calls 1000] [--tail 0.02] [--budget 0.05]
+    python bench.py results [--rounds 200]
+    python bench.py sessions [--rounds 40] [--sessions 20] [--abandon 0.5] [--idle 2]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pcx_json
+import pcx_orders
+
+
+def synthetic_cart(entries: int = 60) -> dict:
+    """A cart shaped like GET /carts/{cartId}, with `entries` line items."""
+    rnd = random.Random(1)
+    lines = [{
+        "product": {
+            "code": f"{20000000 + i}_EA",
+            "name": f"Product {i} {rnd.choice(['Milk', 'Bread', 'Cheese', 'Apples', 'Yogurt'])}",
+            "brand": rnd.choice(["PC", "No Name", "Neilson", "Dempster's", None]),
+            "packageSize": f"{rnd.randint(1, 4)} L",
+            "imageAssets": [{"smallUrl": f"https://assets.example/{i}/s.png",
+                             "largeUrl": f"https://assets.example/{i}/l.png"}],
+        },
+        "quantity": rnd.randint(1, 4),
+        "fulfillmentMethod": "pickup",
+        "prices": {"price": {"value": round(rnd.uniform(1, 20), 2), "unit": "ea"},
+                   "wasPrice": None, "comparisonPrices": [{"value": 0.42, "unit": "100g"}]},
+        "stockStatus": "OK",
+    } for i in range(entries)]
+    return {
+        "id": "c0ffee00-0000-4000-8000-000000000000",
+        "status": "ACTIVE",
+        "bannerId": "zehrs",
+        "customer": {"id": "customer", "email": None},
+        "orders": [{"id": "order-group", "storeId": "1234", "entries": lines}],
+        "minCartValue": 35.0,
+        "orderAggregations": [{"type": "SUBTOTAL", "value": 412.17}],
+    }
+
+
+def synthetic_order_history(orders: int = 200) -> dict:
+    """An order list shaped like GET /customers/historical-orders."""
+    rnd = random.Random(2)
+    history = [{
+        "orderId": f"{900000000 + i}",
+        "orderDate": f"20{20 + i // 60:02d}-{1 + i % 12:02d}-{1 + i % 28:02d}T15:04:05Z",
+        "orderTotal": round(rnd.uniform(30, 350), 2),
+        "orderStatus": "COMPLETED",
+        "storeName": "Zehrs Example",
+        "storeId": "1234",
+        "fulfillmentMethod": rnd.choice(["pickup", "delivery"]),
+        "itemsCount": rnd.randint(5, 60),
+    } for i in range(orders)]
+    return {"onlineOrdersCount": orders, "offlineOrdersCount": 0, "orderHistory": history}
+
+
+def _per_call(fn, payload, rounds: int) -> float:
+    fn(payload)  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(payload)
+    return (time.perf_counter() - start) / rounds
+
+
+def bench_json(args) -> None:
+    if args.payloads:
+        payloads = {Path(p).name: Path(p).read_bytes() for p in args.payloads}
+    else:
+        payloads = {
+            "cart (60 lines)": json.dumps(synthetic_cart()).encode(),
+            "order history (200 orders)": json.dumps(synthetic_order_history()).encode(),
+        }
+
+    print(f"fast backend: {pcx_json.BACKEND}")
+    if pcx_json.orjson is None:
+        print("orjson is not installed (or PCEXPRESS_JSON=stdlib); both columns use the stdlib.")
+    print(f"{'payload':<28} {'KiB':>6} {'stdlib µs':>10} {'fast µs':>9} {'saved µs':>9}")
+    for name, raw in payloads.items():
+        obj = json.loads(raw)
+        # One tool call = decode the upstream body + encode the tool output.
+        slow = (_per_call(pcx_json.stdlib_loads, raw, args.rounds)
+                + _per_call(pcx_json.stdlib_dumps, obj, args.rounds))
+        fast = (_per_call(pcx_json.loads, raw, args.rounds)
+                + _per_call(pcx_json.dumps, obj, args.rounds))
+        print(f"{name:<28} {len(raw) / 1024:>6.0f} {slow * 1e6:>10.0f} {fast * 1e6:>9.0f} "
+              f"{(slow - fast) * 1e6:>9.0f}")
+
+
+def _chunks(raw: bytes, size: int = 64 * 1024):
+    """The body as `requests` would hand it to iter_content()."""
+    for i in range(0, len(raw), size):
+        yield raw[i:i + size]
+
+
+def _measure(fn):
+    """(result, seconds, peak traced bytes); timed on a separate run, tracemalloc skews it."""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_history_mem(args) -> None:
+    """Peak memory of full parse + slice vs the streaming parse, on a synthetic long history."""
+    raw = json.dumps(synthetic_order_history(args.orders)).encode()
+
+    def full():
+        body = b"".join(_chunks(raw))  # resp.content
+        return pcx_json.loads(body)["orderHistory"][:args.limit]
+
+    def streamed():
+        orders = []
+        for order in pcx_orders.iter_json_array(_chunks(raw), "orderHistory"):
+            orders.append(order)
+            if len(orders) >= args.limit:
+                break
+        return orders
+
+    print(f"history: {args.orders} orders, {len(raw) / 1024:.0f} KiB; "
+          f"keeping the first {args.limit}")
+    results = {}
+    for name, fn in (("full parse", full), ("streaming", streamed)):
+        results[name], elapsed, peak = _measure(fn)
+        print(f"  {name:<11} peak {peak / 1024:>8.0f} KiB   {elapsed * 1000:>7.1f} ms")
+    assert results["full parse"] == results["streaming"], "streaming returned different orders"
+
+
+# Imported lazily by the server; pulling any of these in at import time is a regression.
+DEFERRED_MODULES = ("requests", "urllib3", "pcid_token")
+
+
+def _importtime(statement: str) -> list:
+    """(depth, self_us, cumulative_us, module) for each module a cold `statement` imports."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=Path(__file__).parent, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(self_us), int(cum_us), name.strip()))
+    return rows
+
+
+def bench_importtime(args) -> None:
+    """Cold-import the server under -X importtime and hold the part we control to a budget.
+
+    The `mcp` package dominates the import and is needed to answer `initialize`, so the
+    budget covers what the server pulls in beyond it: the self time of every module that
+    `mcp.server` and `mcp.types` alone don't load, the server's own body included. Modules mcp
+    needs anyway (asyncio, for one) cost the same whoever imports them first, so which import
+    line reaches them first doesn't move the number.
+    """
+    needed_by_mcp = {r[3] for r in _importtime("import mcp.server, mcp.types")}
+    rows = _importtime("import pcexpress_mcp_server")
+
+    top = next(r for r in rows if r[0] == 0 and r[3] == "pcexpress_mcp_server")
+    idx = rows.index(top)
+    subtree = []
+    for r in reversed(rows[:idx]):
+        if r[0] == 0:
+            break
+        subtree.append(r)
+    children = [r for r in subtree if r[0] == 1]
+    imported = {r[3] for r in rows}
+
+    owned_us = top[1] + sum(r[1] for r in subtree if r[3] not in needed_by_mcp)
+    mcp_us = top[2] - owned_us
+    print(f"import pcexpress_mcp_server: {top[2] / 1000:.1f} ms total, "
+          f"{mcp_us / 1000:.1f} ms in mcp and its dependencies, "
+          f"{owned_us / 1000:.1f} ms server-owned")
+    for depth, self_us, cum_us, name in sorted(children, key=lambda r: -r[2])[:8]:
+        print(f"  {cum_us / 1000:>8.1f} ms  {name}")
+
+    failures = [f"{m} imported at startup" for m in DEFERRED_MODULES if m in imported]
+    if owned_us / 1000 > args.budget_ms:
+        failures.append(f"server-owned import time {owned_us / 1000:.1f} ms "
+                        f"> {args.budget_ms} ms budget")
+    for f in failures:
+        print(f"FAIL: {f}")
+    if failures:
+        sys.exit(1)
+    print(f"OK (budget {args.budget_ms} ms)")
+
+
+def _rpc(proc, msg: dict) -> None:
+    proc.stdin.write(json.dumps(msg) + "\n")
+    proc.stdin.flush()
+
+
+def _read_reply(proc, msg_id: int) -> dict:
+    for line in proc.stdout:
+        reply = json.loads(line)
+        if reply.get("id") == msg_id:
+            return reply
+    raise RuntimeError("server exited before replying")
+
+
+def bench_startup(args) -> None:
+    """Spawn the stdio server and time initialize + tools/list, with no credentials at all.
+
+    The state dir points at a path that must not exist afterwards: answering the handshake
+    may not construct the TokenManager (which would create it) or refresh a token.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        state_dir = os.path.join(tmp, "state")
+        env = {k: v for k, v in os.environ.items() if not k.startswith("PCEXPRESS_")}
+        env["PCEXPRESS_STATE_DIR"] = state_dir
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "pcexpress_mcp_server.py"], cwd=Path(__file__).parent, env=env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            _rpc(proc, {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+                "protocolVersion": "2024-11-05", "capabilities": {},
+                "clientInfo": {"name": "bench", "version": "0"}}})
+            _read_reply(proc, 1)
+            initialized = time.perf_counter() - start
+            _rpc(proc, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+            _rpc(proc, {"jsonrpc": "2.0", "id": 2, "method": "tools/list"})
+            tools = _read_reply(proc, 2)["result"]["tools"]
+            listed = time.perf_counter() - start
+        finally:
+            proc.kill()
+            proc.wait()
+        touched_auth = os.path.exists(state_dir)
+
+    print(f"initialize reply: {initialized * 1000:.0f} ms, tools/list ({len(tools)} tools): "
+          f"{listed * 1000:.0f} ms after spawn")
+    failures = []
+    if touched_auth:
+        failures.append("the handshake constructed the TokenManager (state dir was created)")
+    if listed * 1000 > args.budget_ms:
+        failures.append(f"cold start {listed * 1000:.0f} ms > {args.budget_ms} ms budget")
+    for f in failures:
+        print(f"FAIL: {f}")
+    if failures:
+        sys.exit(1)
+    print(f"OK (budget {args.budget_ms} ms)")
+
+
+def _local_stub(respond):
+    """A local HTTP server for any path; `respond(active)` -> (status, seconds to stall).
+
+    `active` counts the requests in progress, this one included.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def do_GET(self):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+                status, stall = respond(state["active"])
+            try:
+                time.sleep(stall)
+                body = b'{"results": []}'
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def bench_limiter(args) -> None:
+    """Drive a throttling stub through PCExpressAPI._request, uncapped vs adaptive.
+
+    `clients` threads share `requests` requests and retry each 429 after a short pause, as
+    a fan-out tool call would. The adaptive limiter should settle near the stub's threshold
+    and turn most of those 429s into local waiting.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    import pcx_deadline
+    import pcx_limiter
+    from pcexpress_mcp_server import PCExpressAPI
+    from tests.conftest import StaticToken
+
+    latency = args.latency_ms / 1000
+    server, state = _local_stub(
+        lambda active: (429, 0) if active > args.threshold else (200, latency))
+    url = f"http://127.0.0.1:{server.server_address[1]}/products/bench"
+
+    def run(limiter):
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_maxsize=args.clients))
+        api = PCExpressAPI(StaticToken(), "bench", session=session, limiter=limiter)
+        todo = iter(range(args.requests))
+        todo_lock = threading.Lock()
+        throttled = [0]
+
+        def worker():
+            # As a tool call's fan-out would: interactive reads, not background work.
+            pcx_deadline.current.set(pcx_deadline.CallContext("bench", None))
+            while True:
+                with todo_lock:
+                    if next(todo, None) is None:
+                        return
+                while True:
+                    try:
+                        api._request("GET", url)
+                        break
+                    except requests.HTTPError:
+                        with todo_lock:
+                            throttled[0] += 1
+                        time.sleep(0.01)
+
+        state["peak"] = 0
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start, throttled[0]
+
+    print(f"stub: 429 above {args.threshold} concurrent, {args.latency_ms:.0f} ms per request; "
+          f"{args.clients} clients, {args.requests} requests")
+    results = {}
+    for name, limiter in (("uncapped", None), ("adaptive", pcx_limiter.AdaptiveLimiter(8))):
+        elapsed, throttled = run(limiter)
+        results[name] = throttled
+        extra = f"   final limit {limiter.limit:.1f}" if limiter else ""
+        print(f"  {name:<9} {elapsed:>6.2f} s   429s {throttled:>5} "
+              f"({throttled / args.requests:>5.0%})   "
+              f"peak upstream concurrency {state['peak']}{extra}")
+    server.shutdown()
+    if results["adaptive"] > args.requests * 0.1:
+        print("FAIL: adaptive limiter still throttled on more than 10% of requests")
+        sys.exit(1)
+    print("OK")
+
+
+def _percentile(samples: list, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def bench_hedge(args) -> None:
+    """search_products against a stub with a slow tail, with and without hedging.
+
+    Hedged calls should keep p99 near the median, for a few percent more upstream requests.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    import pcx_hedge
+    from pcexpress_mcp_server import PCExpressAPI
+    from tests.conftest import StaticToken
+
+    rnd = random.Random(3)
+    fast, slow = args.latency_ms / 1000, args.tail_ms / 1000
+    server, _ = _local_stub(lambda active: (
+        200, slow if rnd.random() < args.tail else fast * rnd.uniform(0.8, 1.2)))
+
+    def run(hedger):
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_maxsize=32))
+        api = PCExpressAPI(StaticToken(), "bench", session=session, hedger=hedger)
+        api.BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        calls = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(args.calls // args.clients):
+                start = time.perf_counter()
+                api.search_products("milk", size=5, exact=True)
+                with lock:
+                    calls.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return calls
+
+    print(f"stub: {args.latency_ms:.0f} ms, {args.tail:.0%} of requests {args.tail_ms:.0f} ms; "
+          f"{args.calls} search_products calls from {args.clients} clients")
+    for name, hedger in (("plain", None), ("hedged", pcx_hedge.Hedger(args.budget))):
+        calls = run(hedger)
+        p50, p95, p99 = (_percentile(calls, p) * 1000 for p in (0.5, 0.95, 0.99))
+        extra = f"   {hedger.hedged} hedges ({hedger.hedged / len(calls):.1%})" if hedger else ""
+        print(f"  {name:<7} p50 {p50:>6.0f} ms   p95 {p95:>6.0f} ms   p99 {p99:>6.0f} ms{extra}")
+    server.shutdown()
+
+
+def synthetic_tool_results() -> dict:
+    """A representative result per tool, shaped like what `_call_tool` returns."""
+    rnd = random.Random(4)
+    cart = synthetic_cart()
+    lines = cart["orders"][0]["entries"]
+    products = [{
+        "code": line["product"]["code"], "name": line["product"]["name"],
+        "brand": line["product"]["brand"], "packageSize": line["product"]["packageSize"],
+        "prices": line["prices"], "dealPrice": None,
+        "stockStatus": "OK", "link": f"/p/{line['product']['code']}", "offerType": "OG",
+    } for line in lines[:48]]
+    summary = [{"code": p["code"], "name": p["name"], "quantity": 1,
+                "price": p["prices"]["price"]["value"]} for p in products]
+    orders = synthetic_order_history(50)["orderHistory"]
+    return {
+        "search_past_orders": {"orders": orders, "totalOnlineOrders": 200, "totalOfflineOrders": 0},
+        "purchase_analytics": {
+            "groupBy": "item", "ordersAnalyzed": 100, "totalSpend": 18234.5, "rows": [
+                {"key": p["code"], "name": p["name"], "brand": p["brand"],
+                 "spend": round(rnd.uniform(20, 400), 2), "quantity": rnd.randint(2, 40),
+                 "orders": rnd.randint(2, 30), "first": "2024-01-02", "last": "2025-06-01"}
+                for p in products[:10]]},
+        "suggest_restock": {"asOf": "2025-06-01", "suggestions": [
+            {**s, "intervalDays": 7, "lastBought": "2025-05-20", "dueIn": -5, "confidence": 0.8,
+             "inStock": True, "deal": None} for s in summary[:20]]},
+        "get_order_items": cart,
+        "search_products": {"query": "milk", "totalResults": 312, "products": products},
+        "get_product_details": {**lines[0]["product"], "description": "x" * 600,
+                                "prices": lines[0]["prices"],
+                                "breadcrumbs": [{"name": "Dairy & Eggs"}, {"name": "Milk"}]},
+        "resolve_items": {"items": [
+            {"term": t, **summary[i], "source": "history", "share": 0.8}
+            for i, t in enumerate(["milk", "bread", "eggs", "butter", "apples"])], "searched": 0},
+        "check_availability": {
+            p["code"]: {"inStock": True, "price": p["prices"]["price"]["value"], "deal": None}
+            for p in products[:20]},
+        "add_to_cart": {"cartId": cart["id"], "added": summary[:1], "removed": [], "changed": [],
+                        "lineCount": 61, "subtotal": 414.16, "previousSubtotal": 412.17},
+        "remove_from_cart": {"cartId": cart["id"], "added": [], "removed": summary[:1],
+                             "changed": [], "lineCount": 59, "subtotal": 410.18,
+                             "previousSubtotal": 412.17},
+        "view_cart": cart,
+    }
+
+
+def bench_results(args) -> None:
+    """Per-tool cost of a tool result, from `_call_tool`'s return to the data in the client's hands.
+
+    One column per PCEXPRESS_TOOL_RESULTS mode. Server time covers the text encoding, the
+    outputSchema check, and the JSON-RPC serialization as sent over SSE or stdio. Client time
+    is the parse of that message plus, for the text modes, the parse of the text inside it.
+    """
+    import asyncio
+
+    import mcp.types as types
+    import pcexpress_mcp_server as server
+
+    modes = ("indented", "compact", "structured")
+    payloads = synthetic_tool_results()
+    server._call_tool = lambda name, arguments: server._tool_result(name, payloads[name])
+    handler = server.app.request_handlers[types.CallToolRequest]
+
+    def placeholder(schema: dict) -> dict:
+        # The least that passes the input schema: a dummy for each required argument.
+        dummies = {"string": "x", "array": ["x"], "integer": 1, "number": 1, "boolean": True}
+        return {k: dummies[schema["properties"][k]["type"]] for k in schema.get("required", ())}
+
+    async def measure(name: str, mode: str) -> tuple:
+        server.TOOL_RESULTS = mode
+        server.app._tool_cache.clear()
+        tools = {t.name: t for t in await server.list_tools()}
+        await server.app.request_handlers[types.ListToolsRequest](None)
+        request = types.CallToolRequest(params=types.CallToolRequestParams(
+            name=name, arguments=placeholder(tools[name].inputSchema)))
+        server_s = client_s = 0.0
+        for i in range(args.rounds + 1):
+            start = time.perf_counter()
+            result = await handler(request)
+            dumped = result.model_dump(by_alias=True, mode="json", exclude_none=True)
+            response = types.JSONRPCResponse(jsonrpc="2.0", id=1, result=dumped)
+            wire = types.JSONRPCMessage(response).model_dump_json(by_alias=True, exclude_none=True)
+            mid = time.perf_counter()
+            message = json.loads(wire)["result"]
+            assert not message.get("isError"), message
+            if "structuredContent" in message:
+                data = message["structuredContent"]
+            else:
+                data = json.loads(message["content"][0]["text"])
+            end = time.perf_counter()
+            if i:  # the first round warms the caches
+                server_s += mid - start
+                client_s += end - mid
+        assert data == payloads[name]
+        return len(wire), server_s / args.rounds, client_s / args.rounds
+
+    async def run():
+        print("per call: message KiB, then server + client µs")
+        print(f"{'tool':<20}" + "".join(f" {m + ' KiB':>15}" for m in modes)
+              + "".join(f" {m + ' µs':>14}" for m in modes))
+        totals = dict.fromkeys(modes, 0.0)
+        for name in payloads:
+            sizes, times = {}, {}
+            for mode in modes:
+                size, server_s, client_s = await measure(name, mode)
+                sizes[mode] = size
+                times[mode] = server_s + client_s
+                totals[mode] += times[mode]
+            print(f"{name:<20}" + "".join(f" {sizes[m] / 1024:>15.1f}" for m in modes)
+                  + "".join(f" {times[m] * 1e6:>14.0f}" for m in modes))
+        print(f"{'all tools':<20}" + " " * 16 * len(modes)
+              + "".join(f" {totals[m] * 1e6:>14.0f}" for m in modes))
+        base = totals["indented"]
+        print("vs indented: "
+              + ", ".join(f"{m} {(totals[m] - base) / base:+.0%}" for m in modes[1:]))
+
+    asyncio.run(run())
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _sse_session(port: int) -> tuple:
+    """Open /sse on a raw socket and complete the MCP handshake plus tools/list.
+
+    Returns (socket, session id), or (None, status line) if the connect was refused.
+    """
+    sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+    sock.sendall(b"GET /sse HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n")
+    stream = b""
+    while not (match := re.search(rb"session_id=([0-9a-f]{32})", stream)):
+        chunk = sock.recv(65536)
+        if not chunk or not stream and not chunk.startswith(b"HTTP/1.1 200"):
+            sock.close()
+            return None, (stream + chunk).split(b"\r\n", 1)[0].decode()
+        stream += chunk
+    session_id = match.group(1).decode()
+    for msg in ({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+                    "protocolVersion": "2024-11-05", "capabilities": {},
+                    "clientInfo": {"name": "bench", "version": "0"}}},
+                {"jsonrpc": "2.0", "method": "notifications/initialized"},
+                {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}):
+        urllib.request.urlopen(urllib.request.Request(
+            f"http://127.0.0.1:{port}/messages/?session_id={session_id}",
+            data=json.dumps(msg).encode(), headers={"Content-Type": "application/json"})).read()
+    while b'"id":2' not in stream.replace(b" ", b""):
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        stream += chunk
+    return sock, session_id
+
+
+def _server_metrics(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as r:
+        return json.loads(r.read())
+
+
+def bench_sessions(args) -> None:
+    """Churn SSE sessions against a local --http server and watch its memory and sessions gauge.
+
+    Each round opens `sessions` sessions, runs the handshake and tools/list on each, then
+    disconnects some cleanly and leaves the rest (`abandon`) connected but silent, as a client
+    that went away without closing would. The idle timeout has to close those; resident memory
+    after the last round should be where it was once the server had warmed up.
+    """
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {k: v for k, v in os.environ.items() if not k.startswith("PCEXPRESS_")}
+        env.update(PCEXPRESS_STATE_DIR=os.path.join(tmp, "state"), PCEXPRESS_HTTP_PORT=str(port),
+                   PCEXPRESS_SESSION_IDLE=str(args.idle),
+                   PCEXPRESS_MAX_SESSIONS=str(args.max_sessions),
+                   PCEXPRESS_RATE_LIMIT="10000/10000")
+        proc = subprocess.Popen([sys.executable, "pcexpress_mcp_server.py", "--http"],
+                                cwd=Path(__file__).parent, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        abandoned = []
+        try:
+            for _ in range(100):
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/health").read()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            print(f"{args.rounds} rounds x {args.sessions} sessions, {args.abandon:.0%} abandoned, "
+                  f"idle timeout {args.idle:g} s, max {args.max_sessions} sessions")
+            rss, refused = [], 0
+            for n in range(args.rounds):
+                for i in range(args.sessions):
+                    sock, session_id = _sse_session(port)
+                    if sock is None:
+                        refused += 1
+                    elif i < args.sessions * args.abandon:
+                        abandoned.append(sock)
+                    else:
+                        sock.close()
+                time.sleep(args.pause)
+                gauge = _server_metrics(port)["sessions"]
+                rss.append(gauge["rss_bytes"] or 0)
+                if n % max(1, args.rounds // 5) == 0 or n == args.rounds - 1:
+                    print(f"  round {n + 1:>3}: {gauge['open']:>3} open, "
+                          f"{gauge['reaped_idle']:>4} reaped, {gauge['evicted']:>3} evicted, "
+                          f"rss {rss[-1] / 2**20:6.1f} MiB")
+            quiet = args.idle + max(1.0, args.idle / 4) + 1
+            time.sleep(quiet)
+            final = _server_metrics(port)["sessions"]
+        finally:
+            for sock in abandoned:
+                sock.close()
+            proc.kill()
+            proc.wait()
+
+    warm = rss[min(len(rss) - 1, args.rounds // 4)]
+    growth = (final["rss_bytes"] or 0) - warm
+    print(f"after {quiet:g} s quiet: {final['open']} open, peak {final['peak']}, "
+          f"{final['opened']} opened, {final['reaped_idle']} reaped, {final['evicted']} evicted, "
+          f"{final['refused']} refused ({refused} seen)")
+    print(f"rss after warm-up {warm / 2**20:.1f} MiB, "
+          f"at the end {(final['rss_bytes'] or 0) / 2**20:.1f} MiB ({growth / 2**20:+.1f} MiB)")
+    failures = []
+    if args.idle and final["open"]:
+        failures.append(f"{final['open']} sessions still open after the idle timeout")
+    if growth > args.max_growth_mb * 2**20:
+        failures.append(f"resident memory grew {growth / 2**20:.1f} MiB > {args.max_growth_mb} MiB")
+    for f in failures:
+        print(f"FAIL: {f}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("json", help="decode + encode cost per tool call, stdlib vs fast backend")
+    p.add_argument("payloads", nargs="*", help="recorded response bodies (default: synthetic)")
+    p.add_argument("--rounds", type=int, default=200)
+    p.set_defaults(func=bench_json)
+
+    p = sub.add_parser("importtime", help="server import cost outside mcp, against a budget")
+    p.add_argument("--budget-ms", type=float, default=60)
+    p.set_defaults(func=bench_importtime)
+
+    p = sub.add_parser("startup", help="stdio spawn to tools/list reply, without credentials")
+    p.add_argument("--budget-ms", type=float, default=1500)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("history-mem", help="peak memory of full vs streaming order-history parse")
+    p.add_argument("--orders", type=int, default=5000)
+    p.add_argument("--limit", type=int, default=10)
+    p.set_defaults(func=bench_history_mem)
+
+    p = sub.add_parser("limiter", help="adaptive upstream limiter against a local throttling stub")
+    p.add_argument("--threshold", type=int, default=6)
+    p.add_argument("--clients", type=int, default=32)
+    p.add_argument("--requests", type=int, default=600)
+    p.add_argument("--latency-ms", type=float, default=20)
+    p.set_defaults(func=bench_limiter)
+
+    p = sub.add_parser("hedge", help="search_products tail latency with and without hedging")
+    p.add_argument("--calls", type=int, default=1000)
+    p.add_argument("--clients", type=int, default=4)
+    p.add_argument("--latency-ms", type=float, default=20)
+    p.add_argument("--tail", type=float, default=0.02, help="fraction of slow responses")
+    p.add_argument("--tail-ms", type=float, default=1000)
+    p.add_argument("--budget", type=float, default=0.05)
+    p.set_defaults(func=bench_hedge)
+
+    p = sub.add_parser("results",
+                       help="per-tool result cost: indented vs compact text vs structured content")
+    p.add_argument("--rounds", type=int, default=200)
+    p.set_defaults(func=bench_results)
+
+    p = sub.add_parser("sessions",
+                       help="soak: SSE session churn and abandonment against a local --http server")
+    p.add_argument("--rounds", type=int, default=40)
+    p.add_argument("--sessions", type=int, default=20)
+    p.add_argument("--abandon", type=float, default=0.5, help="fraction left connected but silent")
+    p.add_argument("--idle", type=float, default=2, help="PCEXPRESS_SESSION_IDLE for the server")
+    p.add_argument("--pause", type=float, default=0.5, help="seconds between rounds")
+    p.add_argument("--max-sessions", type=int, default=64)
+    p.add_argument("--max-growth-mb", type=float, default=8)
+    p.set_defaults(func=bench_sessions)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
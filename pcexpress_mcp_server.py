@@ -16,30 +16,57 @@ This server provides tools for:
 - Adding items to cart
 - Removing items from cart
 - Viewing cart contents
+
+Claude Desktop starts a fresh stdio process per session, so module import is on the
+critical path. `requests`, `dotenv`, and the token manager are imported where first used;
+`initialize` and `list_tools` are answered without touching the HTTP stack or auth.
 """
+from __future__ import annotations
 
-import json
+import asyncio
+import contextlib
 import logging
 import os
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 from datetime import datetime
 
-import requests
-from dotenv import load_dotenv
 from mcp.server import Server
-from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent
-
-from pcid_token import TokenManager, PcidAuthError
-
-# Load .env if present (no-op when the launcher passes env directly)
-load_dotenv()
+from mcp.types import CallToolResult, Tool, TextContent
+
+import pcx_admission
+import pcx_analytics
+import pcx_cart
+import pcx_catalog
+import pcx_deadline
+import pcx_hedge
+import pcx_json
+import pcx_limiter
+import pcx_names
+import pcx_orders
+import pcx_preferences
+import pcx_sessions
+import pcx_store
+import pcx_workers
+from pcx_cache import NotCached, ResponseCache
+
+if TYPE_CHECKING:
+    import requests
+    from pcid_token import TokenManager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("pcexpress-mcp")
 
 
+# Past orders don't change once placed; an hour-old copy is as good as a fresh one.
+ORDER_DETAIL_MAX_AGE = 3600
+
+# Responses kept in the on-disk store (URL fragment -> value), first match wins. Order details
+# never change and cost a request each to rebuild the purchase ledger; product details are many
+# and cheap, so they go first when the budget is tight.
+PERSISTED_RESPONSES = {"/historical-orders/": 4, "/historical-orders": 2, "/products/": 1}
+
+
 class PCExpressAPI:
     """Wrapper for PC Express API (works across all Loblaws banners)"""
 
@@ -58,7 +85,14 @@ class PCExpressAPI:
         "tandt": "www.tntsupermarket.com",
     }
 
-    def __init__(self, token_manager: TokenManager, cart_id: str, store_id: str = "1234", banner: str = "zehrs"):
+    def __init__(self, token_manager: TokenManager, cart_id: str, store_id: str = "1234",
+                 banner: str = "zehrs", cache: Optional[ResponseCache] = None,
+                 session: Optional[requests.Session] = None,
+                 cart_coalesce_window: float = 0.0, cart_write_timeout: float = 10.0,
+                 cart_write_retries: int = 2, fan_out: int = 8,
+                 preferences: Optional[pcx_preferences.PreferenceMap] = None,
+                 limiter: Optional[pcx_limiter.AdaptiveLimiter] = None,
+                 hedger: Optional[pcx_hedge.Hedger] = None):
         """
         Initialize PCExpressAPI client
 
@@ -67,13 +101,57 @@ class PCExpressAPI:
             cart_id: Active cart ID
             store_id: Store ID (4-digit code for your preferred store)
             banner: Store banner (zehrs, loblaws, nofrills, superstore, independent, tandt)
+            cache: Response cache for conditional GETs (a private one is created if omitted)
+            session: HTTP session, shareable with the TokenManager (a tuned one is built if omitted)
+            cart_coalesce_window: Seconds to hold cart writes so a burst goes out as one POST
+                (0 = off)
+            cart_write_timeout: Per-attempt timeout for cart POSTs, in seconds
+            cart_write_retries: Retries after an ambiguous cart-write failure
+                (see _post_cart_entries)
+            fan_out: Most upstream requests a single multi-item tool call runs at once
+            preferences: Learned term -> product mapping (an in-memory one is created if omitted)
+            limiter: Adaptive cap on concurrent API requests (None = uncapped)
+            hedger: Hedges slow product searches and detail reads (None = no hedging)
         """
         self.tokens = token_manager
         self._cart_id = cart_id
         self.store_id = store_id
         self.banner = banner.lower()
         self.domain = self.BANNER_DOMAINS.get(self.banner, "www.zehrs.ca")
-        self.session = requests.Session()
+        if session is None:
+            import pcx_http
+            session = pcx_http.build_session()
+        self.session = session
+        self.cache = cache if cache is not None else ResponseCache()
+        self.limiter = limiter
+        self.hedger = hedger
+        # Last cart body seen (GET or mutation response); the baseline for cart deltas.
+        self._cart_snapshot: Optional[dict] = None
+        self._cart_batcher = (
+            pcx_cart.CartWriteBatcher(self._post_cart_entries, cart_coalesce_window)
+            if cart_coalesce_window > 0 else None
+        )
+        self.cart_ops = pcx_cart.CartWriteLedger()
+        self.cart_write_timeout = cart_write_timeout
+        self.cart_write_retries = cart_write_retries
+        self.fan_out = fan_out
+        self._background = None  # executor for fire-and-forget cache warming, made on first use
+        self._order_index: Optional[pcx_orders.OrderIndex] = None
+        # order ID -> compact line items; orders are immutable once placed, so these never expire
+        self._order_lines: dict = {}
+        self.purchases = pcx_analytics.PurchaseLedger()
+        self.restock = pcx_analytics.RestockModel(self.purchases)
+        if preferences is None:
+            preferences = pcx_preferences.PreferenceMap()
+        self.preferences = preferences
+        self.purchases.listeners.append(lambda item_ids: self.preferences.learn_purchases(
+            self.purchases.items[i] for i in item_ids))
+        # Every product name seen, for fuzzy search terms and direct code matches
+        self.names = pcx_names.NameIndex()
+        self.purchases.listeners.append(
+            lambda item_ids: self.names.add(
+                (self.purchases.items[i]["code"], self.purchases.items[i]["name"])
+                for i in item_ids))
 
     @property
     def cart_id(self) -> str:
@@ -102,10 +180,15 @@ class PCExpressAPI:
         and the request retried; if no fresh cart exists, a clear error is
         raised instead of a bare 404.
         """
+        return self._with_cart(path, lambda url: self._request(method, url, **kwargs))
+
+    def _with_cart(self, path: str, send):
+        """Call `send(url)` for a cart-scoped path with the 404 self-heal of `_request_cart`."""
+        import requests
         stale_id = self.cart_id
         url = f"{self.BASE_URL}{path.format(cart_id=stale_id)}"
         try:
-            return self._request(method, url, **kwargs)
+            return send(url)
         except requests.HTTPError as e:
             if e.response is None or e.response.status_code != 404:
                 raise
@@ -117,12 +200,12 @@ class PCExpressAPI:
                     "to create a fresh cart, then retry."
                 ) from e
             url = f"{self.BASE_URL}{path.format(cart_id=fresh_id)}"
-            return self._request(method, url, **kwargs)
+            return send(url)
 
     def get_customer(self) -> dict:
         """Customer profile: cartId, customerId, name, postalCode, PC Optimum status, etc."""
         url = f"{self.BASE_URL}/ecommerce/v2/{self.banner}/customers"
-        return self._request("GET", url).json()
+        return pcx_json.loads(self._request("GET", url).content)
 
     def _get_headers(self) -> dict:
         """Get standard headers for API requests (fresh bearer each call)"""
@@ -142,16 +225,79 @@ class PCExpressAPI:
             "is-helios-account": "true",
         }
 
-    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
-        """Authenticated request with one transparent refresh-and-retry on 401."""
-        headers = self._get_headers()
-        resp = self.session.request(method, url, headers=headers, **kwargs)
-        if resp.status_code == 401:
-            headers["Authorization"] = f"Bearer {self.tokens.get_access_token(force=True)}"
-            resp = self.session.request(method, url, headers=headers, **kwargs)
+    def _request(self, method: str, url: str, headers: Optional[dict] = None,
+                 priority: Optional[int] = None, **kwargs) -> requests.Response:
+        """Authenticated request with one transparent refresh-and-retry on 401.
+
+        Goes through `self.limiter` when there is one: it waits for a slot, and a 429 or 5xx
+        (or a failed connection) is reported to it as an overload. Inside a tool call the
+        request is refused once the call is cancelled or past its deadline, and its timeout
+        is capped at the time left (see pcx_deadline).
+
+        The limiter also schedules by `priority` (a pcx_limiter class). By default writes are
+        WRITE, and reads are READ inside a tool call and BACKGROUND outside one.
+        """
+        import requests
+
+        headers = {**self._get_headers(), **(headers or {})}
+        if priority is None:
+            if method != "GET":
+                priority = pcx_limiter.WRITE
+            elif pcx_deadline.current.get() is None:
+                priority = pcx_limiter.BACKGROUND
+            else:
+                priority = pcx_limiter.READ
+        if self.limiter is not None:
+            slot = self.limiter.slot(priority)
+        else:
+            slot = contextlib.nullcontext(lambda: None)
+        with slot as overloaded:
+            pcx_deadline.check()
+            kwargs["timeout"] = pcx_deadline.timeout(kwargs.get("timeout"))
+            try:
+                resp = self.session.request(method, url, headers=headers, **kwargs)
+                if resp.status_code == 401:
+                    headers["Authorization"] = f"Bearer {self.tokens.get_access_token(force=True)}"
+                    resp = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.Timeout, requests.ConnectionError):
+                overloaded()
+                raise
+            if resp.status_code == 429 or resp.status_code >= 500:
+                overloaded()
         resp.raise_for_status()
         return resp
 
+    def _read(self, kind: str, method: str, url: str, **kwargs) -> requests.Response:
+        """`_request` for an idempotent read, hedged by `self.hedger` when there is one.
+
+        Never use this for anything with side effects: the request may be sent twice.
+        """
+        # A search is a POST, so say what it is rather than let _request call it a write.
+        kwargs.setdefault("priority", pcx_limiter.READ if pcx_deadline.current.get() is not None
+                          else pcx_limiter.BACKGROUND)
+        if self.hedger is None:
+            return self._request(method, url, **kwargs)
+        send = pcx_deadline.bind(lambda: self._request(method, url, **kwargs))
+        return self.hedger.run(kind, send, discard=lambda r: r.close())
+
+    def _get_json(self, url: str, hedge: Optional[str] = None, **kwargs) -> Any:
+        """GET `url` as a conditional request against the response cache.
+
+        Sends the stored ETag/Last-Modified validators; a 304 returns the cached body
+        without re-downloading or re-parsing it. With `hedge` (a read kind, e.g. "product")
+        the GET goes through `_read`. Other keyword arguments go to `_request`. A 304 for an
+        entry evicted in the meantime is answered by sending the GET again, unconditionally.
+        """
+        def get(headers: dict) -> requests.Response:
+            if hedge:
+                return self._read(hedge, "GET", url, headers=headers, **kwargs)
+            return self._request("GET", url, headers=headers, **kwargs)
+
+        try:
+            return self.cache.resolve(url, get(self.cache.conditional_headers(url)))
+        except NotCached:
+            return self.cache.resolve(url, get({}))
+
     def get_historical_orders(self) -> dict:
         """
         Get list of past orders
@@ -161,23 +307,223 @@ class PCExpressAPI:
         """
         url = f"{self.BASE_URL}/ecommerce/v2/{self.banner}/customers/historical-orders"
 
-        return self._request("GET", url).json()
+        return self._get_json(url)
+
+    def stream_historical_orders(self, limit: int, match=None) -> dict:
+        """
+        Get the first `limit` past orders, parsing the response as it arrives
+
+        Stops reading once enough orders have matched, so a long history is never held in
+        memory whole. Bypasses the response cache (a partial body can't be revalidated), and
+        the order counts are only present if the server sent them before the cut-off.
+
+        Args:
+            limit: Stop after this many matching orders
+            match: Optional predicate over order headers (see pcx_orders.header_filter)
 
-    def get_order_details(self, order_id: str) -> dict:
+        Returns:
+            dict: {"orderHistory": [...], plus onlineOrdersCount/offlineOrdersCount if seen}
+        """
+        url = f"{self.BASE_URL}/ecommerce/v2/{self.banner}/customers/historical-orders"
+
+        meta: dict = {}
+        orders = []
+        resp = self._request("GET", url, stream=True)
+        try:
+            chunks = pcx_deadline.checked(resp.iter_content(64 * 1024))
+            for order in pcx_orders.iter_json_array(chunks, "orderHistory", meta):
+                if match is None or match(order):
+                    orders.append(order)
+                    if len(orders) >= limit:
+                        break
+        finally:
+            resp.close()
+        return {"orderHistory": orders, **meta}
+
+    def get_order_details(self, order_id: str, max_age: float = 0) -> dict:
         """
         Get details for a specific order including all items
 
         Args:
             order_id: The order ID
+            max_age: Serve a cached copy up to this many seconds old without asking the server
 
         Returns:
             dict: Order details including items, prices, etc.
         """
         url = f"{self.BASE_URL}/ecommerce/v2/{self.banner}/customers/historical-orders/{order_id}"
 
-        return self._request("GET", url).json()
+        if max_age:
+            cached = self.cache.fresh(url, max_age)
+            if cached is not None:
+                return cached
+        return self._get_json(url)
+
+    def order_items(self, order_ids: list[str], max_age: float = ORDER_DETAIL_MAX_AGE) -> dict:
+        """
+        Compact line items for several past orders, fetched concurrently
+
+        Args:
+            order_ids: Order IDs to expand
+            max_age: Reuse order details fetched within this many seconds
+
+        Returns:
+            dict: order ID -> list of {code, name, quantity, price} (or {error})
+        """
+        missing = [oid for oid in order_ids if oid not in self._order_lines]
+        details = self._map_concurrently(lambda oid: self.get_order_details(oid, max_age), missing)
+        result = {}
+        for oid in order_ids:
+            if oid in self._order_lines:
+                result[oid] = self._order_lines[oid]
+            elif isinstance(details[oid], Exception):
+                result[oid] = {"error": str(details[oid])}
+            else:
+                result[oid] = self._order_lines[oid] = pcx_orders.order_lines(details[oid])
+                self.names.add((line["code"], line["name"]) for line in result[oid])
+        return result
+
+    def order_index(self) -> pcx_orders.OrderIndex:
+        """The order history sorted by date, rebuilt only when the history body changes."""
+        history = self.get_historical_orders()
+        if self._order_index is None or self._order_index.source is not history:
+            self._order_index = pcx_orders.OrderIndex(history)
+        return self._order_index
+
+    def sync_purchases(self, max_orders: int = 100) -> int:
+        """
+        Add the most recent `max_orders` past orders to the purchase ledger
+
+        Only orders the ledger hasn't seen are fetched (concurrently, cache first), so after the
+        first sync this costs one conditional history GET plus the details of new orders.
+
+        Args:
+            max_orders: How far back to go, in orders
 
-    def search_products(self, query: str, size: int = 48) -> dict:
+        Returns:
+            int: Number of orders newly added
+        """
+        headers = self.order_index().filter()[:max_orders]
+        new = {oid: o for o in headers
+               if (oid := pcx_orders.order_id(o)) and oid not in self.purchases}
+        details = self._map_concurrently(
+            lambda oid: self.get_order_details(oid, ORDER_DETAIL_MAX_AGE), list(new))
+        added = 0
+        for oid, detail in details.items():
+            if isinstance(detail, Exception):
+                logger.warning("Skipping order %s in purchase sync: %s", oid, detail)
+                continue
+            date = pcx_orders.order_date(new[oid]) or pcx_orders.order_date(detail)
+            day = pcx_analytics.parse_day(date)
+            added += self.purchases.add_order(oid, day, pcx_orders.order_entries(detail))
+        return added
+
+    def suggest_restock(self, horizon_days: int = 3, top: int = 20,
+                        check_stock: bool = True) -> dict:
+        """
+        Regularly bought items that are due (or nearly due) for a repurchase
+
+        Args:
+            horizon_days: Also include items due within this many days
+            top: Maximum number of suggestions
+            check_stock: Resolve current stock and price for every suggestion in one batch
+
+        Returns:
+            dict: {"suggestions": [...]} most overdue first, each with its cadence and
+            (with check_stock) inStock/price/deal
+        """
+        self.sync_purchases(ANALYTICS_ORDERS)
+        suggestions = self.restock.due(horizon_days=horizon_days, top=top)
+        if check_stock and suggestions:
+            stock = self.check_availability([s["code"] for s in suggestions])
+            for s in suggestions:
+                info = stock.get(s["code"], {})
+                if "error" in info:
+                    # Usually a discontinued code; the agent should search for a replacement.
+                    s["available"] = False
+                else:
+                    s.update(inStock=info.get("inStock"), price=info.get("price"),
+                             deal=info.get("deal"))
+        return {"asOf": datetime.now().date().isoformat(), "suggestions": suggestions}
+
+    def search_orders(self, limit: int = 10, from_date: Optional[str] = None,
+                      to_date: Optional[str] = None, store: Optional[str] = None,
+                      min_total: Optional[float] = None,
+                      contains_item: Optional[str] = None,
+                      index: Optional[pcx_orders.OrderIndex] = None,
+                      max_scan: Optional[int] = None, scan: Optional[dict] = None) -> list[dict]:
+        """
+        Past-order headers matching every given filter, newest first
+
+        Args:
+            limit: Maximum number of orders to return
+            from_date: Earliest order date, inclusive (YYYY-MM-DD)
+            to_date: Latest order date, inclusive (YYYY-MM-DD)
+            store: Case-insensitive store name or ID fragment
+            min_total: Smallest order total to include
+            contains_item: Only orders with a line whose name contains this (or whose code is it)
+            index: An `order_index()` the caller already holds (fetched if omitted)
+            max_scan: With contains_item, most orders whose line items are fetched (None = all)
+            scan: Filled with {"scanned", "candidates", "truncated"} for a contains_item search
+
+        Returns:
+            list: Matching order headers; with contains_item each carries its "matchedItems"
+        """
+        index = index or self.order_index()
+        candidates = index.filter(from_date, to_date, store, min_total)
+        if not contains_item:
+            return candidates[:limit]
+
+        # Item matching needs line items: walk newest-first in fan-out sized chunks and stop
+        # as soon as `limit` orders have matched.
+        # A term that matches nothing would otherwise fetch the whole history, so stop after
+        # `max_scan` orders and say so.
+        term = pcx_orders.normalize(contains_item)
+        scannable = candidates if max_scan is None else candidates[:max_scan]
+        matches, scanned = [], 0
+        for start in range(0, len(scannable), self.fan_out):
+            chunk = scannable[start:start + self.fan_out]
+            items = self.order_items([oid for oid in map(pcx_orders.order_id, chunk) if oid])
+            for order in chunk:
+                scanned += 1
+                lines = items.get(pcx_orders.order_id(order))
+                if not isinstance(lines, list):
+                    continue
+                hits = [line for line in lines if pcx_orders.line_matches(line, term)]
+                if hits:
+                    matches.append({**order, "matchedItems": hits})
+                    if len(matches) >= limit:
+                        break
+            if len(matches) >= limit:
+                break
+        if scan is not None:
+            scan.update(scanned=scanned, candidates=len(candidates),
+                        truncated=len(matches) < limit and scanned < len(candidates))
+        return matches
+
+    def warm_order_details(self, order_ids: list[str]) -> None:
+        """Fetch order details into the cache in the background, skipping ones already cached."""
+        base = f"{self.BASE_URL}/ecommerce/v2/{self.banner}/customers/historical-orders/"
+        missing = [oid for oid in order_ids if self.cache.get(base + oid) is None]
+        for oid in missing:
+            self._submit_background(self.get_order_details, oid)
+
+    def _submit_background(self, fn, *args) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self._background is None:
+            # Two workers: enough to warm caches without crowding out interactive calls.
+            self._background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pcx-warm")
+
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.debug("Background %s%s failed: %s", fn.__name__, args, e)
+
+        self._background.submit(run)
+
+    def search_products(self, query: str, size: int = 48, exact: bool = False) -> dict:
         """
         Search for products and return the fields needed to add them to cart.
 
@@ -186,25 +532,65 @@ class PCExpressAPI:
         storeId, and banner at the top level of the body; the product array comes
         back under "results".
 
+        The query is always searched as given. Unless `exact` is set, it is also checked
+        against the names in `self.names`: the index only knows names the server has seen, so a
+        valid word it lacks ("pear") can look like a misspelling of one it has ("peas"). A
+        correction is therefore only offered as `didYouMean`, and only searched when the query
+        itself finds fewer than `SPELLING_FALLBACK_BELOW` products; the corrected search is used
+        if it finds more, reported as `correctedFrom`. Known products whose name covers the
+        searched term are added as `localMatches` once the search is back.
+
         Args:
             query: Search term (e.g., "milk", "ground beef")
             size: Maximum number of results to return (default: 48)
+            exact: Search for `query` as given, without local spelling suggestions
 
         Returns:
             dict: Search results with products including their codes
         """
-        url = f"{self.BASE_URL}/products/search"
-
+        term = query
+        total, products = self._search_term(query, size)
+        suggestion = None
+        if not exact:
+            corrected = self.names.correct(query)
+            if corrected != " ".join(pcx_names.words(query)):
+                suggestion = corrected
+        if suggestion is not None and total < SPELLING_FALLBACK_BELOW:
+            retry_total, retry_products = self._search_term(suggestion, size)
+            if retry_total > total:
+                term, total, products, suggestion = suggestion, retry_total, retry_products, None
+
+        self.preferences.note_search(term, products)
+        self.names.add((p["code"], p["name"]) for p in products)
+
+        result = {
+            "query": term,
+            "totalResults": total,
+            "products": products,
+        }
+        if term != query:
+            result["correctedFrom"] = query
+        if suggestion is not None:
+            result["didYouMean"] = suggestion
+        if not exact:
+            local = self.names.match(term)
+            if local:
+                result["localMatches"] = local
+        return result
+
+    def _search_term(self, term: str, size: int) -> tuple:
+        """(total results, compact products) for one upstream search of `term`."""
         payload = {
             "lang": "en",
-            "term": query,
+            "term": term,
             "storeId": self.store_id,
             "banner": self.banner,
             "cartId": self.cart_id,
             "pagination": {"from": 0, "size": size},
         }
 
-        data = self._request("POST", url, json=payload).json()
+        resp = self._read("search", "POST", f"{self.BASE_URL}/products/search", json=payload)
+        data = pcx_json.loads(resp.content)
 
         products = []
         for item in data.get("results", [])[:size]:
@@ -219,26 +605,111 @@ class PCExpressAPI:
                 "link": item.get("link"),
                 "offerType": item.get("offerType"),
             })
+        return data.get("pagination", {}).get("totalResults", len(products)), products
 
-        return {
-            "query": query,
-            "totalResults": data.get("pagination", {}).get("totalResults", len(products)),
-            "products": products,
-        }
-
-    def get_product_details(self, product_code: str) -> dict:
+    def get_product_details(self, product_code: str, max_age: float = 0) -> dict:
         """
         Get detailed information about a specific product by its code
 
         Args:
             product_code: Product code (e.g., "20039684_EA")
+            max_age: Serve a cached copy up to this many seconds old without asking the server
 
         Returns:
             dict: Product details including name, price, availability, etc.
         """
         url = f"{self.BASE_URL}/products/{product_code}"
 
-        return self._request("GET", url).json()
+        if max_age:
+            cached = self.cache.fresh(url, max_age)
+            if cached is not None:
+                return cached
+        product = self._get_json(url, hedge="product")
+        self.names.add([(product_code, product.get("name"))])
+        return product
+
+    def _map_concurrently(self, fn, items: list) -> dict:
+        """Call `fn(item)` for each item on up to `fan_out` threads.
+
+        Returns item -> result, or item -> the exception it raised, so one bad item doesn't
+        sink the batch. The workers run under the calling tool's deadline; if the call is
+        cancelled, the remaining items are skipped and CallCancelled is raised.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def safe(item):
+            try:
+                return fn(item)
+            except Exception as e:
+                return e
+
+        if not items:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.fan_out, len(items))) as pool:
+            results = dict(zip(items, pool.map(pcx_deadline.bind(safe), items)))
+        pcx_deadline.check()
+        return results
+
+    def check_availability(self, product_codes: list[str], max_age: float = 300) -> dict:
+        """
+        Stock, price, and deal for many products in one go
+
+        Args:
+            product_codes: Product codes to check
+            max_age: Reuse product details fetched within this many seconds
+
+        Returns:
+            dict: product code -> {name, inStock, stockStatus, price, deal} (or {error})
+        """
+        codes = pcx_catalog.unique(product_codes)
+        details = self._map_concurrently(
+            lambda code: self.get_product_details(code, max_age), codes)
+        return {
+            code: {"error": str(d)} if isinstance(d, Exception) else pcx_catalog.availability(d)
+            for code, d in details.items()
+        }
+
+    def resolve_items(self, terms: list[str], candidates: int = 5) -> dict:
+        """
+        Map generic item names to the products this household usually buys
+
+        Terms with a learned preference resolve locally; only the rest are searched upstream,
+        concurrently, returning the top `candidates` results each.
+
+        Args:
+            terms: Generic names, e.g. ["milk", "bread", "eggs"]
+            candidates: Search results to return for each term without a preference
+
+        Returns:
+            dict: {"items": [...]} in input order, each either {term, code, name, source, share}
+            or {term, candidates} (or {term, error})
+        """
+        self.sync_purchases(ANALYTICS_ORDERS)
+        resolved = {}
+        for term in pcx_catalog.unique(terms):
+            # Only the term as given resolves locally; a misspelling is left to the search. That
+            # sends the term as given, and only searches the corrected spelling (returned as
+            # didYouMean) when the term finds fewer than SPELLING_FALLBACK_BELOW products.
+            resolved[term] = self.preferences.resolve(term)
+        unknown = [term for term, pick in resolved.items() if pick is None]
+        searched = self._map_concurrently(
+            lambda term: self.search_products(term, size=candidates), unknown)
+        items = []
+        for term in resolved:
+            if resolved[term] is not None:
+                items.append({"term": term, **resolved[term]})
+            elif isinstance(searched[term], Exception):
+                items.append({"term": term, "error": str(searched[term])})
+            else:
+                item = {"term": term, "candidates": [
+                    {k: p.get(k) for k in ("code", "name", "brand", "packageSize", "stockStatus")}
+                    for p in searched[term]["products"]
+                ]}
+                for key in ("correctedFrom", "didYouMean"):
+                    if key in searched[term]:
+                        item[key] = searched[term][key]
+                items.append(item)
+        return {"items": items, "searched": len(unknown)}
 
     def get_cart(self) -> dict:
         """
@@ -247,9 +718,31 @@ class PCExpressAPI:
         Returns:
             dict: Cart data including items
         """
-        return self._request_cart("GET", "/carts/{cart_id}").json()
+        self._cart_snapshot = self._with_cart("/carts/{cart_id}", self._get_json)
+        return self._cart_snapshot
 
-    def add_to_cart(self, product_code: str, quantity: int = 1, fulfillment_method: str = "pickup") -> dict:
+    def _reconcile_cart(self) -> dict:
+        """Read the cart to settle the outcome of a cart write that failed ambiguously.
+
+        Runs outside the tool call's deadline, bounded by `cart_write_timeout` instead: a POST
+        that timed out at the deadline is exactly the one whose outcome needs finding out. It is
+        part of the write, so it is scheduled as one, including on the batcher's timer thread,
+        where there is no call for `_request` to go by.
+        """
+        token = pcx_deadline.current.set(None)
+        try:
+            self._cart_snapshot = self._with_cart("/carts/{cart_id}", lambda url: self._get_json(
+                url, priority=pcx_limiter.WRITE, timeout=self.cart_write_timeout))
+        finally:
+            pcx_deadline.current.reset(token)
+        return self._cart_snapshot
+
+    def cart_snapshot(self) -> dict:
+        """The last cart seen by this client, fetched once if there isn't one yet."""
+        return self._cart_snapshot if self._cart_snapshot is not None else self.get_cart()
+
+    def add_to_cart(self, product_code: str, quantity: int = 1,
+                    fulfillment_method: str = "pickup") -> dict:
         """
         Add item to cart or update quantity
 
@@ -261,19 +754,80 @@ class PCExpressAPI:
         Returns:
             dict: Updated cart data
         """
-        payload = {
-            "entries": {
-                product_code: {
-                    "quantity": quantity,
-                    "fulfillmentMethod": fulfillment_method,
-                    "sellerId": self.store_id
-                }
-            }
+        entry = {
+            "quantity": quantity,
+            "fulfillmentMethod": fulfillment_method,
+            "sellerId": self.store_id
         }
+        if self._cart_batcher is not None:
+            cart = self._cart_batcher.submit(product_code, entry)
+        else:
+            cart = self._post_cart_entries({product_code: entry})
+        if quantity > 0:
+            self.preferences.note_add(product_code)
+        return cart
+
+    def _post_cart_entries(self, entries: dict) -> dict:
+        """POST one or more cart entries (product code -> entry) and return the updated cart.
+
+        Retry-safe: every write gets an operation id in `self.cart_ops`. A failure that leaves
+        the outcome unknown (timeout, dropped connection, 5xx) is followed by a reconciliation
+        read of the cart. If the cart already shows the write it counts as applied; otherwise
+        the entries no newer write has superseded are re-sent. A write identical to one still
+        in flight joins it instead of going out twice.
+        """
+        op_id, joined = self.cart_ops.begin(entries)
+        if joined is not None:
+            return joined.result()
+        try:
+            cart = self._write_cart_op(op_id, entries)
+        except BaseException as e:
+            self.cart_ops.finish(entries, error=e)
+            raise
+        self.cart_ops.finish(entries, cart)
+        return cart
+
+    def _write_cart_op(self, op_id: str, entries: dict) -> dict:
+        import requests
+
+        pending = entries
+        for attempt in range(self.cart_write_retries + 1):
+            if attempt:
+                pending = self.cart_ops.owned(op_id, pending)
+                try:
+                    cart = self._reconcile_cart()
+                except requests.RequestException:
+                    cart = None
+                if not pending:
+                    # Every entry was superseded by a newer write; there is nothing left to send.
+                    return cart if cart is not None else self.cart_snapshot()
+                if cart is not None and pcx_cart.entries_applied(cart, pending):
+                    self.cart_ops.note("reconciled")
+                    logger.info("Cart write %s had landed despite the error", op_id)
+                    return cart
+                self.cart_ops.note("retries")
+            try:
+                return self._send_cart_entries(pending)
+            except requests.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                ambiguous = isinstance(e, (requests.Timeout, requests.ConnectionError)) or (
+                    status is not None and status >= 500)
+                if not ambiguous or attempt == self.cart_write_retries:
+                    raise
+                logger.warning("Cart write %s failed (%s); reconciling before retry", op_id, e)
+
+    def _send_cart_entries(self, entries: dict) -> dict:
+        payload = {"entries": entries}
 
-        return self._request_cart(
-            "POST", "/carts/{cart_id}?inventory=true", json=payload
-        ).json()
+        try:
+            self._cart_snapshot = pcx_json.loads(self._request_cart(
+                "POST", "/carts/{cart_id}?inventory=true", json=payload,
+                timeout=self.cart_write_timeout,
+            ).content)
+            return self._cart_snapshot
+        finally:
+            # Even a failed POST may have landed, so any cached GET of the cart is suspect.
+            self.cache.invalidate(f"{self.BASE_URL}/carts/")
 
     def remove_from_cart(self, product_code: str) -> dict:
         """
@@ -291,37 +845,186 @@ class PCExpressAPI:
 # Initialize MCP server
 app = Server("pcexpress-mcp")
 
+# How many further orders search_past_orders(include_items) warms in the background.
+ORDER_PREFETCH = int(os.getenv("PCEXPRESS_ORDER_PREFETCH", "10"))
+
+# Parse order history incrementally and stop at `limit` instead of indexing the whole body
+# (for accounts with years of orders). Item filtering still needs the full index.
+HISTORY_STREAM = os.getenv("PCEXPRESS_HISTORY_STREAM") == "1"
+
+# A query finding fewer products than this is retried with its spelling correction, if any
+# (by default only a query that finds nothing; one real result beats a guessed spelling).
+SPELLING_FALLBACK_BELOW = int(os.getenv("PCEXPRESS_SPELLING_FALLBACK_BELOW", "1"))
+
+# How many of the most recent orders purchase_analytics looks at.
+ANALYTICS_ORDERS = int(os.getenv("PCEXPRESS_ANALYTICS_ORDERS", "100"))
+
+# Seconds each tool call may take, by default and per tool (0 = no deadline).
+TOOL_DEADLINE, TOOL_DEADLINES = pcx_deadline.deadlines_from_env()
+
+# Tools that write the cart: past the deadline their outcome is unknown, not abandoned.
+CART_WRITE_TOOLS = ("add_to_cart", "remove_from_cart")
+
+# How tool results are sent (`python bench.py results` compares them):
+#   compact     JSON text without indentation (default; half the bytes of indented for carts)
+#   structured  outputSchema-checked structuredContent plus the compact text, for clients that
+#               read structured results; the MCP layer's serialization makes it the costliest
+#   indented    two-space indented JSON text, as before, for reading raw output by eye
+TOOL_RESULTS = os.getenv("PCEXPRESS_TOOL_RESULTS", "compact")
+
+# What `_call_tool` hands the MCP layer: text blocks, or a whole result.
+ToolResult = list[TextContent] | CallToolResult
+
 # Global API client (will be initialized with credentials)
 api_client: Optional[PCExpressAPI] = None
 
+_env_loaded = False
+
+
+def load_env() -> None:
+    """Load .env if present (no-op when the launcher passes env directly)."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
 
 def get_api_client() -> PCExpressAPI:
     """Get or initialize API client"""
     global api_client
 
     if api_client is None:
+        import pcx_http
+        from pcid_token import TokenManager
+
+        load_env()
         # cart_id is optional — auto-discovered from the customer profile when omitted.
         cart_id = os.getenv("PCEXPRESS_CART_ID")
         store_id = os.getenv("PCEXPRESS_STORE_ID", "1234")
         banner = os.getenv("PCEXPRESS_BANNER", "zehrs")
-
-        # TokenManager mints/refreshes access tokens from the stored refresh token.
-        token_manager = TokenManager()
-        api_client = PCExpressAPI(token_manager, cart_id, store_id, banner)
+        coalesce_ms = int(os.getenv("PCEXPRESS_CART_COALESCE_MS", "0"))
+        fan_out = int(os.getenv("PCEXPRESS_FAN_OUT", "8"))
+        write_timeout = float(os.getenv("PCEXPRESS_CART_WRITE_TIMEOUT", "10"))
+        write_retries = int(os.getenv("PCEXPRESS_CART_WRITE_RETRIES", "2"))
+        hedge_budget = float(os.getenv("PCEXPRESS_HEDGE_BUDGET", "0"))
+        upstream_limit = int(os.getenv("PCEXPRESS_UPSTREAM_LIMIT", "8"))
+        limiter = pcx_limiter.AdaptiveLimiter(
+            upstream_limit, max_limit=int(os.getenv("PCEXPRESS_UPSTREAM_LIMIT_MAX", "32"))
+        ) if upstream_limit > 0 else None
+        state_dir = os.getenv("PCEXPRESS_STATE_DIR", os.path.expanduser("~/.pcexpress-mcp"))
+        preferences = pcx_preferences.PreferenceMap(
+            os.path.join(state_dir, f"preferences-{banner.lower()}.json"))
+        store_budget = int(float(os.getenv("PCEXPRESS_STORE_BUDGET_MB", "16")) * 2**20)
+        store = None
+        if store_budget > 0 and os.getenv("PCEXPRESS_WORKER_DIR"):
+            # Sibling worker processes share one cache (see pcx_workers).
+            store = pcx_store.SharedStore(
+                os.path.join(state_dir, "store", "shared.db"), store_budget)
+        elif store_budget > 0:
+            store = pcx_store.DiskStore(os.path.join(state_dir, "store"), store_budget)
+
+        # One pooled transport for both hosts; TokenManager mints/refreshes access tokens
+        # from the stored refresh token over it.
+        session = pcx_http.build_session()
+        token_manager = TokenManager(session=session)
+        hedger = pcx_hedge.Hedger(hedge_budget, fan_out * 2) if hedge_budget > 0 else None
+        api_client = PCExpressAPI(token_manager, cart_id, store_id, banner, session=session,
+                                  cache=ResponseCache(store=store, persist=PERSISTED_RESPONSES),
+                                  cart_coalesce_window=coalesce_ms / 1000,
+                                  cart_write_timeout=write_timeout,
+                                  cart_write_retries=write_retries, fan_out=fan_out,
+                                  preferences=preferences, limiter=limiter, hedger=hedger)
 
     return api_client
 
 
+# Raw pcx-bff bodies (a cart, an order, a product) are passed through as they come.
+_UPSTREAM_OBJECT = {"type": "object"}
+
+# Declared only as deep as `_call_tool` guarantees, so checking a result stays cheap however
+# many orders or products it carries.
+OUTPUT_SCHEMAS = {
+    "search_past_orders": {
+        "type": "object",
+        "properties": {
+            "orders": {"type": "array", "items": {"type": "object"}},
+            "totalOnlineOrders": {"description": "As reported upstream"},
+            "totalOfflineOrders": {"description": "As reported upstream"},
+            "itemScan": {
+                "type": "object",
+                "properties": {"scanned": {"type": "integer"}, "candidates": {"type": "integer"},
+                               "truncated": {"type": "boolean"}},
+            },
+        },
+        "required": ["orders"],
+    },
+    "purchase_analytics": {
+        "type": "object",
+        "properties": {
+            "groupBy": {"type": "string"},
+            "ordersAnalyzed": {"type": "integer"},
+            "totalSpend": {"type": "number"},
+            "rows": {"type": "array", "items": {"type": "object"}},
+        },
+        "required": ["groupBy", "ordersAnalyzed", "totalSpend", "rows"],
+    },
+    "suggest_restock": {
+        "type": "object",
+        "properties": {
+            "asOf": {"type": "string"},
+            "suggestions": {"type": "array", "items": {"type": "object"}},
+        },
+        "required": ["asOf", "suggestions"],
+    },
+    "get_order_items": _UPSTREAM_OBJECT,
+    "search_products": {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string"},
+            "totalResults": {"description": "As reported upstream"},
+            "products": {"type": "array", "items": {"type": "object"}},
+            "correctedFrom": {"type": "string"},
+            "didYouMean": {"type": "string"},
+            "localMatches": {"type": "array", "items": {"type": "object"}},
+        },
+        "required": ["query", "products"],
+    },
+    "get_product_details": _UPSTREAM_OBJECT,
+    "resolve_items": {
+        "type": "object",
+        "properties": {
+            "items": {"type": "array", "items": {"type": "object"}},
+            "searched": {"type": "integer"},
+        },
+        "required": ["items", "searched"],
+    },
+    "check_availability": {
+        "type": "object",
+        "description": "Product code -> {inStock, price, deal} or {error}",
+        "additionalProperties": {"type": "object"},
+    },
+    # A delta ({cartId, added, removed, changed, ...}) by default; the whole cart with full_cart.
+    "add_to_cart": _UPSTREAM_OBJECT,
+    "remove_from_cart": _UPSTREAM_OBJECT,
+    "view_cart": _UPSTREAM_OBJECT,
+}
+
+
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     """List available MCP tools"""
-    return [
+    tools = [
         Tool(
             name="search_past_orders",
             description=(
                 "Search through past grocery orders to find previously purchased items. "
                 "Returns a list of past orders with order IDs, dates, totals, and store info. "
-                "Useful for finding items the user has purchased before."
+                "Useful for finding items the user has purchased before. "
+                "Set include_items to get the line items of the most recent orders inline, "
+                "instead of calling get_order_items for each. "
+                "Filter by date range, store, minimum total, or an item name to get only "
+                "the matching orders."
             ),
             inputSchema={
                 "type": "object",
@@ -330,6 +1033,133 @@ async def list_tools() -> list[Tool]:
                         "type": "number",
                         "description": "Maximum number of orders to return (default: 10)",
                         "default": 10
+                    },
+                    "include_items": {
+                        "type": "boolean",
+                        "description": (
+                            "Include compact line items for the first items_for orders "
+                            "(default: false)"
+                        ),
+                        "default": False
+                    },
+                    "items_for": {
+                        "type": "number",
+                        "description": (
+                            "How many of the returned orders to expand with items (default: 5)"
+                        ),
+                        "default": 5
+                    },
+                    "from_date": {
+                        "type": "string",
+                        "description": "Only orders on or after this date (YYYY-MM-DD)",
+                    },
+                    "to_date": {
+                        "type": "string",
+                        "description": "Only orders on or before this date (YYYY-MM-DD)",
+                    },
+                    "store": {
+                        "type": "string",
+                        "description": "Only orders from a store whose name or ID contains this",
+                    },
+                    "min_total": {
+                        "type": "number",
+                        "description": "Only orders with a total of at least this amount",
+                    },
+                    "contains_item": {
+                        "type": "string",
+                        "description": (
+                            "Only orders containing an item whose name contains this "
+                            "(or with this product code)"
+                        ),
+                    },
+                    "max_scan": {
+                        "type": "number",
+                        "description": (
+                            "With contains_item, how many of the most recent matching orders to "
+                            f"look inside (default: {ANALYTICS_ORDERS}); itemScan.truncated says "
+                            "if older ones were skipped"
+                        ),
+                        "default": ANALYTICS_ORDERS
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="purchase_analytics",
+            description=(
+                "Answer spending and purchase-frequency questions from order history, e.g. "
+                "'how much do I spend on dairy per month' or 'what do I buy every week'. "
+                "Groups purchases by item, brand, category, month, or week and returns the top "
+                "groups with spend, quantity, order count, last purchase, and average days "
+                "between purchases."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "group_by": {
+                        "type": "string",
+                        "enum": list(pcx_analytics.GROUPS),
+                        "description": "How to group purchases (default: 'item')",
+                        "default": "item"
+                    },
+                    "match": {
+                        "type": "string",
+                        "description": (
+                            "Only items whose name, brand, or category contains this "
+                            "(e.g. 'milk')"
+                        ),
+                    },
+                    "from_date": {
+                        "type": "string",
+                        "description": "Only purchases on or after this date (YYYY-MM-DD)",
+                    },
+                    "to_date": {
+                        "type": "string",
+                        "description": "Only purchases on or before this date (YYYY-MM-DD)",
+                    },
+                    "sort": {
+                        "type": "string",
+                        "enum": ["spend", "count"],
+                        "description": (
+                            "Rank groups by total spend or by number of orders (default: 'spend')"
+                        ),
+                        "default": "spend"
+                    },
+                    "top": {
+                        "type": "number",
+                        "description": "How many groups to return (default: 10)",
+                        "default": 10
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="suggest_restock",
+            description=(
+                "Suggest items that are due to be bought again, based on how often each item "
+                "appears in past orders. Returns each due item with its usual interval, days "
+                "until due, usual quantity, and current stock and price, ready for add_to_cart. "
+                "Use this to build a regular weekly shop in one call."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "horizon_days": {
+                        "type": "number",
+                        "description": "Also include items due within this many days (default: 3)",
+                        "default": 3
+                    },
+                    "limit": {
+                        "type": "number",
+                        "description": "Maximum number of suggestions (default: 20)",
+                        "default": 20
+                    },
+                    "check_stock": {
+                        "type": "boolean",
+                        "description": (
+                            "Look up current stock and price for each suggestion (default: true)"
+                        ),
+                        "default": True
                     }
                 }
             }
@@ -356,7 +1186,8 @@ async def list_tools() -> list[Tool]:
             name="search_products",
             description=(
                 "Search for products by name or keyword. "
-                "Returns full product details including product codes, names, brands, prices, and descriptions. "
+                "Returns full product details including product codes, names, brands, prices, "
+                "and descriptions. "
                 "Use this to find products the user wants to add to cart."
             ),
             inputSchema={
@@ -370,6 +1201,16 @@ async def list_tools() -> list[Tool]:
                         "type": "number",
                         "description": "Maximum number of results (default: 48)",
                         "default": 48
+                    },
+                    "exact": {
+                        "type": "boolean",
+                        "description": (
+                            "Skip spelling suggestions. By default a query with a likely "
+                            "misspelling gets a didYouMean suggestion from known product names, "
+                            "and when the query finds nothing the suggestion is searched instead "
+                            "(reported as correctedFrom)."
+                        ),
+                        "default": False
                     }
                 },
                 "required": ["query"]
@@ -393,11 +1234,66 @@ async def list_tools() -> list[Tool]:
                 "required": ["product_code"]
             }
         ),
+        Tool(
+            name="resolve_items",
+            description=(
+                "Resolve generic item names (e.g. 'milk', 'bread') to the product codes this "
+                "household usually buys, learned from past orders and earlier add_to_cart "
+                "choices. Names without a learned preference fall back to a product search "
+                "and return a few candidates. Use this before search_products for a shopping list."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Generic item names (e.g., ['milk', 'eggs', 'bananas'])",
+                    },
+                    "candidates": {
+                        "type": "number",
+                        "description": (
+                            "Search results to return for names with no preference (default: 5)"
+                        ),
+                        "default": 5
+                    }
+                },
+                "required": ["items"]
+            }
+        ),
+        Tool(
+            name="check_availability",
+            description=(
+                "Check stock, price, and deals for a list of product codes in one call. "
+                "Use this to validate a shopping list before adding items to the cart. "
+                "Returns a map of product code to inStock, price, and deal."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "product_codes": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Product codes (e.g., ['20039684_EA', '21218152_EA'])",
+                    },
+                    "max_age_seconds": {
+                        "type": "number",
+                        "description": (
+                            "Reuse product data fetched within this many seconds (default: 300)"
+                        ),
+                        "default": 300
+                    }
+                },
+                "required": ["product_codes"]
+            }
+        ),
         Tool(
             name="add_to_cart",
             description=(
                 "Add a product to the shopping cart or update its quantity. "
-                "Requires the product code from search results or past orders."
+                "Requires the product code from search results or past orders. "
+                "Returns only what changed (added/removed/changed lines and the new subtotal) "
+                "unless full_cart is true."
             ),
             inputSchema={
                 "type": "object",
@@ -413,9 +1309,18 @@ async def list_tools() -> list[Tool]:
                     },
                     "fulfillment_method": {
                         "type": "string",
-                        "description": "Fulfillment method: 'pickup' or 'delivery' (default: 'pickup')",
+                        "description": (
+                            "Fulfillment method: 'pickup' or 'delivery' (default: 'pickup')"
+                        ),
                         "enum": ["pickup", "delivery"],
                         "default": "pickup"
+                    },
+                    "full_cart": {
+                        "type": "boolean",
+                        "description": (
+                            "Return the whole updated cart instead of the change (default: false)"
+                        ),
+                        "default": False
                     }
                 },
                 "required": ["product_code"]
@@ -423,13 +1328,23 @@ async def list_tools() -> list[Tool]:
         ),
         Tool(
             name="remove_from_cart",
-            description="Remove a product from the shopping cart completely.",
+            description=(
+                "Remove a product from the shopping cart completely. "
+                "Returns only what changed unless full_cart is true."
+            ),
             inputSchema={
                 "type": "object",
                 "properties": {
                     "product_code": {
                         "type": "string",
                         "description": "Product code to remove",
+                    },
+                    "full_cart": {
+                        "type": "boolean",
+                        "description": (
+                            "Return the whole updated cart instead of the change (default: false)"
+                        ),
+                        "default": False
                     }
                 },
                 "required": ["product_code"]
@@ -437,154 +1352,581 @@ async def list_tools() -> list[Tool]:
         ),
         Tool(
             name="view_cart",
-            description="View current shopping cart contents with all items, quantities, and prices.",
+            description=(
+                "View current shopping cart contents with all items, quantities, and prices."
+            ),
             inputSchema={
                 "type": "object",
                 "properties": {}
             }
         ),
     ]
+    if TOOL_RESULTS == "structured":
+        for tool in tools:
+            tool.outputSchema = OUTPUT_SCHEMAS[tool.name]
+    return tools
+
+
+# Compiled schema checkers by tool name, built on first use. The MCP layer's own checks
+# recompile the schema on every call, which costs about a millisecond each.
+_input_validators: dict = {}
+_output_validators: dict = {}
+
+
+def _validator(schema: dict):
+    import jsonschema
+
+    return jsonschema.validators.validator_for(schema)(schema)
+
+
+async def _check_input(name: str, arguments: Any) -> Optional[str]:
+    """The input validation error for this call, or None."""
+    import jsonschema
+
+    if not _input_validators:
+        tools = await list_tools()
+        _input_validators.update((tool.name, _validator(tool.inputSchema)) for tool in tools)
+    validator = _input_validators.get(name)
+    try:
+        if validator is not None:
+            validator.validate(arguments)
+    except jsonschema.ValidationError as e:
+        return f"Input validation error: {e.message}"
+    return None
 
 
-@app.call_tool()
-async def call_tool(name: str, arguments: Any) -> list[TextContent]:
+@app.call_tool(validate_input=False)
+async def call_tool(name: str, arguments: Any) -> ToolResult:
     """Handle tool calls"""
+    error = await _check_input(name, arguments)
+    if error:
+        return _tool_error(error)
+    # Upstream calls block, so run each tool on a worker thread. That keeps the event loop
+    # free and lets concurrent calls overlap (which cart-write coalescing relies on).
+    # The worker inherits this call's deadline and cancel flag through the context variable.
+    call = pcx_deadline.CallContext(name, TOOL_DEADLINES.get(name, TOOL_DEADLINE))
+    token = pcx_deadline.current.set(call)
+    session_id = _session_id()
+    held = len(pcx_json.dumps(arguments or {}, indent=False)) if sessions is not None else 0
+    if sessions is not None:
+        sessions.call_started(session_id, held)
+    try:
+        async with admission.slot() if admission is not None else contextlib.nullcontext():
+            return await asyncio.wait_for(asyncio.to_thread(_call_tool, name, arguments),
+                                          call.remaining())
+    except asyncio.TimeoutError:
+        call.cancel()
+        logger.warning("%s exceeded its %gs deadline", name, call.seconds)
+        if name in CART_WRITE_TOOLS:
+            # The POST may be on the wire, and the worker still reconciles it: don't say "stopped".
+            return _tool_error(f"Error: {name} took longer than {call.seconds:g}s; the cart "
+                               "change may or may not have gone through. Check with view_cart "
+                               "before retrying.")
+        return _tool_error(f"Error: {name} took longer than {call.seconds:g}s and was stopped")
+    except asyncio.CancelledError:
+        # Cancelled by the client, or the session went away: stop the worker's upstream calls.
+        call.cancel()
+        raise
+    finally:
+        if sessions is not None:
+            sessions.call_finished(session_id, held)
+        pcx_deadline.current.reset(token)
+
+
+def _session_id() -> Optional[str]:
+    """The SSE session the current request was posted to (None over stdio)."""
+    try:
+        request = app.request_context.request
+    except LookupError:
+        return None
+    return request.query_params.get("session_id") if request is not None else None
+
+
+def _call_tool(name: str, arguments: Any) -> ToolResult:
+    """Dispatch one tool call to the API client (runs on a worker thread)."""
     try:
         client = get_api_client()
 
         if name == "search_past_orders":
             limit = arguments.get("limit", 10)
-            result = client.get_historical_orders()
-
-            # Limit results
-            orders = result.get("orderHistory", [])[:limit]
-
-            return [TextContent(
-                type="text",
-                text=json.dumps({
-                    "orders": orders,
-                    "totalOnlineOrders": result.get("onlineOrdersCount"),
-                    "totalOfflineOrders": result.get("offlineOrdersCount")
-                }, indent=2)
-            )]
+            filters = {k: arguments.get(k) for k in ("from_date", "to_date", "store", "min_total")}
+            scan = {}
+
+            if HISTORY_STREAM and not arguments.get("contains_item"):
+                # Stream in server order (newest first) and stop at `limit` matches
+                result = client.stream_historical_orders(limit, pcx_orders.header_filter(**filters))
+                orders = result["orderHistory"]
+                recent_ids = [pcx_orders.order_id(o) for o in orders]
+            else:
+                # Filter and limit against the date-sorted index
+                index = client.order_index()
+                result = index.source
+                orders = client.search_orders(
+                    limit, contains_item=arguments.get("contains_item"), index=index,
+                    max_scan=int(arguments.get("max_scan", ANALYTICS_ORDERS)), scan=scan, **filters)
+                recent = index.filter()[:limit + ORDER_PREFETCH]
+                recent_ids = [pcx_orders.order_id(o) for o in recent]
+
+            if arguments.get("include_items"):
+                expand = [pcx_orders.order_id(o) for o in orders[:arguments.get("items_for", 5)]]
+                expand = [oid for oid in expand if oid]
+                items = client.order_items(expand)
+                orders = [
+                    {**o, "items": items[oid]} if (oid := pcx_orders.order_id(o)) in items else o
+                    for o in orders
+                ]
+                # Warm the next most recent orders so the next get_order_items is local.
+                rest = [oid for oid in recent_ids if oid and oid not in expand]
+                client.warm_order_details(rest[:ORDER_PREFETCH])
+
+            out = {
+                "orders": orders,
+                "totalOnlineOrders": result.get("onlineOrdersCount"),
+                "totalOfflineOrders": result.get("offlineOrdersCount")
+            }
+            if scan:
+                out["itemScan"] = scan
+            return _tool_result(name, out)
+
+        elif name == "purchase_analytics":
+            client.sync_purchases(ANALYTICS_ORDERS)
+            result = client.purchases.query(
+                group_by=arguments.get("group_by", "item"),
+                match=arguments.get("match"),
+                from_date=arguments.get("from_date"),
+                to_date=arguments.get("to_date"),
+                top=arguments.get("top", 10),
+                sort=arguments.get("sort", "spend"),
+            )
+
+            return _tool_result(name, result)
+
+        elif name == "suggest_restock":
+            result = client.suggest_restock(
+                horizon_days=arguments.get("horizon_days", 3),
+                top=arguments.get("limit", 20),
+                check_stock=arguments.get("check_stock", True),
+            )
+
+            return _tool_result(name, result)
 
         elif name == "get_order_items":
             order_id = arguments["order_id"]
-            result = client.get_order_details(order_id)
+            result = client.get_order_details(order_id, ORDER_DETAIL_MAX_AGE)
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+            return _tool_result(name, result)
 
         elif name == "search_products":
             query = arguments["query"]
             limit = arguments.get("limit", 48)
-            result = client.search_products(query, size=limit)
+            result = client.search_products(query, size=limit, exact=arguments.get("exact", False))
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+            return _tool_result(name, result)
 
         elif name == "get_product_details":
             product_code = arguments["product_code"]
             result = client.get_product_details(product_code)
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+            return _tool_result(name, result)
+
+        elif name == "resolve_items":
+            result = client.resolve_items(arguments["items"], arguments.get("candidates", 5))
+
+            return _tool_result(name, result)
+
+        elif name == "check_availability":
+            product_codes = arguments["product_codes"]
+            max_age = arguments.get("max_age_seconds", 300)
+            result = client.check_availability(product_codes, max_age)
+
+            return _tool_result(name, result)
 
         elif name == "add_to_cart":
             product_code = arguments["product_code"]
             quantity = arguments.get("quantity", 1)
             fulfillment = arguments.get("fulfillment_method", "pickup")
 
+            before = None if arguments.get("full_cart") else client.cart_snapshot()
             result = client.add_to_cart(product_code, quantity, fulfillment)
+            if before is not None:
+                result = pcx_cart.cart_delta(before, result, codes=(product_code,))
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+            return _tool_result(name, result)
 
         elif name == "remove_from_cart":
             product_code = arguments["product_code"]
+            before = None if arguments.get("full_cart") else client.cart_snapshot()
             result = client.remove_from_cart(product_code)
+            if before is not None:
+                result = pcx_cart.cart_delta(before, result, codes=(product_code,))
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+            return _tool_result(name, result)
 
         elif name == "view_cart":
             result = client.get_cart()
 
-            return [TextContent(
-                type="text",
-                text=json.dumps(result, indent=2)
-            )]
+            return _tool_result(name, result)
 
         else:
-            return [TextContent(
-                type="text",
-                text=f"Unknown tool: {name}"
-            )]
+            return _tool_error(f"Unknown tool: {name}")
 
+    except pcx_deadline.CallCancelled as e:
+        logger.info("Stopped %s: %s", name, e)
+        return _tool_error(f"Error: {str(e)}")
     except Exception as e:
         logger.error(f"Error in {name}: {str(e)}", exc_info=True)
-        return [TextContent(
-            type="text",
-            text=f"Error: {str(e)}"
-        )]
+        return _tool_error(f"Error: {str(e)}")
+
+
+def _tool_result(name: str, result: dict) -> ToolResult:
+    """`result` as JSON text, or as structured content with a compact JSON copy (TOOL_RESULTS).
+
+    Structured results are checked against the tool's outputSchema here, on the worker thread
+    and with a compiled checker, and handed over as a finished CallToolResult so the MCP layer
+    doesn't check them again.
+    """
+    if TOOL_RESULTS != "structured":
+        text = pcx_json.dumps(result, indent=TOOL_RESULTS == "indented")
+        return [TextContent(type="text", text=text)]
+    import jsonschema
+
+    validator = _output_validators.get(name)
+    if validator is None:
+        validator = _output_validators[name] = _validator(OUTPUT_SCHEMAS[name])
+    try:
+        validator.validate(result)
+    except jsonschema.ValidationError as e:
+        logger.error("%s returned a result its outputSchema rejects: %s", name, e.message)
+        return _tool_error(f"Output validation error: {e.message}")
+    text = pcx_json.dumps(result, indent=False)
+    return CallToolResult(content=[TextContent(type="text", text=text)], structuredContent=result)
+
+
+def _tool_error(message: str) -> CallToolResult:
+    """A failed call. Returned whole, so no structured content is expected alongside it."""
+    return CallToolResult(content=[TextContent(type="text", text=message)], isError=True)
 
 
 async def main_stdio():
     """Run the MCP server over stdio (default; for Claude Desktop and local clients)."""
+    from mcp.server.stdio import stdio_server
     async with stdio_server() as (read_stream, write_stream):
         await app.run(read_stream, write_stream, app.create_initialization_options())
 
 
+# Warm-up progress for /health/ready: cold -> warming -> ready | degraded
+warmup_status: dict = {"state": "cold", "error": None}
+
+
+def warm_up(prefill_orders: bool = False) -> None:
+    """Pay the first tool call's setup costs before the server reports ready.
+
+    Mints (or loads) the access token, resolves the cart id via the customer profile, and
+    optionally fetches the order history into the response cache. Each call leaves a pooled
+    keep-alive connection to its host, so the first real tool call skips the TLS handshakes.
+    A failure here is logged and reported as "degraded" rather than blocking readiness: the
+    tools still work, they just pay the setup cost on first use.
+    """
+    warmup_status.update(state="warming", error=None)
+    try:
+        client = get_api_client()
+        client.tokens.get_access_token()  # accounts.pcid.ca, when the cached token is stale
+        client.cart_id                    # api.pcexpress.ca customer profile (unless configured)
+        if prefill_orders:
+            client.get_historical_orders()
+    except Exception as e:
+        logger.warning("Warm-up failed; tools will initialize on first use: %s", e)
+        warmup_status.update(state="degraded", error=str(e))
+    else:
+        logger.info("Warm-up complete")
+        warmup_status["state"] = "ready"
+
+
+def metrics() -> dict:
+    """Runtime counters for /metrics. Empty sections until the API client exists."""
+    import pcx_http
+
+    out = {"warmup": warmup_status["state"]}
+    if api_client is not None:
+        out["pool"] = pcx_http.pool_stats(api_client.session)
+        out["cache"] = api_client.cache.stats()
+        out["cart_writes"] = api_client.cart_ops.stats()
+        out["purchases"] = api_client.purchases.stats()
+        out["preferences"] = api_client.preferences.stats()
+        out["names"] = api_client.names.stats()
+        if api_client.limiter is not None:
+            out["upstream"] = api_client.limiter.stats()
+        if api_client.hedger is not None:
+            out["hedging"] = api_client.hedger.stats()
+    if admission is not None:
+        out["admission"] = admission.stats()
+    if router is not None:
+        out["workers"] = router.stats()
+    if sessions is not None:
+        out["sessions"] = sessions.stats()
+    return out
+
+
+# Admission control for the HTTP server (set by _build_http_app; stdio has a single client)
+admission: Optional[pcx_admission.Admission] = None
+
+# Message forwarding between sibling HTTP workers (set by _build_http_app with
+# PCEXPRESS_WORKERS > 1)
+router: Optional[pcx_workers.PeerRouter] = None
+
+# Open SSE sessions, their idle timeout and cap (set by _build_http_app)
+sessions: Optional[pcx_sessions.SessionTracker] = None
+
+
+def _called_tools(body: bytes) -> tuple:
+    """Names of the tools a JSON-RPC message (or batch) calls; empty for anything else."""
+    try:
+        messages = pcx_json.loads(body)
+    except ValueError:
+        return ()
+    if not isinstance(messages, list):
+        messages = [messages]
+    return tuple(
+        str((m.get("params") or {}).get("name"))
+        for m in messages if isinstance(m, dict) and m.get("method") == "tools/call"
+    )
+
+
 def _build_http_app():
     """Starlette app serving MCP over SSE at /sse (posts to /messages/), plus an
     unauthenticated /health for probes. SSE is used rather than streamable-http because it
-    proxies cleanly through Traefik. Set PCEXPRESS_MCP_BEARER to require a bearer on /sse."""
+    proxies cleanly through Traefik. Set PCEXPRESS_MCP_BEARER to require a bearer on /sse
+    (several, comma-separated, to give each client its own).
+
+    /sse connects and tool calls posted to /messages/ go through `admission` (see
+    pcx_admission): per-caller and per-tool token buckets and a global in-flight cap.
+    Refusals are 429 with a Retry-After.
+
+    With PCEXPRESS_WARMUP=1 a warm-up (see `warm_up`) runs in the background at startup and
+    /health/ready answers 503 until it finishes; /health stays a plain liveness check.
+    PCEXPRESS_WARMUP_ORDERS=1 also prefills the purchase-history cache. /metrics returns the
+    runtime counters from `metrics()` as JSON.
+
+    As one of several workers (PCEXPRESS_WORKER_DIR set by `main_http`), a message for a
+    session this worker doesn't hold is forwarded to the sibling that does (see pcx_workers).
+
+    Sessions are tracked by `sessions` (see pcx_sessions): idle ones are closed, a connect over
+    PCEXPRESS_MAX_SESSIONS is refused with 503, and each session's traffic is accounted."""
+    import anyio
+    from urllib.parse import parse_qs
+    from uuid import UUID
     from starlette.applications import Starlette
+    from starlette.requests import Request
     from starlette.routing import Mount, Route
     from starlette.responses import JSONResponse, Response
     from mcp.server.sse import SseServerTransport
 
-    bearer = os.getenv("PCEXPRESS_MCP_BEARER")
+    global admission, router, sessions
+
+    load_env()
+    bearers = [b.strip() for b in os.getenv("PCEXPRESS_MCP_BEARER", "").split(",") if b.strip()]
     sse = SseServerTransport("/messages/")
+    admission = pcx_admission.Admission.from_env()
+    worker_dir = os.getenv("PCEXPRESS_WORKER_DIR")
+    router = pcx_workers.PeerRouter(worker_dir) if worker_dir else None
+    sessions = pcx_sessions.SessionTracker.from_env()
+
+    def caller(request) -> str:
+        """Rate-limit key: which configured bearer was presented, else the client address."""
+        auth = request.headers.get("authorization", "")
+        for i, b in enumerate(bearers):
+            if auth == f"Bearer {b}":
+                return f"bearer-{i + 1}"
+        return f"addr-{request.client.host if request.client else 'unknown'}"
+
+    class SentResponse(Response):
+        """What an endpoint returns when it has already answered on the raw `send`."""
+
+        async def __call__(self, scope, receive, send):
+            pass
+
+    def too_many(retry_after: int) -> Response:
+        return JSONResponse({"error": "rate limited"}, status_code=429,
+                            headers={"Retry-After": str(retry_after)})
 
     async def handle_sse(request):
-        if bearer and request.headers.get("authorization") != f"Bearer {bearer}":
+        who = caller(request)
+        if bearers and not who.startswith("bearer-"):
             return Response(status_code=401)
-        async with sse.connect_sse(request.scope, request.receive, request._send) as (r, w):
-            await app.run(r, w, app.create_initialization_options())
-        return Response()  # SSE response is already sent; give Starlette a callable to close cleanly
+        retry_after = admission.check(who, connect=True)
+        if retry_after:
+            return too_many(retry_after)
+        scope = anyio.CancelScope()
+        session = sessions.open(who, scope.cancel)
+        if session is None:
+            return JSONResponse({"error": "too many sessions"}, status_code=503,
+                                headers={"Retry-After": str(sessions.retry_after())})
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                sessions.sent(session, message.get("body", b""))
+            await request._send(message)
+
+        try:
+            async with sse.connect_sse(request.scope, request.receive, send) as (r, w):
+                with scope:
+                    await app.run(r, w, app.create_initialization_options())
+        finally:
+            sessions.ended(session)
+        if session.closed_by:
+            logger.info("Closed %s session of %s", session.closed_by, who)
+        return SentResponse()  # the SSE response is already complete
+
+    async def handle_messages(scope, receive, send):
+        # Read the JSON-RPC body to see which tools it calls, then replay it to the transport.
+        body, more = b"", True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+        calls = _called_tools(body)
+        if router is not None and not holds_session(scope):
+            # The worker holding the session charges it.
+            response = await router.forward(pcx_workers.encode_request(scope, body))
+            if response is not None:
+                return await pcx_workers.send_response(response, send)
+        retry_after = admit(scope, calls)
+        if retry_after:
+            return await too_many(retry_after)(scope, receive, send)
+        retry_after = sessions.received(session_of(scope), len(body), len(calls))
+        if retry_after:
+            return await too_many(retry_after)(scope, receive, send)
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        try:
+            await sse.handle_post_message(scope, replay, send)
+        finally:
+            sessions.delivered(session_of(scope), len(body))
 
     async def health(_request):
         return JSONResponse({"status": "ok"})
 
+    async def metrics_endpoint(_request):
+        return JSONResponse(metrics())
+
+    async def ready(_request):
+        state = warmup_status["state"]
+        body = {"status": state}
+        if warmup_status["error"]:
+            body["error"] = warmup_status["error"]
+        return JSONResponse(body, status_code=503 if state in ("cold", "warming") else 200)
+
+    def holds_session(scope) -> bool:
+        """Whether this worker's transport has the session a message is for."""
+        # The transport keeps no public session registry; if that changes, let it decide.
+        writers = getattr(sse, "_read_stream_writers", None)
+        session_id = session_of(scope)
+        try:
+            return writers is None or UUID(hex=session_id) in writers
+        except (TypeError, ValueError):
+            return True  # malformed: the transport answers 400
+
+    def admit(scope, calls: tuple) -> Optional[int]:
+        """Charge a message's tool calls to whoever opened its session; None admits it.
+
+        Posts carry no credentials of their own (the bearer is checked on /sse), so the caller
+        is the session's, not the post's. A message for no session of ours reaches none, and
+        the transport answers it.
+        """
+        who = sessions.caller(session_of(scope))
+        return admission.check(who, calls) if who is not None else None
+
+    def session_of(scope) -> Optional[str]:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return query.get("session_id", [None])[0]
+
+    async def handle_forwarded(request: dict) -> dict:
+        # A sibling's message: deliver it if the session is ours, never forward it again.
+        scope, body = pcx_workers.decode_request(request)
+        if not holds_session(scope):
+            return {"status": 404, "headers": [], "body": ""}
+        calls = _called_tools(body)
+        retry_after = (admit(scope, calls)
+                       or sessions.received(session_of(scope), len(body), len(calls)))
+        if retry_after:
+            return {"status": 429, "headers": [["retry-after", str(retry_after)]],
+                    "body": '{"error": "rate limited"}'}
+        try:
+            return await pcx_workers.call_asgi(sse.handle_post_message, scope, body)
+        finally:
+            sessions.delivered(session_of(scope), len(body))
+
+    async def reap_sessions():
+        interval = min(60.0, max(1.0, sessions.idle_timeout / 4))
+        while True:
+            await asyncio.sleep(interval)
+            sessions.reap()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app):
+        task = None
+        reaper = asyncio.create_task(reap_sessions()) if sessions.idle_timeout else None
+        if router is not None:
+            await router.start(handle_forwarded)
+        if os.getenv("PCEXPRESS_WARMUP") == "1":
+            prefill = os.getenv("PCEXPRESS_WARMUP_ORDERS") == "1"
+            task = asyncio.create_task(asyncio.to_thread(warm_up, prefill))
+        else:
+            warmup_status["state"] = "ready"
+        yield
+        if task is not None:
+            task.cancel()
+        if reaper is not None:
+            reaper.cancel()
+        if router is not None:
+            await router.close()
+
     return Starlette(routes=[
         Route("/health", health, methods=["GET"]),
+        Route("/health/ready", ready, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
         Route("/sse", handle_sse, methods=["GET"]),
-        Mount("/messages/", app=sse.handle_post_message),
-    ])
+        Mount("/messages/", app=handle_messages),
+    ], lifespan=lifespan)
 
 
 def main_http():
-    """Serve MCP over HTTP/SSE (for containers and Kubernetes)."""
+    """Serve MCP over HTTP/SSE (for containers and Kubernetes).
+
+    PCEXPRESS_WORKERS > 1 runs that many uvicorn worker processes on the port, each building
+    its own app; they find each other through sockets in a fresh PCEXPRESS_WORKER_DIR."""
     import uvicorn
     port = int(os.getenv("PCEXPRESS_HTTP_PORT", "8090"))
-    logger.info("Serving MCP over SSE on 0.0.0.0:%s (endpoints: /sse, /health)", port)
-    uvicorn.run(_build_http_app(), host="0.0.0.0", port=port)
+    workers = int(os.getenv("PCEXPRESS_WORKERS", "1"))
+    logger.info("Serving MCP over SSE on 0.0.0.0:%s with %s worker(s) (endpoints: /sse, /health, "
+                "/health/ready, /metrics)", port, workers)
+    if workers <= 1:
+        uvicorn.run(_build_http_app(), host="0.0.0.0", port=port)
+        return
+
+    import shutil
+    import tempfile
+
+    worker_dir = tempfile.mkdtemp(prefix="pcexpress-mcp-workers-")
+    os.environ["PCEXPRESS_WORKER_DIR"] = worker_dir  # inherited by the worker processes
+    try:
+        uvicorn.run("pcexpress_mcp_server:_build_http_app", factory=True, workers=workers,
+                    host="0.0.0.0", port=port)
+    finally:
+        shutil.rmtree(worker_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
-    import asyncio
     import sys
+    load_env()
     if "--http" in sys.argv or os.getenv("PCEXPRESS_HTTP") == "1":
         main_http()
     else:
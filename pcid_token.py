@@ -4,13 +4,24 @@ Given a refresh token (from login_pcid.py) plus the app client_id/secret, this m
 short-lived access tokens on demand against accounts.pcid.ca/oauth2/v1/token — plain
 HTTPS, no browser, not bot-walled. Handles refresh-token rotation by persisting the
 current refresh token to a writable state file so it survives restarts.
+
+The state file is also how several server processes on one host (PCEXPRESS_WORKERS) share one
+token chain. A refresh takes an exclusive lock on `pcid_token_state.lock` and re-reads the
+state first: if another process has already rotated the token, its access token is adopted
+instead of spending the (now dead) refresh token again. So only one process ever rotates.
 """
+import contextlib
 import json
 import logging
 import os
 import threading
 import time
 
+try:
+    import fcntl
+except ImportError:  # Windows: one process per state dir, so the thread lock is enough
+    fcntl = None
+
 import requests
 
 import pcid_config as cfg
@@ -23,26 +34,31 @@ class PcidAuthError(Exception):
 
 
 class TokenManager:
-    def __init__(self, state_dir: str | None = None):
+    def __init__(self, state_dir: str | None = None, session: requests.Session | None = None):
         state_dir = state_dir or os.getenv("PCEXPRESS_STATE_DIR", os.path.expanduser("~/.pcexpress-mcp"))
         os.makedirs(state_dir, exist_ok=True)
         self._state_path = os.path.join(state_dir, "pcid_token_state.json")
+        self._lock_path = os.path.join(state_dir, "pcid_token_state.lock")
         self._lock = threading.Lock()
-        self._session = requests.Session()
+        # Pass the API client's session to share its keep-alive pools (see pcx_http).
+        self._session = session or requests.Session()
         self._access_token: str | None = None
         self._expires_at: float = 0.0
         self._refresh_token: str | None = None
         self._load()
 
-    def _load(self):
-        seed = os.getenv("PCEXPRESS_REFRESH_TOKEN")
-        state = {}
+    def _read_state(self) -> dict:
         if os.path.exists(self._state_path):
             try:
                 with open(self._state_path) as f:
-                    state = json.load(f)
+                    return json.load(f)
             except Exception as e:
-                logger.warning("Could not read token state (%s); reseeding from env", e)
+                logger.warning("Could not read token state: %s", e)
+        return {}
+
+    def _load(self):
+        seed = os.getenv("PCEXPRESS_REFRESH_TOKEN")
+        state = self._read_state()
         # A refresh token in the persisted state is newer than the env seed (rotation).
         self._refresh_token = state.get("refresh_token") or seed
         self._access_token = state.get("access_token")
@@ -73,7 +89,31 @@ class TokenManager:
         with self._lock:
             if not force and self._access_token and time.time() < self._expires_at - 60:
                 return self._access_token
-            return self._refresh_now()
+            with self._state_lock():
+                # Another process may have refreshed while we waited; its token is as good.
+                state = self._read_state()
+                if state.get("refresh_token"):
+                    self._refresh_token = state["refresh_token"]
+                expires_at = state.get("expires_at", 0.0)
+                fresh = state.get("access_token") and time.time() < expires_at - 60
+                if fresh and not (force and state["access_token"] == self._access_token):
+                    self._access_token = state["access_token"]
+                    self._expires_at = state["expires_at"]
+                    return self._access_token
+                return self._refresh_now()
+
+    @contextlib.contextmanager
+    def _state_lock(self):
+        """Exclusive across processes sharing the state dir (a no-op without fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
     def _refresh_now(self) -> str:
         if not cfg.CLIENT_SECRET:
@@ -0,0 +1,189 @@
+"""Rate limiting and admission control for the HTTP/SSE server.
+
+Every tool call can fan out into several upstream requests, all on the one PC Express account,
+so a single runaway client can burn through the account's upstream allowance for everyone.
+`Admission` puts three checks in front of tool calls:
+
+- a token bucket per caller (each configured bearer, or the client address without one),
+  also charged for each /sse connect. Messages are charged to the caller that opened their
+  session, whatever headers the post itself carries. Other session messages (initialize, tools/list,
+  pings, cancellations) are never charged or refused;
+- an optional token bucket per caller and tool, for the expensive tools;
+- a global cap on tool calls running at once, with a bounded queue behind it.
+
+A request that fails a check is refused at the HTTP layer with 429 and a Retry-After, before
+it reaches the MCP session. Configuration (all optional):
+
+    PCEXPRESS_RATE_LIMIT      tool calls per second per caller, as "rate/burst" (default "5/20")
+    PCEXPRESS_TOOL_RATES      per-tool limits per caller,
+                              e.g. "search_products=2/5,resolve_items=1/3"
+    PCEXPRESS_MAX_IN_FLIGHT   tool calls running at once across all callers (default 8)
+    PCEXPRESS_MAX_QUEUE       tool calls allowed to wait for a slot before shedding (default 32)
+"""
+import asyncio
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# Callers are keyed by client address when there is no bearer, so keep the table bounded.
+MAX_BUCKETS = 1024
+
+
+def parse_rate(spec: str) -> tuple:
+    """"rate/burst" -> (rate per second, burst); a bare rate gets a burst of the same size."""
+    rate, _, burst = spec.partition("/")
+    return float(rate), float(burst or rate)
+
+
+def parse_tool_rates(spec: str) -> dict:
+    rates = {}
+    for part in spec.split(","):
+        tool, _, rate = part.partition("=")
+        if tool.strip() and rate.strip():
+            rates[tool.strip()] = parse_rate(rate.strip())
+    return rates
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens a second, holding at most `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait(self, now: float, n: int = 1) -> float:
+        """Seconds until `n` tokens are available (0 if they are), without taking any."""
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(now, self.updated)
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def take(self, now: float, n: int = 1) -> float:
+        """Take `n` tokens. Returns 0 on success, else the seconds until they are available."""
+        wait = self.wait(now, n)
+        if not wait:
+            self.tokens -= n
+        return wait
+
+
+class Admission:
+    """Per-caller and per-tool token buckets plus a global in-flight cap with a bounded queue."""
+
+    def __init__(self, rate: tuple = (5, 20), tool_rates: Optional[dict] = None,
+                 max_in_flight: int = 8, max_queue: int = 32):
+        self.rate = rate
+        self.tool_rates = tool_rates or {}
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._buckets: dict = {}   # (caller, tool or None) -> TokenBucket
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.rejected = {"caller_rate": 0, "tool_rate": 0, "overload": 0}
+        self._avg_seconds = 1.0    # EWMA of tool-call duration, for overload Retry-After
+
+    @classmethod
+    def from_env(cls) -> "Admission":
+        return cls(
+            rate=parse_rate(os.getenv("PCEXPRESS_RATE_LIMIT", "5/20")),
+            tool_rates=parse_tool_rates(os.getenv("PCEXPRESS_TOOL_RATES", "")),
+            max_in_flight=int(os.getenv("PCEXPRESS_MAX_IN_FLIGHT", "8")),
+            max_queue=int(os.getenv("PCEXPRESS_MAX_QUEUE", "32")),
+        )
+
+    def _bucket(self, caller: str, tool: Optional[str]) -> TokenBucket:
+        key = (caller, tool)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._prune()
+            rate, burst = self.tool_rates[tool] if tool else self.rate
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _prune(self) -> None:
+        # A bucket idle long enough to have refilled is indistinguishable from a new one.
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[key]
+
+    def check(self, caller: str, tools: tuple = (), connect: bool = False) -> Optional[int]:
+        """Charge `caller` for a connect or for tool calls by name.
+
+        Anything else posted to a session (initialize, tools/list, pings, responses, and
+        notifications such as notifications/cancelled) is free, so a caller over its rate can
+        still cancel its own calls. Every bucket is checked before any is charged, so a refused
+        batch costs nothing. Returns None to admit, or the Retry-After in whole seconds
+        to refuse. The queue check is made at request time, so a burst arriving together can
+        overshoot `max_queue` by a few calls; they still wait for a slot like any other.
+        """
+        if not tools and not connect:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if tools and self.queued + len(tools) > self.max_queue:
+                self.rejected["overload"] += 1
+                # Roughly how long the queue ahead takes to drain.
+                drain = self._avg_seconds * self.queued / max(self.max_in_flight, 1)
+                return max(1, math.ceil(drain))
+            charges = [(self._bucket(caller, None), len(tools) or 1, "caller_rate")]
+            charges += [(self._bucket(caller, tool), n, "tool_rate")
+                        for tool, n in Counter(tools).items() if tool in self.tool_rates]
+            for bucket, n, reason in charges:
+                wait = bucket.wait(now, n)
+                if wait:
+                    self.rejected[reason] += 1
+                    return max(1, math.ceil(wait))
+            for bucket, n, _ in charges:
+                bucket.take(now, n)
+        return None
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one of the `max_in_flight` tool-call slots, queueing for it if necessary."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            with self._lock:
+                self.queued -= 1
+        start = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.in_flight -= 1
+                self._avg_seconds += 0.2 * (time.monotonic() - start - self._avg_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "callers": len({caller for caller, _ in self._buckets}),
+        }
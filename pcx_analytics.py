@@ -0,0 +1,309 @@
+"""Spending and purchase-frequency aggregates over past orders.
+
+`PurchaseLedger` holds one row per purchased order line in columnar arrays (day, item,
+quantity, spend) with a small dimension table of items (code, name, brand, category). Orders
+are added once each, as they are synced from order details, and the running totals per item,
+brand, category, and month are updated as they go. Unfiltered queries read those totals
+directly; filtered ones (date range, a name/brand/category term) scan the columns, which for a
+few years of weekly shops is tens of thousands of rows and a few milliseconds.
+
+`RestockModel` turns the per-item purchase days into a repurchase cadence and flags what is
+due. It listens to the ledger and rescores only the items a newly synced order touched.
+"""
+import bisect
+import threading
+from array import array
+from datetime import date
+from typing import Iterable, Optional
+
+from pcx_cart import entry_line
+from pcx_orders import normalize
+
+GROUPS = ("item", "brand", "category", "month", "week")
+
+UNKNOWN = "(unknown)"
+
+# Past this many intervals overdue an item has most likely been dropped, not forgotten.
+LAPSED_RATIO = 4
+
+
+def entry_brand(entry: dict) -> Optional[str]:
+    product = entry.get("product") or {}
+    return product.get("brand") or entry.get("brand")
+
+
+def entry_category(entry: dict) -> Optional[str]:
+    """The most specific category name the entry carries, if any."""
+    product = entry.get("product") or {}
+    for source in (product, entry):
+        for key in ("category", "categoryName", "department"):
+            value = source.get(key)
+            if isinstance(value, dict):
+                value = value.get("name")
+            if value:
+                return str(value)
+        for key in ("categories", "breadcrumbs"):
+            value = source.get(key)
+            if isinstance(value, list) and value:
+                last = value[-1]
+                return str(last.get("name") if isinstance(last, dict) else last)
+    return None
+
+
+def parse_day(value: str) -> Optional[int]:
+    """Proleptic ordinal of an ISO date/datetime string, or None."""
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def _period(day: int, group: str) -> str:
+    d = date.fromordinal(day)
+    if group == "week":
+        year, week, _ = d.isocalendar()
+        return f"{year}-W{week:02d}"
+    return d.strftime("%Y-%m")
+
+
+class _Totals:
+    __slots__ = ("spend", "quantity", "orders", "days")
+
+    def __init__(self):
+        self.spend = 0.0
+        self.quantity = 0.0
+        self.orders: set = set()
+        self.days: list = []   # sorted distinct purchase days
+
+    def add(self, day: int, order: int, quantity: float, spend: float) -> None:
+        self.spend += spend
+        self.quantity += quantity
+        self.orders.add(order)
+        i = bisect.bisect_left(self.days, day)
+        if i == len(self.days) or self.days[i] != day:
+            self.days.insert(i, day)
+
+    def row(self, key: str) -> dict:
+        row = {
+            "key": key,
+            "spend": round(self.spend, 2),
+            "quantity": round(self.quantity, 2),
+            "orders": len(self.orders),
+        }
+        if self.days:
+            row["lastPurchased"] = date.fromordinal(self.days[-1]).isoformat()
+        if len(self.days) > 1:
+            row["avgIntervalDays"] = round((self.days[-1] - self.days[0]) / (len(self.days) - 1), 1)
+        return row
+
+
+class PurchaseLedger:
+    """Columnar purchase history with incrementally maintained per-group totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.order_ids: list = []        # row "order" column indexes into this
+        self._seen: set = set()
+        self.items: list = []            # dimension table: {code, name, brand, category}
+        self._item_ids: dict = {}
+        # One row per order line
+        self.day = array("i")
+        self.order = array("i")
+        self.item = array("i")
+        self.quantity = array("d")
+        self.spend = array("d")
+        self._totals: dict = {group: {} for group in ("item", "brand", "category", "month")}
+        self.listeners: list = []        # called with the item ids of each newly added order
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self._seen
+
+    def __len__(self) -> int:
+        return len(self.order_ids)
+
+    def add_order(self, order_id: str, day: Optional[int], entries: Iterable[dict]) -> bool:
+        """Record one order's raw line entries. Returns False if it was already recorded.
+
+        The lines are converted before anything is recorded, so an order with a line that
+        can't be read raises and is left out whole, to be tried again on the next sync.
+        """
+        if day is None:
+            return False
+        rows = []
+        for entry in entries:
+            line = entry_line(entry)
+            if line is not None:
+                rows.append((line, entry, float(line["quantity"] or 0), float(line["price"] or 0)))
+        with self._lock:
+            if order_id in self._seen:
+                return False
+            self._seen.add(order_id)
+            order_idx = len(self.order_ids)
+            self.order_ids.append(order_id)
+            touched = set()
+            for line, entry, quantity, spend in rows:
+                item_id = self._item_id(line, entry)
+                self.day.append(day)
+                self.order.append(order_idx)
+                self.item.append(item_id)
+                self.quantity.append(quantity)
+                self.spend.append(spend)
+                for group, key in self._keys(item_id, day).items():
+                    totals = self._totals[group].setdefault(key, _Totals())
+                    totals.add(day, order_idx, quantity, spend)
+                touched.add(item_id)
+        for listener in self.listeners:
+            listener(touched)
+        return True
+
+    def _item_id(self, line: dict, entry: dict) -> int:
+        code = line["code"]
+        item_id = self._item_ids.get(code)
+        if item_id is None:
+            item_id = self._item_ids[code] = len(self.items)
+            self.items.append({"code": code, "name": line["name"],
+                               "brand": entry_brand(entry), "category": entry_category(entry)})
+        return item_id
+
+    def _keys(self, item_id: int, day: int,
+              groups: Iterable[str] = ("item", "brand", "category", "month")) -> dict:
+        item = self.items[item_id]
+        keys = {}
+        for group in groups:
+            if group == "item":
+                keys[group] = item_id
+            elif group in ("brand", "category"):
+                keys[group] = item[group] or UNKNOWN
+            else:
+                keys[group] = _period(day, group)
+        return keys
+
+    def item_totals(self, item_id: int) -> tuple:
+        """(sorted distinct purchase days, total quantity, order count) for one item."""
+        with self._lock:
+            t = self._totals["item"].get(item_id)
+            return (list(t.days), t.quantity, len(t.orders)) if t else ([], 0.0, 0)
+
+    def query(self, group_by: str = "item", match: Optional[str] = None,
+              from_date: Optional[str] = None, to_date: Optional[str] = None, top: int = 10,
+              sort: str = "spend") -> dict:
+        """Top `top` groups by spend (or purchase count), optionally filtered."""
+        if group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+        with self._lock:
+            if match or from_date or to_date or group_by == "week":
+                totals = self._scan(group_by, match, from_date, to_date)
+            else:
+                totals = self._totals[group_by]
+            rows = []
+            for key, t in totals.items():
+                row = t.row(str(key))
+                if group_by == "item":
+                    item = self.items[key]
+                    row.update(key=item["code"], name=item["name"], brand=item["brand"])
+                rows.append(row)
+        sort_key = "orders" if sort == "count" else "spend"
+        rows.sort(key=lambda r: r[sort_key], reverse=True)
+        return {
+            "groupBy": group_by,
+            "ordersAnalyzed": len(self.order_ids),
+            "totalSpend": round(sum(r["spend"] for r in rows), 2),
+            "rows": rows[:top],
+        }
+
+    def _scan(self, group_by: str, match: Optional[str], from_date: Optional[str],
+              to_date: Optional[str]) -> dict:
+        term = normalize(match)
+        wanted = None
+        if term:
+            wanted = {
+                i for i, item in enumerate(self.items)
+                if term == item["code"].lower()
+                or any(term in normalize(item[k]) for k in ("name", "brand", "category"))
+            }
+        lo = parse_day(from_date) if from_date else None
+        hi = parse_day(to_date) if to_date else None
+        totals: dict = {}
+        for row in range(len(self.day)):
+            day, item_id = self.day[row], self.item[row]
+            if wanted is not None and item_id not in wanted:
+                continue
+            if (lo and day < lo) or (hi and day > hi):
+                continue
+            key = self._keys(item_id, day, (group_by,))[group_by]
+            totals.setdefault(key, _Totals()).add(
+                day, self.order[row], self.quantity[row], self.spend[row])
+        return totals
+
+    def stats(self) -> dict:
+        return {"orders": len(self.order_ids), "rows": len(self.day), "items": len(self.items)}
+
+
+class RestockModel:
+    """Repurchase cadence per regularly bought item, kept current as orders are synced."""
+
+    def __init__(self, ledger: PurchaseLedger, min_purchases: int = 3):
+        self.ledger = ledger
+        self.min_purchases = min_purchases
+        self._lock = threading.Lock()
+        self._dirty: set = set()
+        self._cadence: dict = {}   # item id -> {intervalDays, lastPurchased (ordinal), ...}
+        ledger.listeners.append(self._touched)
+
+    def _touched(self, item_ids: set) -> None:
+        with self._lock:
+            self._dirty |= item_ids
+
+    def _rescore(self) -> dict:
+        """Bring the cadences of touched items up to date; returns a snapshot of all of them.
+
+        Concurrent tool calls rescore on different threads, so it all happens under the lock
+        (the ledger calls `_touched` outside its own lock, so taking it here can't deadlock).
+        """
+        import statistics  # pulls in decimal and fractions; keep it off the startup path
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            for item_id in dirty:
+                days, quantity, orders = self.ledger.item_totals(item_id)
+                if len(days) < self.min_purchases:
+                    self._cadence.pop(item_id, None)
+                    continue
+                gaps = [b - a for a, b in zip(days, days[1:])]
+                interval = statistics.median(gaps)
+                spread = statistics.pstdev(gaps) / interval if interval else 0.0
+                self._cadence[item_id] = {
+                    "interval": interval,
+                    "last": days[-1],
+                    "purchases": len(days),
+                    "quantity": max(1, round(quantity / orders)) if orders else 1,
+                    # Regular, often-bought items score close to 1.
+                    "confidence": round(max(0.0, 1 - spread) * min(1.0, len(days) / 8), 2),
+                }
+            return dict(self._cadence)
+
+    def due(self, today: Optional[int] = None, horizon_days: int = 3, top: int = 20) -> list[dict]:
+        """Items whose next purchase falls within `horizon_days` of `today`, most overdue first."""
+        cadence = self._rescore()
+        today = today or date.today().toordinal()
+        suggestions = []
+        for item_id, c in cadence.items():
+            if not c["interval"]:
+                continue
+            due_day = c["last"] + c["interval"]
+            if due_day - today > horizon_days or (today - c["last"]) / c["interval"] > LAPSED_RATIO:
+                continue
+            item = self.ledger.items[item_id]
+            suggestions.append({
+                "code": item["code"],
+                "name": item["name"],
+                "brand": item["brand"],
+                "lastPurchased": date.fromordinal(c["last"]).isoformat(),
+                "intervalDays": round(c["interval"], 1),
+                "dueInDays": round(due_day - today, 1),
+                "overdueRatio": round((today - c["last"]) / c["interval"], 2),
+                "usualQuantity": c["quantity"],
+                "confidence": c["confidence"],
+            })
+        suggestions.sort(key=lambda s: (-s["overdueRatio"], -s["confidence"]))
+        return suggestions[:top]
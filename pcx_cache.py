@@ -0,0 +1,153 @@
+"""Validator-aware response cache for the PC Express API client.
+
+Keeps the parsed body of cacheable GETs next to the validators the server sent with it
+(ETag / Last-Modified), so the next read can be a conditional request. A 304 hands back the
+cached object without re-downloading or re-parsing it. When the server sends no validators,
+a digest of the raw body stands in: the body is still downloaded, but an unchanged payload
+skips the JSON parse and returns the same object.
+
+With a `DiskStore` (pcx_store.py), entries whose URL contains one of the `persist` fragments are
+also written to disk, and a memory miss falls back to it. A restart then revalidates order and
+product details with a conditional GET instead of downloading them again, and `fresh()` can
+serve them without a request at all.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
+
+import pcx_json
+
+if TYPE_CHECKING:
+    import requests
+
+    from pcx_store import DiskStore
+
+
+class NotCached(Exception):
+    """A 304 came back for an entry evicted since the request went out; send it again in full."""
+
+
+@dataclass
+class CachedResponse:
+    body: Any
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[str] = None
+    stored_at: float = field(default_factory=time.time)
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Bounded LRU of parsed GET responses keyed by URL, optionally backed by a DiskStore."""
+
+    def __init__(self, max_entries: int = 256, store: Optional["DiskStore"] = None,
+                 persist: Optional[dict] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self.persist = persist or {}  # URL fragment -> value of keeping it on disk
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0      # 304s and digest matches: body served without a parse
+        self.misses = 0    # full 200s that had to be parsed
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+        if self._value(url) is None:
+            return None
+        record = self.store.get(url)
+        if record is None:
+            return None
+        entry = CachedResponse(**record)
+        self._put(url, entry, write=False)
+        return entry
+
+    def _value(self, url: str) -> Optional[float]:
+        if self.store is None:
+            return None
+        return next((v for fragment, v in self.persist.items() if fragment in url), None)
+
+    def fresh(self, url: str, max_age: float) -> Optional[Any]:
+        """The cached body for `url` if it was stored or revalidated within `max_age` seconds."""
+        entry = self.get(url)
+        if entry is not None and time.time() - entry.stored_at <= max_age:
+            with self._lock:
+                self.hits += 1
+            return entry.body
+        return None
+
+    def conditional_headers(self, url: str) -> dict:
+        entry = self.get(url)
+        return entry.conditional_headers() if entry else {}
+
+    def resolve(self, url: str, resp: "requests.Response") -> Any:
+        """Return the parsed body for `resp`, serving it from cache when unchanged.
+
+        Raises NotCached for a 304 whose entry was evicted between send and receive.
+        """
+        entry = self.get(url)
+        if resp.status_code == 304:
+            if entry is None:
+                raise NotCached(url)
+            with self._lock:
+                entry.stored_at = time.time()
+                self.hits += 1
+            # Not rewritten to disk: a stale stored_at there only costs one more 304 after a
+            # restart.
+            return entry.body
+
+        digest = hashlib.sha256(resp.content).hexdigest()
+        if entry is not None and entry.digest == digest:
+            body = entry.body
+            with self._lock:
+                self.hits += 1
+        else:
+            body = pcx_json.loads(resp.content)
+            with self._lock:
+                self.misses += 1
+        self._put(url, CachedResponse(
+            body=body,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            digest=digest,
+        ), write=entry is None or entry.digest != digest)
+        return body
+
+    def stats(self) -> dict:
+        stats = {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+        if self.store is not None:
+            stats["disk"] = self.store.stats()
+        return stats
+
+    def invalidate(self, prefix: str = "") -> None:
+        """Drop every entry whose URL starts with `prefix` (everything by default)."""
+        with self._lock:
+            for url in [u for u in self._entries if u.startswith(prefix)]:
+                del self._entries[url]
+                if self._value(url) is not None:
+                    self.store.delete(url)
+
+    def _put(self, url: str, entry: CachedResponse, write: bool = True) -> None:
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        value = self._value(url) if write else None
+        if value is not None:
+            self.store.put(url, {"body": entry.body, "etag": entry.etag,
+                                 "last_modified": entry.last_modified, "digest": entry.digest,
+                                 "stored_at": entry.stored_at}, value)
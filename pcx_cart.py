@@ -0,0 +1,247 @@
+"""Compact views of PC Express cart payloads.
+
+A full `GET /carts/{cartId}` body runs to tens of kilobytes for a normal weekly shop, most of
+it image URLs and pricing metadata. The mutation tools return `cart_delta()` instead: the lines
+that were added, removed, or changed since the previous snapshot, plus the new subtotal, so a
+quantity change costs the same few hundred bytes whatever the size of the cart.
+
+The cart schema isn't documented, so the readers here are deliberately forgiving: lines live
+under `orders[*].entries[*]`, and codes, names, and prices are taken from whichever of the
+observed field spellings is present.
+
+`CartWriteBatcher` merges bursts of cart writes into one POST (PCEXPRESS_CART_COALESCE_MS), and
+`CartWriteLedger` makes their retries safe.
+"""
+import itertools
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Optional
+
+
+def price_value(v: Any) -> Optional[float]:
+    """A price as a number, whether it comes bare or as {"value": ...}."""
+    if isinstance(v, dict):
+        v = v.get("value")
+    try:
+        return None if v is None else round(float(v), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def entry_code(entry: dict) -> Optional[str]:
+    product = entry.get("product") or {}
+    return (product.get("code") or entry.get("code") or entry.get("productCode")
+            or entry.get("offerId"))
+
+
+def _entry_price(entry: dict) -> Optional[float]:
+    for key in ("totalPrice", "lineTotal"):
+        if key in entry:
+            return price_value(entry[key])
+    prices = entry.get("prices") or (entry.get("product") or {}).get("prices") or {}
+    unit = price_value(prices.get("price")) if isinstance(prices, dict) else None
+    quantity = entry.get("quantity")
+    if unit is not None and isinstance(quantity, (int, float)):
+        return round(unit * quantity, 2)
+    return unit
+
+
+def cart_lines(cart: Optional[dict]) -> dict:
+    """Map product code -> compact line ({code, name, quantity, price}) for every cart entry."""
+    lines = {}
+    for order in (cart or {}).get("orders") or []:
+        entries = order.get("entries") or []
+        if isinstance(entries, dict):  # some payloads key entries by product code
+            entries = [{"code": code, **entry} for code, entry in entries.items()]
+        for entry in entries:
+            line = entry_line(entry)
+            if line is not None:
+                lines[line["code"]] = line
+    return lines
+
+
+def entry_line(entry: dict) -> Optional[dict]:
+    """{code, name, quantity, price} for one cart or order entry, or None without a code."""
+    code = entry_code(entry)
+    if not code:
+        return None
+    return {
+        "code": code,
+        "name": (entry.get("product") or {}).get("name") or entry.get("name"),
+        "quantity": entry.get("quantity"),
+        "price": _entry_price(entry),
+    }
+
+
+def cart_subtotal(cart: Optional[dict]) -> Optional[float]:
+    """The cart subtotal as reported by the server, else the sum of the line prices."""
+    aggregations = (cart or {}).get("orderAggregations")
+    if isinstance(aggregations, dict):
+        aggregations = [{"type": k, "value": v} for k, v in aggregations.items()]
+    for agg in aggregations or []:
+        if not isinstance(agg, dict):
+            continue
+        if "subtotal" in str(agg.get("type") or agg.get("name") or "").lower():
+            return price_value(agg.get("value") if "value" in agg else agg.get("amount"))
+    prices = [line["price"] for line in cart_lines(cart).values() if line["price"] is not None]
+    return round(sum(prices), 2) if prices else None
+
+
+def cart_delta(before: Optional[dict], after: dict, codes: Optional[Iterable[str]] = None) -> dict:
+    """What changed between two cart snapshots, sized by the change rather than the cart.
+
+    With `codes`, only lines for those products are reported: a write coalesced with others
+    gets back a cart that also holds their changes, which its caller didn't make. lineCount and
+    the subtotals still describe the whole cart.
+    """
+    old, new = cart_lines(before), cart_lines(after)
+    line_count = len(new)
+    if codes is not None:
+        mine = set(codes)
+        old = {c: line for c, line in old.items() if c in mine}
+        new = {c: line for c, line in new.items() if c in mine}
+    changed = []
+    for code in sorted(old.keys() & new.keys()):
+        a, b = old[code], new[code]
+        if a["quantity"] != b["quantity"] or a["price"] != b["price"]:
+            changed.append({
+                "code": code,
+                "name": b["name"],
+                "quantity": {"from": a["quantity"], "to": b["quantity"]},
+                "price": {"from": a["price"], "to": b["price"]},
+            })
+    return {
+        "cartId": after.get("id"),
+        "added": [new[c] for c in sorted(new.keys() - old.keys())],
+        "removed": [old[c] for c in sorted(old.keys() - new.keys())],
+        "changed": changed,
+        "lineCount": line_count,
+        "subtotal": cart_subtotal(after),
+        "previousSubtotal": cart_subtotal(before),
+    }
+
+
+class CartWriteBatcher:
+    """Coalesces cart entry writes that arrive within a short window into one POST.
+
+    Agents tend to fire several `add_to_cart` calls in a row while settling on quantities.
+    Each `submit()` parks its entry in a pending map (last write wins per product code) and
+    blocks; the first submit of a window arms a timer, and when it fires all pending entries
+    go out as a single multi-entry POST. Every caller in the batch gets the resulting cart, or
+    the exception if the POST failed.
+    """
+
+    def __init__(self, send: Callable[[dict], dict], window: float):
+        self._send = send
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: dict = {}
+        self._waiters: list = []
+        self._timer: Optional[threading.Timer] = None
+        self.submitted = 0
+        self.flushes = 0
+
+    def submit(self, product_code: str, entry: dict) -> dict:
+        future: Future = Future()
+        with self._lock:
+            self._pending[product_code] = entry
+            self._waiters.append(future)
+            self.submitted += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future.result()
+
+    def _flush(self) -> None:
+        with self._lock:
+            entries, waiters = self._pending, self._waiters
+            self._pending, self._waiters, self._timer = {}, [], None
+            self.flushes += 1
+        try:
+            cart = self._send(entries)
+        except Exception as e:
+            for future in waiters:
+                future.set_exception(e)
+        else:
+            for future in waiters:
+                future.set_result(cart)
+
+
+def entries_applied(cart: Optional[dict], entries: dict) -> bool:
+    """True if `cart` already reflects every entry (absolute quantities; 0 means absent)."""
+    lines = cart_lines(cart)
+    for code, entry in entries.items():
+        quantity = entry.get("quantity")
+        if quantity == 0:
+            if code in lines:
+                return False
+        elif lines.get(code, {}).get("quantity") != quantity:
+            return False
+    return True
+
+
+class CartWriteLedger:
+    """Client-side operation ids for cart writes, so retries can't double-apply or go stale.
+
+    Cart writes set absolute quantities, so replaying one is harmless on its own. What isn't
+    harmless is a retry of an older write landing after a newer one for the same product, or
+    a caller re-sending a write that is still in flight. The ledger tracks the latest operation
+    per product code, so a retry only re-sends the entries it still owns, and it lets an
+    identical write join the in-flight one instead of going out twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._latest: dict = {}     # product code -> op id of the newest write touching it
+        self._inflight: dict = {}   # canonical entries -> Future of the op sending them
+        self.ops = 0
+        self.joined = 0
+        self.retries = 0
+        self.reconciled = 0
+        self.superseded = 0
+
+    @staticmethod
+    def _key(entries: dict) -> str:
+        return json.dumps(entries, sort_keys=True)
+
+    def begin(self, entries: dict):
+        """Register a write. Returns (op_id, None) for a new op, or (None, future) to join."""
+        key = self._key(entries)
+        with self._lock:
+            if key in self._inflight:
+                self.joined += 1
+                return None, self._inflight[key]
+            op_id = f"cart-op-{next(self._seq)}"
+            self._inflight[key] = Future()
+            for code in entries:
+                self._latest[code] = op_id
+            self.ops += 1
+            return op_id, None
+
+    def owned(self, op_id: str, entries: dict) -> dict:
+        """The subset of `entries` no newer write has superseded."""
+        with self._lock:
+            kept = {c: e for c, e in entries.items() if self._latest.get(c) == op_id}
+            self.superseded += len(entries) - len(kept)
+            return kept
+
+    def finish(self, entries: dict, cart: Optional[dict] = None,
+               error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            future = self._inflight.pop(self._key(entries), None)
+        if future is not None:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(cart)
+
+    def note(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        return {"ops": self.ops, "joined": self.joined, "retries": self.retries,
+                "reconciled": self.reconciled, "superseded": self.superseded}
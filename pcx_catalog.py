@@ -0,0 +1,40 @@
+"""Compact product views for tools that look at many products at once.
+
+Product-detail payloads carry far more than an agent needs to validate a shopping list.
+`availability()` keeps the answer to "can I buy this, and for how much": stock, price, and
+any deal. Field names follow the product-search results documented in API_REFERENCE.md.
+"""
+from typing import Any, Optional
+
+from pcx_cart import price_value
+
+# stockStatus values that mean the product can't be ordered right now.
+OUT_OF_STOCK = {"OUT_OF_STOCK", "OUT", "UNAVAILABLE", "NOT_AVAILABLE"}
+
+
+def availability(product: dict) -> dict:
+    """{name, inStock, stockStatus, price, deal} for a product detail or search result."""
+    status = product.get("stockStatus")
+    prices = product.get("prices") or {}
+    deal: Optional[dict] = None
+    deal_price = product.get("dealPrice") or (product.get("deal") or {}).get("price")
+    if deal_price is not None or product.get("offerType") or prices.get("wasPrice"):
+        deal = {
+            "price": price_value(deal_price),
+            "wasPrice": price_value(prices.get("wasPrice")),
+            "offerType": product.get("offerType"),
+            "text": (product.get("deal") or {}).get("text") or product.get("badges"),
+        }
+        deal = {k: v for k, v in deal.items() if v is not None}
+    return {
+        "name": product.get("name"),
+        "inStock": None if status is None else str(status).upper() not in OUT_OF_STOCK,
+        "stockStatus": status,
+        "price": price_value(prices.get("price")) if isinstance(prices, dict) else None,
+        "deal": deal,
+    }
+
+
+def unique(items: list) -> list[Any]:
+    """`items` without duplicates, first occurrence order kept."""
+    return list(dict.fromkeys(items))
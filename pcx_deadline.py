@@ -0,0 +1,154 @@
+"""Per-call deadlines and cancellation, carried from `call_tool` down to each upstream request.
+
+A tool call runs on a worker thread, so when the MCP client cancels it (or drops the /sse
+connection) the awaiting task goes away but the thread would carry on to the end. `call_tool`
+now gives each call a `CallContext` with a deadline and a cancel flag, in a context variable
+that `asyncio.to_thread` hands to the worker. From there:
+
+- `_request` refuses to start once the call is cancelled or out of time, and caps each
+  request's timeout at the time left;
+- a request waiting for an upstream slot stops waiting at the deadline, or as soon as the call
+  is cancelled (`on_cancel` wakes it);
+- fan-out workers (`bind`) see the same context, so the rest of a batch is skipped;
+- streamed bodies (`checked`) stop between chunks.
+
+A request already on the wire is not interrupted, but its timeout never runs past the deadline.
+Background work (cache warming, coalesced cart flushes) runs outside any call and is unaffected.
+
+Some tools get longer defaults (`TOOL_DEFAULTS`): the ones whose first call syncs up to
+PCEXPRESS_ANALYTICS_ORDERS order details, and cart writes, which may retry and read the cart
+back. A deadline those hit would stop them before they got anywhere, and every retry the same.
+
+    PCEXPRESS_TOOL_DEADLINE   seconds a tool call may take (default 30; 0 = no deadline)
+    PCEXPRESS_TOOL_DEADLINES  per-tool overrides, e.g. "search_products=10,suggest_restock=60"
+"""
+import contextvars
+import os
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+DEFAULT_DEADLINE = 30.0
+
+# Longer defaults, for tools that sync order details or write the cart (never below the default).
+TOOL_DEFAULTS = {
+    "purchase_analytics": 120.0,
+    "suggest_restock": 120.0,
+    "resolve_items": 120.0,
+    "search_past_orders": 120.0,
+    "add_to_cart": 60.0,
+    "remove_from_cart": 60.0,
+}
+
+
+class CallCancelled(Exception):
+    """The tool call was cancelled by the client; upstream work for it should stop."""
+
+
+class DeadlineExceeded(CallCancelled):
+    """The tool call ran out of time."""
+
+
+class CallContext:
+    """Deadline and cancel flag for one tool call."""
+
+    def __init__(self, tool: str, seconds: Optional[float]):
+        self.tool = tool
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._on_cancel: list = []
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled.set()
+            callbacks, self._on_cancel = self._on_cancel, []
+        for fn in callbacks:
+            fn()
+
+    def on_cancel(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Call `fn()` when the call is cancelled (now, if it already is). Returns an unregister."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._on_cancel.append(fn)
+                return lambda: self._forget(fn)
+        fn()
+        return lambda: None
+
+    def _forget(self, fn: Callable[[], None]) -> None:
+        with self._lock:
+            if fn in self._on_cancel:
+                self._on_cancel.remove(fn)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise CallCancelled(f"{self.tool} was cancelled")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"{self.tool} exceeded its {self.seconds:g}s deadline")
+
+
+current: contextvars.ContextVar = contextvars.ContextVar("pcx_call", default=None)
+
+
+def deadlines_from_env() -> tuple:
+    """(default seconds, {tool: seconds}) from PCEXPRESS_TOOL_DEADLINE(S)."""
+    default = float(os.getenv("PCEXPRESS_TOOL_DEADLINE", str(DEFAULT_DEADLINE)))
+    per_tool = {}
+    if default:
+        per_tool = {tool: max(default, seconds) for tool, seconds in TOOL_DEFAULTS.items()}
+    for part in os.getenv("PCEXPRESS_TOOL_DEADLINES", "").split(","):
+        tool, _, seconds = part.partition("=")
+        if tool.strip() and seconds.strip():
+            per_tool[tool.strip()] = float(seconds)
+    return default, per_tool
+
+
+def check() -> None:
+    """Raise CallCancelled/DeadlineExceeded if the current call should stop."""
+    call = current.get()
+    if call is not None:
+        call.check()
+
+
+def timeout(given: Optional[float]):
+    """`given` (a requests timeout) capped at the current call's remaining time."""
+    call = current.get()
+    remaining = call.remaining() if call is not None else None
+    if remaining is None:
+        return given
+    call.check()
+    if given is None:
+        return remaining
+    if isinstance(given, tuple):
+        return tuple(min(t, remaining) if t is not None else remaining for t in given)
+    return min(given, remaining)
+
+
+def bind(fn: Callable) -> Callable:
+    """`fn` wrapped to run under the caller's CallContext on another thread."""
+    call = current.get()
+
+    def run(*args, **kwargs):
+        token = current.set(call)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current.reset(token)
+
+    return run
+
+
+def checked(chunks: Iterable) -> Iterable:
+    """Yield from `chunks`, stopping with CallCancelled as soon as the call should stop."""
+    for chunk in chunks:
+        check()
+        yield chunk
@@ -0,0 +1,152 @@
+"""Hedged requests for idempotent reads.
+
+Product search and product-detail reads have a long tail: the median is a few hundred
+milliseconds, but now and then one takes seconds. `Hedger.run()` starts the request, and if it
+hasn't answered by the p95 latency seen for that kind of read, sends an identical second one
+and takes whichever answers first. Hedges are paid for from a budget that refills by `budget`
+per request (5% means at most about one extra request per twenty), so a slow upstream sees a
+few percent more load, not double.
+
+The pool only ever runs hedges, so it doesn't cap how many reads run at once: a read that can't
+be hedged (too few samples yet, or no budget) runs on the caller's thread, and one that can runs
+on a thread of its own while the caller waits for it or its hedge. A hedge that would have to
+queue for the pool is skipped (`busy`), since by then it would not arrive early.
+
+Only reads go through here; cart writes never do. Enable with PCEXPRESS_HEDGE_BUDGET (a
+fraction, e.g. 0.05; default 0 = off).
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+# Latencies kept per kind of read for the p95.
+WINDOW = 200
+
+# Don't hedge until the p95 rests on this many samples.
+MIN_SAMPLES = 20
+
+# Never hedge sooner than this, whatever the p95 says.
+MIN_DELAY = 0.05
+
+# Unspent hedges carried over, so a quiet spell doesn't bank an unlimited burst.
+MAX_CREDIT = 10.0
+
+
+class Hedger:
+    """Runs read calls with a delayed duplicate, within a hedge budget."""
+
+    def __init__(self, budget: float = 0.05, max_workers: int = 16):
+        self.budget = budget
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pcx-hedge")
+        self._lock = threading.Lock()
+        self._latency: dict = {}   # kind -> deque of recent latencies
+        self._credit = 1.0
+        self._hedging = 0          # hedges running in the pool
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+        self.busy = 0
+
+    def delay(self, kind: str):
+        """The p95 latency for `kind`, or None while there are too few samples."""
+        with self._lock:
+            samples = sorted(self._latency.get(kind, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return max(MIN_DELAY, samples[int(len(samples) * 0.95) - 1])
+
+    def _observe(self, kind: str, latency: float) -> None:
+        with self._lock:
+            self._latency.setdefault(kind, deque(maxlen=WINDOW)).append(latency)
+
+    def _timed(self, kind: str, fn: Callable):
+        start = time.monotonic()
+        result = fn()
+        self._observe(kind, time.monotonic() - start)
+        return result
+
+    def _hedge(self, kind: str, fn: Callable):
+        try:
+            return self._timed(kind, fn)
+        finally:
+            with self._lock:
+                self._hedging -= 1
+
+    def _primary(self, kind: str, fn: Callable) -> Future:
+        """Start `fn()` on a thread of its own, so the caller is free to take the hedge."""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self._timed(kind, fn))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="pcx-hedge-primary", daemon=True).start()
+        return future
+
+    def run(self, kind: str, fn: Callable, discard: Callable = lambda result: None):
+        """`fn()`, hedged once after the p95 delay for `kind`.
+
+        `discard(result)` is called on the losing result if both return (e.g. to close a
+        response). If the first to finish raised, the other is waited for; if both raise,
+        the first exception propagates.
+        """
+        with self._lock:
+            self.requests += 1
+            self._credit = min(MAX_CREDIT, self._credit + self.budget)
+            affordable = self._credit >= 1
+        delay = self.delay(kind)
+        if delay is None or not affordable:
+            return self._timed(kind, fn)  # nothing to hedge with: no reason to leave this thread
+        primary = self._primary(kind, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            hedge = None
+            if self._credit < 1:
+                self.over_budget += 1
+            elif self._hedging >= self.max_workers:
+                self.busy += 1
+            else:
+                self._credit -= 1
+                self.hedged += 1
+                self._hedging += 1
+                hedge = self._pool.submit(self._hedge, kind, fn)
+        if hedge is None:
+            return primary.result()
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is None:
+                first_error = first_error or next(iter(done)).exception()
+                continue
+            if winner is hedge:
+                with self._lock:
+                    self.hedge_wins += 1
+            for other in {primary, hedge} - {winner}:
+                other.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+            return winner.result()
+        raise first_error
+
+    def stats(self) -> dict:
+        return {
+            "budget": self.budget,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "over_budget": self.over_budget,
+            "busy": self.busy,
+            "p95_ms": {kind: round(d * 1000, 1)
+                       for kind in list(self._latency) if (d := self.delay(kind))},
+        }
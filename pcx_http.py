@@ -0,0 +1,127 @@
+"""HTTP transport shared by the PC Express API client and the PCID token manager.
+
+Both talk to a single TLS host each, repeatedly, so one `requests.Session` with a tuned
+adapter per host keeps their connections warm. Configuration (all optional):
+
+    PCEXPRESS_POOL_SIZE          keep-alive connections kept per host (default 10)
+    PCEXPRESS_POOL_SIZES         per-host overrides, e.g. "api.pcexpress.ca=16,accounts.pcid.ca=2"
+    PCEXPRESS_KEEPALIVE_IDLE     seconds before TCP keep-alive probes start (default 60, 0 = off)
+    PCEXPRESS_POOL_IDLE_TIMEOUT  drop a host's pooled connections after this many idle seconds
+                                 instead of reusing ones the far end has likely closed (default 240)
+
+`pool_stats()` reports per-host utilisation for /metrics.
+"""
+import os
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+API_HOST = "api.pcexpress.ca"
+PCID_HOST = "accounts.pcid.ca"
+
+DEFAULT_POOL_SIZE = 10
+
+
+def _keepalive_options(idle: int) -> list:
+    if idle <= 0:
+        return []
+    opts = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # Linux names; macOS only has TCP_KEEPALIVE (the idle time) and is fine with the defaults.
+    probes = (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", max(idle // 4, 1)), ("TCP_KEEPCNT", 4))
+    for name, value in probes:
+        if hasattr(socket, name):
+            opts.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return opts
+
+
+def _pool_sizes() -> dict:
+    sizes = {}
+    for part in os.getenv("PCEXPRESS_POOL_SIZES", "").split(","):
+        host, _, size = part.partition("=")
+        if host.strip() and size.strip():
+            sizes[host.strip()] = int(size)
+    return sizes
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter for one host with TCP keep-alive, idle expiry, and utilisation counters."""
+
+    def __init__(self, host: str, pool_size: int, keepalive_idle: int = 60,
+                 idle_timeout: float = 240):
+        self.host = host
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._socket_options = (HTTPConnection.default_socket_options
+                                + _keepalive_options(keepalive_idle))
+        self._lock = threading.Lock()
+        self._last_used = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.idle_resets = 0
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            now = time.monotonic()
+            if (self.idle_timeout and self.in_flight == 0 and self._last_used
+                    and now - self._last_used > self.idle_timeout):
+                # The far end has most likely closed these; reconnect instead of failing on one.
+                self.poolmanager.clear()
+                self.idle_resets += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.requests += 1
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self._last_used = time.monotonic()
+
+    def stats(self) -> dict:
+        idle = opened = 0
+        for key in list(self.poolmanager.pools.keys()):
+            pool = self.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            if pool.pool is not None:
+                # The queue is pre-filled with None placeholders; count real connections only.
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return {
+            "pool_size": self.pool_size,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "idle_connections": idle,
+            "connections_opened": opened,
+            "requests": self.requests,
+            "idle_resets": self.idle_resets,
+            "utilisation": round(self.in_flight / self.pool_size, 3) if self.pool_size else 0.0,
+        }
+
+
+def build_session(hosts: tuple = (API_HOST, PCID_HOST)) -> requests.Session:
+    """A session with a tuned `PooledAdapter` mounted for each of `hosts`."""
+    default_size = int(os.getenv("PCEXPRESS_POOL_SIZE", str(DEFAULT_POOL_SIZE)))
+    sizes = _pool_sizes()
+    keepalive_idle = int(os.getenv("PCEXPRESS_KEEPALIVE_IDLE", "60"))
+    idle_timeout = float(os.getenv("PCEXPRESS_POOL_IDLE_TIMEOUT", "240"))
+    session = requests.Session()
+    for host in hosts:
+        session.mount(f"https://{host}", PooledAdapter(
+            host, sizes.get(host, default_size), keepalive_idle, idle_timeout))
+    return session
+
+
+def pool_stats(session: requests.Session) -> dict:
+    """Per-host utilisation of every `PooledAdapter` mounted on `session`."""
+    return {a.host: a.stats() for a in session.adapters.values() if isinstance(a, PooledAdapter)}
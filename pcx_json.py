@@ -0,0 +1,48 @@
+"""JSON encode/decode for upstream payloads and tool output.
+
+Uses orjson when it is installed and falls back to the stdlib `json` module otherwise, so the
+dependency stays optional. Cart and order payloads are large enough that the parse and the
+pretty-print in `call_tool` show up in profiles; orjson does both several times faster.
+Set PCEXPRESS_JSON=stdlib to force the fallback (handy when comparing output).
+"""
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+if os.getenv("PCEXPRESS_JSON", "").lower() == "stdlib":
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def stdlib_loads(data: bytes | str) -> Any:
+    return json.loads(data)
+
+
+def stdlib_dumps(obj: Any, indent: bool = True) -> str:
+    # Match orjson's output: UTF-8 text rather than \u escapes, and no spaces when compact.
+    return json.dumps(obj, indent=2 if indent else None, separators=None if indent else (",", ":"),
+                      ensure_ascii=False)
+
+
+def loads(data: bytes | str) -> Any:
+    """Parse a JSON document from bytes (a response body) or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = True) -> str:
+    """Serialize `obj` to a str, two-space indented by default like the stdlib output."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+        except TypeError:
+            # orjson.JSONEncodeError (non-str keys, >64-bit ints); the stdlib copes with both.
+            pass
+    return stdlib_dumps(obj, indent)
@@ -0,0 +1,181 @@
+"""Adaptive cap on concurrent requests to api.pcexpress.ca.
+
+A fixed parallelism is wrong both ways: too low leaves latency on the table when the API is
+quiet, too high gets the account throttled when it isn't. `AdaptiveLimiter` finds the level
+as it goes, AIMD style:
+
+- every request that comes back fast (within `tolerance` x the baseline latency) while the
+  limit was actually in use raises the limit by 1/limit, so about +1 per round;
+- a request that comes back slow shaves a little off, so queueing upstream backs us off
+  before it turns into errors;
+- a 429, a 5xx, a timeout, or a dropped connection halves the limit, at most once per
+  round trip, so one burst of failures counts as one signal.
+
+The baseline is the lowest latency seen, drifting up 1% of the gap on every slower sample, so a
+route that has become permanently slower stops reading as overload after a hundred or so
+requests. Callers over the limit wait for a slot (they are worker threads, so they just block), in
+priority order, but never past their tool call's deadline or its cancellation, which end the
+wait with the call's `CallCancelled`/`DeadlineExceeded`:
+
+- WRITE: cart writes, which a user is waiting on and which are not safe to delay long;
+- READ: every other request made for a tool call;
+- BACKGROUND: requests made outside any tool call (cache warming, the start-up warm-up).
+
+A waiting request is only let in when nothing of a higher class is waiting. Background
+requests get at most `BACKGROUND_SHARE` of the limit, and only while interactive requests are
+using less than half of it, so background work pauses between requests as soon as tool calls
+pick up and resumes when they are done. Nothing is cancelled mid-request.
+
+Configuration (all optional):
+
+    PCEXPRESS_UPSTREAM_LIMIT      starting limit (default 8; 0 turns the limiter off)
+    PCEXPRESS_UPSTREAM_LIMIT_MAX  ceiling for the limit (default 32)
+"""
+import contextlib
+import threading
+import time
+
+import pcx_deadline
+
+# How far the baseline moves towards each slower sample.
+BASELINE_DRIFT = 0.01
+
+# Request classes, most urgent first.
+WRITE, READ, BACKGROUND = 0, 1, 2
+CLASSES = ("write", "read", "background")
+
+# Most of the limit background requests may hold at once.
+BACKGROUND_SHARE = 0.5
+
+
+class AdaptiveLimiter:
+    """Blocking concurrency limiter whose limit follows latency and overload signals."""
+
+    def __init__(self, initial: float = 8, min_limit: float = 1, max_limit: float = 32,
+                 tolerance: float = 2.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self._waiting = [0, 0, 0]     # per class
+        self._running = [0, 0, 0]
+        self.admitted = [0, 0, 0]
+        self.background_pauses = 0
+        self._baseline = None        # drifting minimum latency, seconds
+        self._smoothed = None        # EWMA latency, seconds
+        self._last_decrease = 0.0
+        self.requests = 0
+        self.overloads = 0
+        self.decreases = 0
+
+    def _may_start(self, priority: int) -> bool:
+        if self.in_flight >= int(self.limit) or any(self._waiting[:priority]):
+            return False
+        if priority == BACKGROUND:
+            interactive = self._running[WRITE] + self._running[READ]
+            return (self._running[BACKGROUND] < max(1, int(self.limit * BACKGROUND_SHARE))
+                    and interactive < self.limit / 2)
+        return True
+
+    @contextlib.contextmanager
+    def slot(self, priority: int = READ):
+        """Hold a request slot; yields a callable to report an overload before exiting.
+
+        A block that raises without reporting one releases the slot without a latency sample.
+        """
+        call = pcx_deadline.current.get()
+        forget = call.on_cancel(self._wake) if call is not None else (lambda: None)
+        try:
+            with self._cond:
+                self.waiting += 1
+                self._waiting[priority] += 1
+                paused = False
+                try:
+                    while not self._may_start(priority):
+                        room = self.in_flight < int(self.limit)
+                        if priority == BACKGROUND and not paused and room:
+                            paused = True  # there was room, but interactive work comes first
+                            self.background_pauses += 1
+                        if call is not None:
+                            call.check()
+                        self._cond.wait(call.remaining() if call is not None else None)
+                except BaseException:
+                    self._cond.notify_all()  # lower classes may have been waiting behind us
+                    raise
+                finally:
+                    self.waiting -= 1
+                    self._waiting[priority] -= 1
+                self.in_flight += 1
+                self._running[priority] += 1
+                self.admitted[priority] += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                in_use = self.in_flight
+        finally:
+            forget()
+        outcome = {"overloaded": False, "failed": False}
+        start = time.monotonic()
+        try:
+            yield lambda overloaded=True: outcome.update(overloaded=overloaded)
+        except BaseException:
+            outcome["failed"] = True
+            raise
+        finally:
+            self._record(time.monotonic() - start, outcome["overloaded"], in_use, priority,
+                         sample=not outcome["failed"])
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def _record(self, latency: float, overloaded: bool, in_use: int, priority: int,
+                sample: bool = True) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._running[priority] -= 1
+            self.requests += 1
+            now = time.monotonic()
+            if overloaded:
+                self.overloads += 1
+                # One halving per round trip: the rest of the burst is the same signal.
+                if now - self._last_decrease > (self._smoothed or latency):
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif sample:
+                self._observe(latency)
+                if latency <= self.tolerance * self._baseline:
+                    if in_use >= self.limit / 2:  # only grow a limit that is actually being used
+                        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                else:
+                    self.limit = max(self.min_limit, self.limit - 0.5 / self.limit)
+            self._cond.notify_all()
+
+    def _observe(self, latency: float) -> None:
+        if self._smoothed is None:
+            self._smoothed = latency
+        else:
+            self._smoothed += 0.1 * (latency - self._smoothed)
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            self._baseline += BASELINE_DRIFT * (latency - self._baseline)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "baseline_ms": round(self._baseline * 1000, 1) if self._baseline else None,
+            "latency_ms": round(self._smoothed * 1000, 1) if self._smoothed else None,
+            "classes": {name: {"waiting": self._waiting[i], "in_flight": self._running[i],
+                               "admitted": self.admitted[i]} for i, name in enumerate(CLASSES)},
+            "background_pauses": self.background_pauses,
+            "requests": self.requests,
+            "overloads": self.overloads,
+            "decreases": self.decreases,
+        }
@@ -0,0 +1,158 @@
+"""Local fuzzy matching over every product name the server has seen.
+
+The upstream search is exact-ish: "cheeerios" or a half-remembered "pc blue menu oat" returns
+poor results, and the agent retries with variations, one round trip each. `NameIndex` collects
+names from search results, product details, and order lines, and keeps two trigram postings:
+
+- words: every distinct name word, so `correct()` can swap a misspelled query word for the
+  closest known one (trigram candidates, confirmed by edit distance).
+- names: whole product names, so `match()` can offer codes directly when the query is most of
+  a known name.
+
+One index per API client, and so per banner. Everything is in memory; it refills as the server
+works and from the purchase ledger on each start.
+"""
+import re
+import threading
+from typing import Iterable, Optional
+
+from pcx_orders import normalize
+
+_WORD = re.compile(r"[a-z0-9%'&]+")
+
+# Candidates (by shared trigrams) checked with a full edit distance per misspelled word.
+CANDIDATES = 20
+
+# Fraction of the query's trigrams a name must contain to count as a direct match.
+MIN_MATCH = 0.6
+
+
+def words(text: Optional[str]) -> list[str]:
+    """The lowercased words of `text`, punctuation dropped."""
+    return _WORD.findall(normalize(text))
+
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word of `text`, padded so that prefixes weigh more than interiors."""
+    grams = set()
+    for word in _WORD.findall(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or `limit + 1` as soon as it is certain to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i]
+        for j, cb in enumerate(b, 1):
+            row.append(min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(row) > limit:
+            return limit + 1
+        prev = row
+    return prev[-1]
+
+
+def _max_edits(word: str) -> int:
+    return 1 if len(word) <= 5 else 2
+
+
+class NameIndex:
+    """Trigram index of product names and name words, for spelling fixes and direct matches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names: dict = {}       # code -> normalized name
+        self._labels: dict = {}      # code -> name as displayed
+        self._name_grams: dict = {}  # trigram -> {code}
+        self._gram_counts: dict = {}  # code -> number of trigrams in its name
+        self._words: dict = {}       # word -> occurrences across names
+        self._word_grams: dict = {}  # trigram -> {word}
+        self.corrections = 0
+        self.matches = 0
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, items: Iterable) -> None:
+        """Index (code, name) pairs; a code whose name changed is re-indexed."""
+        with self._lock:
+            for code, name in items:
+                key = normalize(name)
+                if not code or not key or self._names.get(code) == key:
+                    continue
+                if code in self._names:
+                    self._drop(code)
+                self._names[code] = key
+                self._labels[code] = name
+                grams = trigrams(key)
+                self._gram_counts[code] = len(grams)
+                for gram in grams:
+                    self._name_grams.setdefault(gram, set()).add(code)
+                for word in _WORD.findall(key):
+                    if word not in self._words:
+                        for gram in trigrams(word):
+                            self._word_grams.setdefault(gram, set()).add(word)
+                    self._words[word] = self._words.get(word, 0) + 1
+
+    def _drop(self, code: str) -> None:
+        for gram in trigrams(self._names[code]):
+            self._name_grams.get(gram, set()).discard(code)
+        for word in _WORD.findall(self._names[code]):
+            self._words[word] -= 1  # the word stays spellable; only its weight drops
+
+    def correct(self, query: str) -> str:
+        """`query` with each unknown word replaced by the closest known word, if one is close."""
+        given = words(query)
+        with self._lock:
+            fixed = [self._correct_word(word) for word in given]
+        if fixed != given:
+            self.corrections += 1
+        return " ".join(fixed)
+
+    def _correct_word(self, word: str) -> str:
+        if word in self._words or len(word) < 4 or any(c.isdigit() for c in word):
+            return word
+        shared: dict = {}
+        for gram in trigrams(word):
+            for candidate in self._word_grams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        limit = _max_edits(word)
+        best, best_key = word, None
+        for candidate in sorted(shared, key=shared.get, reverse=True)[:CANDIDATES]:
+            distance = edit_distance(word, candidate, limit)
+            key = (distance, -self._words.get(candidate, 0))
+            if distance <= limit and (best_key is None or key < best_key):
+                best, best_key = candidate, key
+        return best
+
+    def match(self, query: str, top: int = 5) -> list[dict]:
+        """Known products whose name contains most of `query`'s trigrams, best first."""
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+        with self._lock:
+            shared: dict = {}
+            for gram in grams:
+                for code in self._name_grams.get(gram, ()):
+                    shared[code] = shared.get(code, 0) + 1
+            scored = []
+            for code, n in shared.items():
+                coverage = n / len(grams)
+                if coverage >= MIN_MATCH:
+                    # Among equally covering names, prefer the one with the least left over.
+                    jaccard = n / (len(grams) + self._gram_counts[code] - n)
+                    scored.append((coverage, jaccard, code))
+            scored.sort(reverse=True)
+            matches = [{"code": code, "name": self._labels[code], "score": round(coverage, 2)}
+                       for coverage, _, code in scored[:top]]
+        if matches:
+            self.matches += 1
+        return matches
+
+    def stats(self) -> dict:
+        return {"names": len(self._names), "words": len(self._words),
+                "corrections": self.corrections, "matches": self.matches}
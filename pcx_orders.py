@@ -0,0 +1,236 @@
+"""Compact views of PC Express order-history payloads.
+
+Past-order detail bodies are as heavy as carts. `order_lines()` reduces one to the
+{code, name, quantity, price} lines an agent actually reads. The detail schema is only known
+from the app, so entries are looked for under each of the list keys it has been seen to use.
+
+`OrderIndex` keeps the history headers sorted by date so `search_past_orders` can filter by
+date range, store, and total without the model reading every order. `iter_json_array()` is
+the streaming alternative for very long histories: it parses orders as the body arrives and
+lets the caller stop after the first few matches.
+"""
+import bisect
+import re
+from typing import Iterable, Iterator, Optional
+
+import pcx_json
+from pcx_cart import entry_line, price_value
+
+# Keys a line-item list has been seen under, at the top level or inside "order"/"orders[*]".
+ENTRY_KEYS = ("entries", "orderEntries", "lineItems", "items", "products")
+
+
+def _entry_lists(detail: dict):
+    for container in (detail, detail.get("order") or {}, *(detail.get("orders") or [])):
+        if not isinstance(container, dict):
+            continue
+        for key in ENTRY_KEYS:
+            value = container.get(key)
+            if isinstance(value, list):
+                yield value
+
+
+def order_entries(detail: Optional[dict]) -> Iterator[dict]:
+    """The raw line-item entries of one order detail."""
+    for entries in _entry_lists(detail or {}):
+        for entry in entries:
+            if isinstance(entry, dict):
+                yield entry
+
+
+def order_lines(detail: Optional[dict]) -> list[dict]:
+    """Line items of one order detail as compact {code, name, quantity, price} dicts."""
+    lines = (entry_line(entry) for entry in order_entries(detail))
+    return [line for line in lines if line is not None]
+
+
+def order_id(order: dict) -> Optional[str]:
+    """The id of an order-history header (the API has used both spellings)."""
+    return order.get("orderId") or order.get("id") or order.get("orderNumber")
+
+
+def order_date(order: dict) -> str:
+    """The order's date as an ISO string ("" if it has none), comparable as text."""
+    for key in ("orderDate", "placedDate", "createdDate", "date", "pickupDate"):
+        value = order.get(key)
+        if value:
+            return str(value)
+    return ""
+
+
+def order_total(order: dict) -> Optional[float]:
+    for key in ("orderTotal", "total", "totalPrice", "orderAmount"):
+        if key in order:
+            return price_value(order[key])
+    return None
+
+
+def order_store(order: dict) -> str:
+    store = order.get("store")
+    if isinstance(store, dict):
+        store = " ".join(str(v) for v in (store.get("name"), store.get("id")) if v)
+    parts = (order.get("storeName"), order.get("storeId"), store)
+    return " ".join(str(p) for p in parts if p).lower()
+
+
+def normalize(text: Optional[str]) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def line_matches(line: dict, term: str) -> bool:
+    """`term` (already normalized) is in the line's name, or is its product code."""
+    return term in normalize(line.get("name")) or term == str(line.get("code") or "").lower()
+
+
+class OrderIndex:
+    """Order-history headers sorted by date, for range filtering without a full scan.
+
+    Built from one `get_historical_orders()` body and reused while the client keeps returning
+    that same object (the response cache hands back the identical dict when nothing changed).
+    """
+
+    def __init__(self, history: dict):
+        self.source = history
+        orders = history.get("orderHistory") or []
+        keyed = sorted(((order_date(o), i) for i, o in enumerate(orders)))
+        self._dates = [d for d, _ in keyed]
+        self._orders = [orders[i] for _, i in keyed]
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def filter(self, from_date: Optional[str] = None, to_date: Optional[str] = None,
+               store: Optional[str] = None, min_total: Optional[float] = None) -> list[dict]:
+        """Headers matching every given filter, newest first. Dates are inclusive YYYY-MM-DD."""
+        lo = bisect.bisect_left(self._dates, from_date) if from_date else 0
+        # Order dates carry a time part, so anything on to_date sorts below to_date + "~".
+        hi = bisect.bisect_right(self._dates, to_date + "~") if to_date else len(self._dates)
+        match = header_filter(store=store, min_total=min_total)
+        return [order for order in reversed(self._orders[lo:hi]) if match(order)]
+
+
+def header_filter(from_date: Optional[str] = None, to_date: Optional[str] = None,
+                  store: Optional[str] = None, min_total: Optional[float] = None):
+    """A predicate over order headers applying every given filter (dates inclusive)."""
+    store = normalize(store)
+
+    def match(order: dict) -> bool:
+        if from_date or to_date:
+            date = order_date(order)[:10]
+            if (from_date and date < from_date) or (to_date and date > to_date):
+                return False
+        if store and store not in order_store(order):
+            return False
+        if min_total is not None and (order_total(order) or 0) < min_total:
+            return False
+        return True
+
+    return match
+
+
+# Structural bytes outside strings, and the bytes that end or escape inside one.
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+_IN_STRING = re.compile(rb'["\\]')
+_QUOTE, _BACKSLASH = ord('"'), ord("\\")
+_SCALAR_END = re.compile(rb"[,\]]")
+_COUNT = re.compile(rb'"(onlineOrdersCount|offlineOrdersCount)"\s*:\s*(\d+)')
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str, meta: Optional[dict] = None) -> Iterator:
+    """Yield the elements of the array under `key` in a JSON object, parsing as bytes arrive.
+
+    Only the element being scanned is buffered, so memory stays flat however long the array
+    is, and a caller that stops iterating never reads the rest of the body. Each element is
+    handed to pcx_json as soon as its closing bracket arrives. Order-count fields seen outside
+    the array are recorded in `meta`, when given.
+    """
+    needle = re.compile(rb'(?<!\\)"' + re.escape(key.encode()) + rb'"\s*:\s*\[')
+    buf = bytearray()
+    chunks = iter(chunks)
+
+    def more() -> bool:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buf.extend(chunk)
+        return True
+
+    def note_counts(data) -> None:
+        if meta is not None:
+            for name, value in _COUNT.findall(bytes(data)):
+                meta[name.decode()] = int(value)
+
+    # 1. Find the array, keeping a key-sized tail between reads in case it straddles chunks.
+    while True:
+        m = needle.search(buf)
+        if m:
+            note_counts(buf[:m.start()])
+            del buf[:m.end()]
+            break
+        keep = len(key) + 64
+        if len(buf) > keep:
+            note_counts(buf)  # before trimming, so a field straddling the cut isn't lost
+            del buf[:-keep]
+        if not more():
+            note_counts(buf)
+            return
+
+    # 2. Scan elements one at a time.
+    pos = 0
+    while True:
+        while pos < len(buf) and buf[pos] in b" \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            del buf[:pos]
+            pos = 0
+            if not more():
+                return
+            continue
+        if buf[pos] == ord("]"):
+            del buf[:pos + 1]
+            for chunk in chunks:  # drained only when the caller reads to the end
+                buf.extend(chunk)
+            note_counts(buf)
+            return
+        start, end = pos, _element_end(buf, pos, more)
+        if end is None:
+            return
+        yield pcx_json.loads(bytes(buf[start:end]))
+        del buf[:end]
+        pos = 0
+
+
+def _element_end(buf: bytearray, start: int, more) -> Optional[int]:
+    """Index just past the JSON value starting at buf[start], reading more input as needed."""
+    if buf[start] not in b"{[":
+        # Scalar element (not seen in order history): it ends at the next comma or bracket.
+        while True:
+            m = _SCALAR_END.search(buf, start)
+            if m:
+                return m.start()
+            if not more():
+                return None
+    depth, pos, in_string = 0, start, False
+    while True:
+        m = (_IN_STRING if in_string else _STRUCTURAL).search(buf, pos)
+        if m is None:
+            pos = len(buf)
+            if not more():
+                return None
+            continue
+        ch, pos = buf[m.start()], m.start() + 1
+        if in_string:
+            if ch == _BACKSLASH:
+                if pos >= len(buf) and not more():
+                    return None
+                pos += 1  # skip the escaped byte
+            else:
+                in_string = False
+        elif ch == _QUOTE:
+            in_string = True
+        elif ch in b"{[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
@@ -0,0 +1,210 @@
+"""Which product the household means by a generic item name.
+
+"Milk" matches dozens of products, but a household buys the same one or two nearly every time.
+`PreferenceMap` keeps, for each normalized term, a score per product code from two sources:
+
+- order history: every word of a purchased item's name (less its brand) counts the order
+  towards that item. The head noun (the last word: "milk" in "2% Milk 4L", "bar" in "Milk
+  Chocolate Bar") counts in full, the other words only `MODIFIER_WEIGHT`, so "milk" means the
+  milk and not the chocolate bar. Sizes and percentages ("2%", "4l") are words too. A
+  several-word term ("2% milk") matches the items with every word in their name, each by its
+  number of orders. This side is rebuilt from the `PurchaseLedger` on every start, so it is
+  only ever kept in memory.
+- cart choices: when `add_to_cart` picks a code that a recent `search_products` call returned,
+  the search term is credited with `CHOICE_WEIGHT` for it. These are the only signal that can't
+  be recovered from the API, so they are persisted to a small JSON file in the state dir.
+  Worker processes share the file: each save adds this process's picks since its last save to
+  the counts on disk, under an exclusive lock on `<file>.lock`, so no worker's picks are lost.
+
+`resolve()` returns the best-scoring code for a term, but only when it is clearly the one: a
+score of at least `MIN_SCORE` (two orders under its head noun, or one pick) and more than
+`MIN_SHARE` of the term's total. Otherwise it returns None and the caller searches.
+"""
+import contextlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per state dir, so the thread lock is enough
+    fcntl = None
+
+from pcx_orders import normalize
+
+logger = logging.getLogger("pcexpress-mcp.preferences")
+
+# An explicit pick after a search outweighs a few incidental orders of something else.
+CHOICE_WEIGHT = 3
+
+# Search results remembered for attributing a later add_to_cart to its search term.
+RECENT_RESULTS = 500
+
+# What an order counts for under a word of the name that isn't its head noun.
+MODIFIER_WEIGHT = 0.25
+
+# A learned product is only used when it scores at least this, and more than this share of the term.
+MIN_SCORE = 2.0
+MIN_SHARE = 0.5
+
+# Words of 3+ letters, and sizes or percentages ("2%", "4l", "1.5kg").
+_WORD = re.compile(r"[a-z][a-z'&-]{2,}|\d[\d.]*[a-z%]*")
+_NOUN = re.compile(r"[a-z][a-z'&-]{2,}")
+
+
+def name_terms(name: Optional[str], brand: Optional[str] = None) -> list:
+    """Terms for a product name, in order: its words and sizes that aren't part of the brand."""
+    skip = set(_WORD.findall(normalize(brand)))
+    return list(dict.fromkeys(w for w in _WORD.findall(normalize(name)) if w not in skip))
+
+
+def head_noun(terms: list) -> Optional[str]:
+    """The last real word of a name's terms, which in grocery names is what the item is."""
+    return next((t for t in reversed(terms) if _NOUN.fullmatch(t)), None)
+
+
+class PreferenceMap:
+    """Normalized term -> preferred product code, learned from orders and cart choices."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._history: dict = {}    # term -> {code: weighted orders}
+        self._orders: dict = {}     # code -> orders
+        self._choices: dict = {}    # term -> {code: picks}; persisted
+        self._unsaved: dict = {}    # term -> {code: picks not yet added to the file}
+        self._names: dict = {}      # code -> display name
+        self._recent: OrderedDict = OrderedDict()  # code -> search term that last returned it
+        self.resolved = 0
+        self.unresolved = 0
+        self._load()
+
+    def _load(self) -> None:
+        """Take the pick counts on disk, plus our own not yet saved, as the current ones."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning("Could not read preferences (%s); starting empty", e)
+            return
+        # The file holds every worker's saved picks; ours since the last save are on top.
+        choices = {term: dict(picks) for term, picks in state.get("choices", {}).items()}
+        for term, picks in self._unsaved.items():
+            merged = choices.setdefault(term, {})
+            for code, n in picks.items():
+                merged[code] = merged.get(code, 0) + n
+        self._choices = choices
+        for code, name in state.get("names", {}).items():
+            self._names.setdefault(code, name)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive across processes sharing the file (a no-op without fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._file_lock():
+                self._load()
+                state = {
+                    "choices": self._choices,
+                    "names": {c: self._names[c] for picks in self._choices.values() for c in picks
+                              if c in self._names},
+                }
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp, self.path)
+                self._unsaved = {}
+        except OSError as e:
+            logger.warning("Could not save preferences: %s", e)
+
+    def learn_purchases(self, items: Iterable[dict]) -> None:
+        """Credit one order to each purchased item ({code, name, brand}) under its name terms."""
+        with self._lock:
+            for item in items:
+                code = item["code"]
+                self._names.setdefault(code, item.get("name"))
+                self._orders[code] = self._orders.get(code, 0) + 1
+                terms = name_terms(item.get("name"), item.get("brand"))
+                head = head_noun(terms)
+                for term in terms:
+                    scores = self._history.setdefault(term, {})
+                    scores[code] = scores.get(code, 0) + (1 if term == head else MODIFIER_WEIGHT)
+
+    def note_search(self, query: str, products: Iterable[dict]) -> None:
+        """Remember which term returned which codes, for `note_add`."""
+        term = normalize(query)
+        with self._lock:
+            for product in products:
+                code = product.get("code")
+                if not code:
+                    continue
+                self._names[code] = product.get("name") or self._names.get(code)
+                self._recent[code] = term
+                self._recent.move_to_end(code)
+            while len(self._recent) > RECENT_RESULTS:
+                self._recent.popitem(last=False)
+
+    def note_add(self, code: str) -> None:
+        """A product was put in the cart; if a recent search offered it, learn that choice."""
+        with self._lock:
+            term = self._recent.get(code)
+            if not term:
+                return
+            for table in (self._choices, self._unsaved):
+                picks = table.setdefault(term, {})
+                picks[code] = picks.get(code, 0) + 1
+            self._save()
+
+    def resolve(self, term: str) -> Optional[dict]:
+        """{code, name, source, share} for the preferred product, or None without a clear one."""
+        key = normalize(term)
+        with self._lock:
+            picks = self._choices.get(key, {})
+            scores = dict(self._history.get(key, {}))
+            words = _WORD.findall(key)
+            if not scores and words and words != [key]:
+                # "2% milk", "whole wheat bread": items bought with every word of the term in
+                # their name. That is specific enough to count each order in full.
+                tables = [self._history.get(w, {}) for w in words]
+                common = set(tables[0]).intersection(*tables[1:])
+                scores = {code: self._orders.get(code, 0) for code in common}
+            for code, n in picks.items():
+                scores[code] = scores.get(code, 0) + n * CHOICE_WEIGHT
+            code = max(scores, key=scores.get) if scores else None
+            total = sum(scores.values())
+            if code is None or scores[code] < MIN_SCORE or scores[code] <= MIN_SHARE * total:
+                self.unresolved += 1
+                return None
+            self.resolved += 1
+            return {
+                "code": code,
+                "name": self._names.get(code),
+                "source": "choice" if code in picks else "history",
+                # How dominant the pick is among everything the household bought under this term.
+                "share": round(scores[code] / total, 2),
+                "alternatives": len(scores) - 1,
+            }
+
+    def stats(self) -> dict:
+        return {"terms": len(self._history.keys() | self._choices.keys()),
+                "choices": len(self._choices), "resolved": self.resolved,
+                "unresolved": self.unresolved}
@@ -0,0 +1,257 @@
+"""Bookkeeping and limits for the SSE sessions of the HTTP server.
+
+Each /sse connection runs an MCP session for as long as the client holds it open. Clients that
+go away without closing (a restarted Home Assistant, a killed agent, a half-open connection
+through a proxy) used to leave their session, its tasks, and its buffers behind for good.
+`SessionTracker` records every session and bounds them:
+
+- a session with no messages and no tool calls running for `idle_timeout` seconds is closed
+  by `reap()`, which the server runs periodically;
+- at most `max_sessions` are open. A new connection over the cap takes the slot of the session
+  idle longest, if that one has been idle for `MIN_IDLE_TO_EVICT` seconds (or the idle
+  timeout, if that is shorter); otherwise it is refused with 503 and a Retry-After;
+- a session may have at most `max_pending` tool calls unanswered, so one client can't queue
+  up unbounded work behind the admission cap. That bounds a session's work, not its memory.
+
+Per session it counts messages, bytes received and sent, and calls in flight, and estimates the
+memory the session holds (`est_bytes`): `SESSION_OVERHEAD` for the session itself, plus the
+bodies of messages posted to it that it hasn't taken yet (the transport's streams have no
+buffer, so each waits in its POST handler), plus the arguments of its tool calls still
+running. Results are not counted: they go out as they are produced, into bytes_out. It is an
+estimate from sizes on the wire, not a measurement; `stats()` is the `sessions` section of
+/metrics, with the process's resident memory alongside for comparison.
+
+    PCEXPRESS_MAX_SESSIONS          SSE sessions open at once (default 32)
+    PCEXPRESS_SESSION_IDLE          seconds before an idle session is closed
+                                    (default 1800; 0 = never)
+    PCEXPRESS_SESSION_MAX_PENDING   unanswered tool calls per session (default 16)
+"""
+import os
+import re
+import time
+from typing import Callable, Optional
+
+# A session idle for less than this is never closed to make room for a new one.
+MIN_IDLE_TO_EVICT = 60.0
+
+# Resident memory of an open, idle session after the handshake: about 140 KiB per session with
+# 200 of them open against `python bench.py sessions`' server.
+SESSION_OVERHEAD = 140 * 1024
+
+# The SSE transport's first event tells the client where to post: ...?session_id=<hex>
+_SESSION_ID = re.compile(rb"session_id=([0-9a-f]{32})")
+
+
+class Session:
+    """One /sse connection and what it has cost so far."""
+
+    __slots__ = ("id", "caller", "opened", "last_active", "messages", "bytes_in", "bytes_out",
+                 "pending", "pending_bytes", "queued", "queued_bytes", "close", "closed_by")
+
+    def __init__(self, caller: str, close: Callable[[], None]):
+        self.id: Optional[str] = None   # known once the endpoint event has gone out
+        self.caller = caller
+        self.opened = self.last_active = time.monotonic()
+        self.messages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.pending = 0
+        self.pending_bytes = 0   # arguments of the tool calls running
+        self.queued = 0          # messages posted but not yet taken by the session
+        self.queued_bytes = 0
+        self.close = close
+        self.closed_by: Optional[str] = None
+
+    def idle(self, now: float) -> float:
+        return 0.0 if self.pending or self.queued else now - self.last_active
+
+    @property
+    def est_bytes(self) -> int:
+        """Estimated memory held for this session."""
+        return SESSION_OVERHEAD + self.queued_bytes + self.pending_bytes
+
+    def describe(self, now: float) -> dict:
+        return {
+            "caller": self.caller,
+            "age_s": round(now - self.opened),
+            "idle_s": round(self.idle(now)),
+            "messages": self.messages,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "pending": self.pending,
+            "pending_bytes": self.pending_bytes,
+            "queued": self.queued,
+            "queued_bytes": self.queued_bytes,
+            "est_bytes": self.est_bytes,
+        }
+
+
+class SessionTracker:
+    """Open SSE sessions, with an idle timeout, a cap, and per-session accounting.
+
+    Everything runs on the event loop, so there is no locking.
+    """
+
+    def __init__(self, max_sessions: int = 32, idle_timeout: float = 1800, max_pending: int = 16):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self._open: list[Session] = []
+        self._by_id: dict = {}
+        self.peak = 0
+        self.opened = 0
+        self.closed = 0
+        self.reaped = 0
+        self.evicted = 0
+        self.refused = 0
+        self.pending_refused = 0
+        self.bytes_in = 0   # totals, closed sessions included
+        self.bytes_out = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionTracker":
+        return cls(
+            max_sessions=int(os.getenv("PCEXPRESS_MAX_SESSIONS", "32")),
+            idle_timeout=float(os.getenv("PCEXPRESS_SESSION_IDLE", "1800")),
+            max_pending=int(os.getenv("PCEXPRESS_SESSION_MAX_PENDING", "16")),
+        )
+
+    @property
+    def min_idle_to_evict(self) -> float:
+        return min(MIN_IDLE_TO_EVICT, self.idle_timeout) if self.idle_timeout else MIN_IDLE_TO_EVICT
+
+    def open(self, caller: str, close: Callable[[], None]) -> Optional[Session]:
+        """Register a new connection, or return None if there is no room for it.
+
+        `close()` must end the session's `app.run` (e.g. by cancelling its scope).
+        """
+        now = time.monotonic()
+        if len(self._open) >= self.max_sessions:
+            stalest = max(self._open, key=lambda s: s.idle(now), default=None)
+            if stalest is None or stalest.idle(now) < self.min_idle_to_evict:
+                self.refused += 1
+                return None
+            self.evicted += 1
+            self._close(stalest, "evicted")
+        session = Session(caller, close)
+        self._open.append(session)
+        self.opened += 1
+        self.peak = max(self.peak, len(self._open))
+        return session
+
+    def caller(self, session_id: Optional[str]) -> Optional[str]:
+        """Who opened the session `session_id`, if it is one of ours."""
+        session = self._by_id.get(session_id) if session_id else None
+        return session.caller if session is not None else None
+
+    def retry_after(self) -> int:
+        """Seconds until the stalest open session could be evicted, for a refused connect."""
+        now = time.monotonic()
+        idle = max((s.idle(now) for s in self._open), default=0.0)
+        return max(1, int(self.min_idle_to_evict - idle))
+
+    def sent(self, session: Session, body: bytes) -> None:
+        """Account an SSE chunk sent to the client; the first one carries the session id."""
+        if session.id is None:
+            match = _SESSION_ID.search(body)
+            if match:
+                session.id = match.group(1).decode()
+                self._by_id[session.id] = session
+        session.bytes_out += len(body)
+        self.bytes_out += len(body)
+
+    def received(self, session_id: Optional[str], size: int, calls: int = 0) -> Optional[int]:
+        """Account a message posted to a session. Returns a Retry-After to refuse it, else None.
+
+        An accepted message counts as queued until `delivered()`. Unknown ids are let through,
+        so the transport can answer them as it always has.
+        """
+        session = self._by_id.get(session_id) if session_id else None
+        if session is None:
+            return None
+        if calls and session.pending + calls > self.max_pending:
+            self.pending_refused += 1
+            return 1
+        session.last_active = time.monotonic()
+        session.messages += 1
+        session.bytes_in += size
+        self.bytes_in += size
+        session.queued += 1
+        session.queued_bytes += size
+        return None
+
+    def delivered(self, session_id: Optional[str], size: int) -> None:
+        """A message `received()` accepted has been taken by the session (or dropped)."""
+        session = self._by_id.get(session_id) if session_id else None
+        if session is not None and session.queued:
+            session.queued -= 1
+            session.queued_bytes -= size
+
+    def call_started(self, session_id: Optional[str], size: int = 0) -> None:
+        """A tool call started; `size` is what its arguments take, for the estimate."""
+        session = self._by_id.get(session_id) if session_id else None
+        if session is not None:
+            session.pending += 1
+            session.pending_bytes += size
+
+    def call_finished(self, session_id: Optional[str], size: int = 0) -> None:
+        session = self._by_id.get(session_id) if session_id else None
+        if session is not None:
+            session.pending -= 1
+            session.pending_bytes -= size
+            session.last_active = time.monotonic()
+
+    def ended(self, session: Session) -> None:
+        """The session's connection is gone, however it ended."""
+        if session in self._open:
+            self._open.remove(session)
+            self.closed += 1
+        if session.id is not None:
+            self._by_id.pop(session.id, None)
+
+    def reap(self) -> int:
+        """Close every session idle past the timeout. Returns how many were closed."""
+        if not self.idle_timeout:
+            return 0
+        now = time.monotonic()
+        stale = [s for s in self._open if s.idle(now) >= self.idle_timeout]
+        for session in stale:
+            self._close(session, "idle")
+        self.reaped += len(stale)
+        return len(stale)
+
+    def _close(self, session: Session, reason: str) -> None:
+        session.closed_by = reason
+        self.ended(session)
+        session.close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        busiest = sorted(self._open, key=lambda s: (s.est_bytes, s.bytes_in + s.bytes_out),
+                         reverse=True)[:5]
+        return {
+            "open": len(self._open),
+            "peak": self.peak,
+            "max": self.max_sessions,
+            "idle_timeout_s": self.idle_timeout,
+            "opened": self.opened,
+            "closed": self.closed,
+            "reaped_idle": self.reaped,
+            "evicted": self.evicted,
+            "refused": self.refused,
+            "pending_refused": self.pending_refused,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "est_bytes": sum(s.est_bytes for s in self._open),
+            "busiest": [s.describe(now) for s in busiest],
+            "rss_bytes": rss_bytes(),
+        }
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident memory of this process (Linux only; None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
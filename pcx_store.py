@@ -0,0 +1,448 @@
+"""Size-budgeted, compressed on-disk store for the state directory.
+
+The state dir is usually a small volume (the k8s manifest asks for a 32Mi PVC) whose one job is
+to keep `pcid_token_state.json` alive across restarts. `DiskStore` lets caches persist there
+without putting that file at risk:
+
+- it only ever creates, reads, and deletes its own files, in a `store/` subdirectory;
+- values are JSON, zlib-compressed (order and product payloads shrink 6-10x);
+- the total compressed size is kept under `budget` bytes by evicting the entries worth least
+  per byte: each entry has a value (how costly it is to fetch again), scaled by how often it
+  has been read since start, and divided by its size; ties go to the least recently used.
+  A write never evicts an entry of a higher value than its own, so a product page can't push
+  out an order;
+- a write also backs off (evicting, then skipping) rather than leave less than `RESERVE`
+  bytes free on the volume, so the token file can always be rewritten;
+- writes go to a temp file that is fsynced and renamed into place, so a crash leaves either
+  the old entry or the new one. Leftover temp files and entries that fail to decode are
+  deleted on sight.
+
+The value of an entry is carried in its file name, so opening the store is one directory scan
+and no reads. `SharedStore` offers the same interface over SQLite, for several worker processes
+sharing one cache. Configuration:
+
+    PCEXPRESS_STORE_BUDGET_MB   on-disk cache budget in MiB (default 16; 0 turns it off)
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from typing import Any, Optional
+
+import pcx_json
+
+logger = logging.getLogger("pcexpress-mcp.store")
+
+# Free space always left on the volume for the token state and other small files.
+RESERVE = 1 << 20
+
+SUFFIX = ".z"
+
+
+class _Entry:
+    __slots__ = ("name", "size", "value", "reads", "used")
+
+    def __init__(self, name: str, size: int, value: float, used: float):
+        self.name = name
+        self.size = size
+        self.value = value
+        self.reads = 0
+        self.used = used
+
+    def worth(self) -> float:
+        return self.value * (1 + self.reads) / max(self.size, 1)
+
+
+class DiskStore:
+    """Key -> JSON value files under `directory`, compressed, within a byte budget."""
+
+    def __init__(self, directory: str, budget: int):
+        self.directory = directory
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._entries: dict = {}   # key digest -> _Entry
+        self.bytes = 0
+        self.raw_bytes = 0         # uncompressed size of what was written since start
+        self.written_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.skipped = 0
+        self.errors = 0
+        self._open()
+
+    def _open(self) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            listing = list(os.scandir(self.directory))
+        except OSError as e:
+            logger.warning("On-disk store unavailable (%s); running without it", e)
+            self.budget = 0
+            return
+        for item in listing:
+            if item.name.endswith(".tmp"):
+                self._remove(item.name)  # a write that never finished
+                continue
+            parsed = self._parse_name(item.name)
+            if parsed is None:
+                continue  # not ours; leave it alone
+            digest, value = parsed
+            stat = item.stat()
+            if digest in self._entries:  # an older copy under a different value
+                self._forget(digest)
+            self._entries[digest] = _Entry(item.name, stat.st_size, value, stat.st_mtime)
+            self.bytes += stat.st_size
+        with self._lock:
+            self._evict(0)
+
+    @staticmethod
+    def _parse_name(name: str) -> Optional[tuple]:
+        # <sha1 of key>.<value>.z
+        if not name.endswith(SUFFIX):
+            return None
+        digest, _, value = name[:-len(SUFFIX)].partition(".")
+        if len(digest) != 40:
+            return None
+        try:
+            return digest, float(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """The stored value for `key`, or None."""
+        if not self.budget:
+            return None
+        digest = self._digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            name = entry.name
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                record = pcx_json.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, ValueError) as e:
+            logger.warning("Dropping unreadable store entry %s: %s", name, e)
+            with self._lock:
+                self.errors += 1
+                self._forget(digest)
+            return None
+        if record.get("key") != key:  # a digest collision; vanishingly unlikely
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            if self._entries.get(digest) is entry:
+                entry.reads += 1
+                entry.used = time.time()
+            self.hits += 1
+        return record.get("data")
+
+    def put(self, key: str, data: Any, value: float = 1.0) -> bool:
+        """Store `data` under `key`, evicting lower-value entries to stay in budget.
+
+        `value` is the relative cost of losing the entry (e.g. 4 for something that takes a
+        slow request to rebuild, 1 for a cheap one). Returns False if it was not stored.
+        """
+        if not self.budget:
+            return False
+        raw = pcx_json.dumps({"key": key, "data": data}, indent=False).encode()
+        blob = zlib.compress(raw, 6)
+        digest = self._digest(key)
+        name = f"{digest}.{value:g}{SUFFIX}"
+        with self._lock:
+            old = self._entries.get(digest)
+            reclaim = old.size if old else 0
+            if len(blob) > self.budget // 4 or not self._evict(len(blob) - reclaim, value):
+                self.skipped += 1
+                return False
+            self.bytes += len(blob)  # held for the write, so concurrent puts see it
+        # Written outside the lock: an fsync on a network volume can take a while.
+        tmp = os.path.join(self.directory, f"{name}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(self.directory, name))
+        except OSError as e:
+            logger.warning("Could not write store entry: %s", e)
+            self._remove(os.path.basename(tmp))
+            with self._lock:
+                self.bytes -= len(blob)
+                self.errors += 1
+            return False
+        with self._lock:
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self.bytes -= old.size
+                # Same value means the rename already replaced the old file.
+                if old.name != name:
+                    self._remove(old.name)
+            self._entries[digest] = _Entry(name, len(blob), value, time.time())
+            self.raw_bytes += len(raw)
+            self.written_bytes += len(blob)
+            self.writes += 1
+        return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._forget(self._digest(key))
+
+    def _evict(self, needed: int, value: Optional[float] = None) -> bool:
+        """Free room for `needed` more bytes, cheapest per byte first. Caller holds the lock.
+
+        With `value`, only entries of no higher value than the incoming one are evicted for it;
+        returns False if that isn't enough.
+        """
+        free = self._free()
+        over = self.bytes + needed - self.budget
+        if free is not None:
+            over = max(over, RESERVE + needed - free)
+        if over <= 0:
+            return True
+        victims = sorted(self._entries.items(), key=lambda kv: (kv[1].worth(), kv[1].used))
+        for digest, entry in victims:
+            if over <= 0:
+                break
+            if value is not None and entry.value > value:
+                return False
+            over -= entry.size
+            self._forget(digest)
+            self.evictions += 1
+        return over <= 0
+
+    def _free(self) -> Optional[int]:
+        return _free(self.directory)
+
+    def _forget(self, digest: str) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self.bytes -= entry.size
+            self._remove(entry.name)
+
+    def _remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not remove store entry %s: %s", name, e)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "budget": self.budget,
+            "compression": (round(self.raw_bytes / self.written_bytes, 1)
+                            if self.written_bytes else None),
+            "disk_free": self._free(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+class SharedStore:
+    """The DiskStore interface over one SQLite file in WAL mode, shared by several processes.
+
+    Used instead of `DiskStore` when the HTTP server runs more than one worker process, since a
+    DiskStore keeps its index in memory and would not see the other workers' writes. Same
+    budget, value-per-byte eviction, and free-space reserve; SQLite provides the atomicity, and
+    writers on different processes queue on its write lock. Reads bump a read counter, so an
+    entry one worker keeps reading is worth more to all of them.
+
+    Entries a single-process `DiskStore` left in the same directory are deleted on open: this
+    store neither counts nor evicts them, so they would sit outside its budget for good and
+    eat into the volume's `RESERVE`.
+    """
+
+    def __init__(self, path: str, budget: int):
+        self.path = path
+        self.budget = budget
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.skipped = 0
+        self.errors = 0
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with self._db() as db:
+                db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB, "
+                           "size INTEGER, value REAL, reads INTEGER DEFAULT 0, used REAL)")
+        except Exception as e:  # sqlite3.Error, OSError
+            logger.warning("Shared store unavailable (%s); running without it", e)
+            self.budget = 0
+            return
+        self._purge_disk_entries(os.path.dirname(path) or ".")
+
+    @staticmethod
+    def _purge_disk_entries(directory: str) -> None:
+        removed = 0
+        try:
+            listing = list(os.scandir(directory))
+        except OSError:
+            return
+        for item in listing:
+            if DiskStore._parse_name(item.name) is None and not item.name.endswith(".tmp"):
+                continue
+            try:
+                os.remove(item.path)
+                removed += 1
+            except OSError:
+                pass  # another worker got there first
+        if removed:
+            logger.info("Removed %d single-process store files from %s", removed, directory)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            import sqlite3
+
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            # WAL stays consistent at NORMAL; a power cut may lose the last writes.
+            db.execute("PRAGMA synchronous=NORMAL")
+            # Checkpoint often and truncate the log after, so it stays a small part of the volume.
+            db.execute("PRAGMA wal_autocheckpoint=256")
+            db.execute("PRAGMA journal_size_limit=%d" % (1 << 20))
+            self._local.db = db
+        return _Transaction(db)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.budget:
+            return None
+        try:
+            with self._db() as db:
+                row = db.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE entries SET reads = reads + 1, used = ? WHERE key = ?",
+                               (time.time(), key))
+            data = pcx_json.loads(zlib.decompress(row[0])) if row is not None else None
+        except Exception as e:  # sqlite3.Error, zlib.error, ValueError
+            logger.warning("Shared store read failed for %s: %s", key, e)
+            self.errors += 1
+            self.delete(key)
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: Any, value: float = 1.0) -> bool:
+        if not self.budget:
+            return False
+        blob = zlib.compress(pcx_json.dumps(data, indent=False).encode(), 6)
+        size = len(blob)
+        if size > self.budget // 4:
+            self.skipped += 1
+            return False
+        try:
+            with self._db() as db:
+                db.execute("BEGIN IMMEDIATE")
+                row = db.execute("SELECT COALESCE(SUM(size), 0), "
+                                 "COALESCE(SUM(CASE WHEN key = ? THEN size END), 0) FROM entries",
+                                 (key,)).fetchone()
+                over = row[0] - row[1] + size - self.budget
+                free = _free(os.path.dirname(self.path) or ".")
+                if free is not None:
+                    over = max(over, RESERVE + size - free)
+                if over > 0 and not self._evict(db, over, value, key):
+                    db.execute("ROLLBACK")
+                    self.skipped += 1
+                    return False
+                db.execute("INSERT OR REPLACE INTO entries (key, data, size, value, reads, used) "
+                           "VALUES (?, ?, ?, ?, 0, ?)", (key, blob, size, value, time.time()))
+                db.execute("COMMIT")
+        except Exception as e:
+            logger.warning("Shared store write failed for %s: %s", key, e)
+            self.errors += 1
+            return False
+        self.writes += 1
+        return True
+
+    def _evict(self, db, over: int, value: float, key: str) -> bool:
+        victims = db.execute("SELECT key, size, value FROM entries WHERE key != ? "
+                             "ORDER BY value * (1 + reads) / MAX(size, 1), used", (key,))
+        doomed = []
+        for victim, size, victim_value in victims:
+            if over <= 0:
+                break
+            if victim_value > value:
+                return False
+            doomed.append((victim,))
+            over -= size
+        if over > 0:
+            return False
+        db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+        return True
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._db() as db:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except Exception as e:
+            logger.warning("Shared store delete failed for %s: %s", key, e)
+
+    def stats(self) -> dict:
+        entries = size = None
+        if self.budget:
+            try:
+                with self._db() as db:
+                    entries, size = db.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            except Exception:
+                pass
+        files = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal", self.path + "-shm")
+                    if os.path.exists(p))
+        return {
+            "entries": entries,
+            "bytes": size,
+            "file_bytes": files,
+            "budget": self.budget,
+            "disk_free": _free(os.path.dirname(self.path) or "."),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+class _Transaction:
+    """`with` wrapper that hands out the connection and rolls back an open transaction on error."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.db.in_transaction:
+            self.db.execute("ROLLBACK")
+        return False
+
+
+def _free(directory: str) -> Optional[int]:
+    try:
+        return shutil.disk_usage(directory).free
+    except OSError:
+        return None
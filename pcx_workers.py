@@ -0,0 +1,178 @@
+"""Several HTTP worker processes behind one port.
+
+One uvicorn process runs all the JSON work of every tool call on one core. With
+PCEXPRESS_WORKERS=N, `main_http` starts N uvicorn workers on the same port instead. The
+kernel spreads connections across them, so different MCP sessions run on different cores.
+They share:
+
+- the access token, through the token state file: only the worker that takes the state lock
+  first rotates the refresh token, and the others adopt the result (see pcid_token);
+- the response cache, through a `pcx_store.SharedStore` (SQLite in WAL mode) in the state dir,
+  so an order one worker fetched is a conditional GET for the rest.
+
+An SSE session lives in the worker that accepted its /sse connection, but the client posts
+its messages on another connection, which may reach any worker. A worker that gets a message
+for a session it doesn't know offers it to its siblings over a unix socket each (`PeerRouter`);
+the one that owns the session answers. Sessions themselves are never moved.
+
+Everything else (admission control, the upstream limiter, /metrics) is per worker, so limits
+such as PCEXPRESS_MAX_IN_FLIGHT apply to each worker separately.
+
+    PCEXPRESS_WORKERS   uvicorn worker processes for --http (default 1)
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+import pcx_json
+
+logger = logging.getLogger("pcexpress-mcp.workers")
+
+# Longest forwarded message or reply line; the MCP transport caps POST bodies well below this.
+MAX_MESSAGE = 16 << 20
+
+
+class PeerRouter:
+    """Unix-socket forwarding of /messages/ posts between sibling workers."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"worker-{os.getpid()}.sock")
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.forwarded = 0    # posts we handed to a sibling
+        self.received = 0     # posts a sibling handed to us
+        self.unroutable = 0   # posts no worker had a session for
+
+    async def start(self, handle: Callable[[dict], Awaitable[dict]]) -> None:
+        """Listen for siblings' posts; `handle(request)` answers {status, headers, body}."""
+
+        async def serve(reader, writer):
+            try:
+                request = pcx_json.loads(await reader.readline())
+                self.received += 1
+                response = await handle(request)
+                writer.write(pcx_json.dumps(response, indent=False).encode() + b"\n")
+                await writer.drain()
+            except Exception as e:
+                logger.warning("Forwarded message failed: %s", e)
+            finally:
+                writer.close()
+
+        self._server = await asyncio.start_unix_server(serve, path=self.path, limit=MAX_MESSAGE)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def peers(self) -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, n) for n in sorted(names)
+                if n.endswith(".sock") and os.path.join(self.directory, n) != self.path]
+
+    async def forward(self, request: dict) -> Optional[dict]:
+        """Offer `request` to each sibling in turn; the first answer other than 404 wins."""
+        line = pcx_json.dumps(request, indent=False).encode() + b"\n"
+        for path in self.peers():
+            try:
+                reader, writer = await asyncio.open_unix_connection(path, limit=MAX_MESSAGE)
+            except OSError:
+                continue  # a worker that has exited or not started yet
+            try:
+                writer.write(line)
+                await writer.drain()
+                reply = await reader.readline()
+                # Without its newline the line was cut short: the worker died mid-answer.
+                response = pcx_json.loads(reply) if reply.endswith(b"\n") else None
+            except (OSError, ValueError):
+                continue  # a worker that went away mid-exchange, or an unreadable answer
+            finally:
+                writer.close()
+            if not isinstance(response, dict) or "status" not in response:
+                continue
+            if response["status"] != 404:
+                self.forwarded += 1
+                return response
+        self.unroutable += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "worker": os.getpid(),
+            "peers": len(self.peers()),
+            "forwarded": self.forwarded,
+            "received": self.received,
+            "unroutable": self.unroutable,
+        }
+
+
+def encode_request(scope: dict, body: bytes) -> dict:
+    """The parts of an ASGI POST a sibling needs to replay it."""
+    return {
+        "path": scope.get("path", ""),
+        "query": scope.get("query_string", b"").decode("latin-1"),
+        "headers": [[k.decode("latin-1"), v.decode("latin-1")]
+                    for k, v in scope.get("headers", ())],
+        "client": list(scope["client"]) if scope.get("client") else None,
+        "body": body.decode("latin-1"),
+    }
+
+
+def decode_request(request: dict) -> tuple:
+    """(ASGI scope, body) for a request made by `encode_request`."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": request["path"],
+        "raw_path": request["path"].encode(),
+        "root_path": "",
+        "query_string": request["query"].encode("latin-1"),
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in request["headers"]],
+        "client": tuple(request["client"]) if request.get("client") else None,
+        "server": None,
+    }
+    return scope, request["body"].encode("latin-1")
+
+
+async def call_asgi(asgi_app: Callable, scope: dict, body: bytes) -> dict:
+    """Run `asgi_app` on a buffered request and capture its response as {status, headers, body}."""
+    response = {"status": 500, "headers": [], "body": ""}
+    chunks = []
+    delivered = False
+
+    async def receive():
+        nonlocal delivered
+        if delivered:
+            return {"type": "http.disconnect"}
+        delivered = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = [[k.decode("latin-1"), v.decode("latin-1")]
+                                   for k, v in message.get("headers", ())]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await asgi_app(scope, receive, send)
+    response["body"] = b"".join(chunks).decode("latin-1")
+    return response
+
+
+async def send_response(response: dict, send: Callable) -> None:
+    """Send a captured response to the client."""
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in response["headers"]]
+    await send({"type": "http.response.start", "status": response["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": response["body"].encode("latin-1")})
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The server's modules live at the repository root.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class StaticToken:
+    """Stands in for TokenManager where no request reaches PC Express (tests, bench.py stubs)."""
+
+    def get_access_token(self, force: bool = False) -> str:
+        return "test"
+
+
+@pytest.fixture
+def token() -> StaticToken:
+    return StaticToken()
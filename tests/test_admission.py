@@ -0,0 +1,47 @@
+"""What the SSE server's admission control charges for."""
+import pcx_admission
+import pcx_sessions
+from pcexpress_mcp_server import _called_tools
+
+
+def test_only_connects_and_tool_calls_are_charged():
+    admission = pcx_admission.Admission(rate=(0.001, 2))
+    assert admission.check("a", connect=True) is None
+    assert admission.check("a", ("search_products",)) is None
+    assert admission.check("a", ("search_products",))   # bucket empty: refused
+    assert admission.check("a", connect=True)
+    # Everything else still gets through, notably cancelling an in-flight call.
+    for body in (b'{"jsonrpc":"2.0","method":"notifications/cancelled","params":{"requestId":3}}',
+                 b'{"jsonrpc":"2.0","id":4,"method":"tools/list"}',
+                 b'{"jsonrpc":"2.0","id":5,"method":"ping"}',
+                 b'{"jsonrpc":"2.0","id":1,"result":{}}'):
+        assert admission.check("a", _called_tools(body)) is None, body
+    assert admission.check("b", connect=True) is None   # other callers have their own bucket
+
+
+def test_batch_is_charged_per_tool_call():
+    admission = pcx_admission.Admission(rate=(0.001, 2))
+    batch = (b'[{"jsonrpc":"2.0","id":1,"method":"tools/call","params":{"name":"view_cart"}},'
+             b'{"jsonrpc":"2.0","method":"notifications/initialized"},'
+             b'{"jsonrpc":"2.0","id":2,"method":"tools/call","params":{"name":"view_cart"}}]')
+    assert _called_tools(batch) == ("view_cart", "view_cart")
+    assert admission.check("a", _called_tools(batch)) is None
+    assert admission.check("a", ("view_cart",))
+
+
+def test_refused_batch_costs_nothing():
+    admission = pcx_admission.Admission(rate=(0.001, 3), tool_rates={"resolve_items": (0.001, 1)})
+    assert admission.check("a", ("resolve_items", "resolve_items"))   # tool bucket holds one
+    assert admission.stats()["rejected"]["tool_rate"] == 1
+    # The caller bucket was not drawn on by the refused batch: three calls still fit.
+    assert admission.check("a", ("view_cart", "view_cart", "resolve_items")) is None
+    assert admission.check("a", ("view_cart",))
+
+
+def test_messages_are_charged_to_the_session_owner():
+    tracker = pcx_sessions.SessionTracker()
+    session = tracker.open("bearer-1", lambda: None)
+    tracker.sent(session, b"data: /messages/?session_id=" + b"a" * 32 + b"\n\n")
+    assert tracker.caller("a" * 32) == "bearer-1"
+    assert tracker.caller("b" * 32) is None
+    assert tracker.caller(None) is None
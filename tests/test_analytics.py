@@ -0,0 +1,60 @@
+"""Restock cadence under concurrent syncs and queries."""
+import sys
+import threading
+from datetime import date
+
+import pcx_analytics
+
+
+def _entry(code: str) -> dict:
+    return {"product": {"code": code, "name": f"Item {code}"}, "quantity": 1}
+
+
+def test_restock_due_while_orders_arrive():
+    ledger = pcx_analytics.PurchaseLedger()
+    model = pcx_analytics.RestockModel(ledger)
+    start = date(2024, 1, 1).toordinal()
+    errors = []
+
+    def sync():
+        for week in range(10):
+            for n in range(40):
+                entries = [_entry(f"{n * 10 + i}_EA") for i in range(10)]
+                ledger.add_order(f"o{week}-{n}", start + 7 * week, entries)
+
+    def query():
+        try:
+            while syncing.is_alive():
+                model.due(today=start + 80, horizon_days=400, top=100)
+        except Exception as e:  # e.g. "dictionary changed size during iteration"
+            errors.append(e)
+
+    syncing = threading.Thread(target=sync)
+    threads = [syncing] + [threading.Thread(target=query) for _ in range(4)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often enough to hit the window
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    due = model.due(today=start + 70, horizon_days=7, top=400)
+    assert {s["code"] for s in due} == {f"{i}_EA" for i in range(400)}
+    assert all(s["intervalDays"] == 7 for s in due)
+
+
+def test_order_with_an_unreadable_line_is_left_out_whole():
+    ledger = pcx_analytics.PurchaseLedger()
+    day = date(2024, 1, 1).toordinal()
+    bad = [_entry("A"), {"product": {"code": "B", "name": "B"}, "quantity": "two"}]
+    try:
+        ledger.add_order("o1", day, bad)
+    except ValueError:
+        pass
+    assert len(ledger) == 0 and len(ledger.day) == 0
+    # The next sync, with the line fixed, records it in full.
+    assert ledger.add_order("o1", day, [_entry("A"), _entry("B")])
+    assert len(ledger) == 1 and len(ledger.day) == 2
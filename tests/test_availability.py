@@ -0,0 +1,57 @@
+"""check_availability: one fetch per distinct code, cached details reused, failures per code."""
+import json
+import threading
+
+import pytest
+import requests
+
+from pcexpress_mcp_server import PCExpressAPI
+
+PRODUCTS = {
+    "milk": {"name": "2% Milk", "stockStatus": "OK", "prices": {"price": {"value": 5.49}}},
+    "eggs": {"name": "Large Eggs", "stockStatus": "OUT_OF_STOCK",
+             "prices": {"price": {"value": 4.29}}},
+}
+
+
+@pytest.fixture
+def api(token):
+    api = PCExpressAPI(token, "cart")
+    api.fetched = []
+    lock = threading.Lock()
+
+    def read(kind, method, url, headers=None, **kwargs):
+        code = url.rsplit("/", 1)[1]
+        with lock:
+            api.fetched.append(code)
+        if code not in PRODUCTS:
+            raise requests.HTTPError(f"404 for {code}")
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps(PRODUCTS[code]).encode()
+        return resp
+
+    api._read = read
+    return api
+
+
+def test_each_code_is_fetched_once_and_reported(api):
+    result = api.check_availability(["milk", "eggs", "milk"])
+    assert sorted(api.fetched) == ["eggs", "milk"]
+    assert list(result) == ["milk", "eggs"]
+    assert result["milk"]["inStock"] is True and result["milk"]["price"] == 5.49
+    assert result["eggs"]["inStock"] is False
+
+
+def test_one_failed_code_does_not_sink_the_rest(api):
+    result = api.check_availability(["milk", "gone"])
+    assert result["gone"] == {"error": "404 for gone"}
+    assert result["milk"]["name"] == "2% Milk"
+
+
+def test_recent_details_are_reused_within_max_age(api):
+    api.check_availability(["milk"])
+    api.check_availability(["milk"], max_age=300)
+    assert api.fetched == ["milk"]
+    api.check_availability(["milk"], max_age=0)
+    assert api.fetched == ["milk", "milk"]
@@ -0,0 +1,80 @@
+"""ResponseCache: validators, digest fallback, persistence, and a 304 after eviction."""
+import pytest
+import requests
+
+import pcx_store
+from pcx_cache import NotCached, ResponseCache
+
+URL = "https://api.example/product/1"
+
+
+def _response(status: int = 200, body: bytes = b'{"code": "A"}', **headers) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body if status == 200 else b""
+    resp.headers.update({k.replace("_", "-"): v for k, v in headers.items()})
+    return resp
+
+
+def test_etag_revalidation_serves_the_cached_body():
+    cache = ResponseCache()
+    first = cache.resolve(URL, _response(ETag='"v1"'))
+    assert cache.conditional_headers(URL) == {"If-None-Match": '"v1"'}
+    assert cache.resolve(URL, _response(304)) is first
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_last_modified_is_sent_back():
+    cache = ResponseCache()
+    cache.resolve(URL, _response(Last_Modified="Mon, 19 Oct 2026 00:00:00 GMT"))
+    assert cache.conditional_headers(URL) == {"If-Modified-Since": "Mon, 19 Oct 2026 00:00:00 GMT"}
+
+
+def test_unchanged_body_without_validators_skips_the_parse():
+    cache = ResponseCache()
+    first = cache.resolve(URL, _response())
+    assert cache.conditional_headers(URL) == {}
+    assert cache.resolve(URL, _response()) is first
+    changed = cache.resolve(URL, _response(body=b'{"code": "B"}'))
+    assert changed == {"code": "B"}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_304_for_an_evicted_entry_raises_not_cached():
+    cache = ResponseCache(max_entries=1)
+    cache.resolve(URL, _response(ETag='"v1"'))
+    cache.resolve("https://api.example/other", _response())
+    with pytest.raises(NotCached):
+        cache.resolve(URL, _response(304))
+
+
+def test_persisted_entries_survive_a_restart(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 100_000)
+    ResponseCache(store=store, persist={"/product/": 1}).resolve(URL, _response(ETag='"v1"'))
+    cart = "https://api.example/cart"
+    ResponseCache(store=store, persist={"/product/": 1}).resolve(cart, _response())
+
+    reopened = ResponseCache(store=pcx_store.DiskStore(str(tmp_path), 100_000),
+                             persist={"/product/": 1})
+    assert reopened.conditional_headers(URL) == {"If-None-Match": '"v1"'}
+    assert reopened.fresh(URL, max_age=60) == {"code": "A"}
+    assert reopened.get(cart) is None   # not a persisted kind
+
+
+def test_get_json_resends_in_full_after_a_304_for_an_evicted_entry(token):
+    from pcexpress_mcp_server import PCExpressAPI
+
+    api = PCExpressAPI(token, "cart")
+    sent = []
+
+    def request(method, url, headers=None, **kwargs):
+        sent.append(headers)
+        if headers:
+            api.cache.invalidate()   # evicted while the conditional GET was out
+            return _response(304)
+        return _response(body=b'{"code": "fresh"}')
+
+    api._request = request
+    api.cache.resolve(URL, _response(ETag='"v1"'))
+    assert api._get_json(URL) == {"code": "fresh"}
+    assert sent == [{"If-None-Match": '"v1"'}, {}]
@@ -0,0 +1,183 @@
+"""Cart write ledger, reconciliation, and coalescing, without the network."""
+import threading
+
+import pytest
+import requests
+
+import pcx_cart
+import pcx_deadline
+import pcx_limiter
+from pcexpress_mcp_server import PCExpressAPI
+
+
+def _entry(quantity: int) -> dict:
+    return {"quantity": quantity, "fulfillmentMethod": "pickup", "sellerId": "1234"}
+
+
+def _cart(**quantities) -> dict:
+    entries = [{"product": {"code": code, "name": code}, "quantity": q}
+               for code, q in quantities.items()]
+    return {"id": "cart", "orders": [{"entries": entries}]}
+
+
+def test_ledger_joins_identical_write_in_flight():
+    ledger = pcx_cart.CartWriteLedger()
+    op_id, joined = ledger.begin({"A": _entry(2)})
+    assert op_id and joined is None
+    again, future = ledger.begin({"A": _entry(2)})
+    assert again is None
+    ledger.finish({"A": _entry(2)}, cart={"id": "done"})
+    assert future.result(timeout=1) == {"id": "done"}
+    assert ledger.stats()["joined"] == 1
+    # Once finished, the same write is a new operation again.
+    assert ledger.begin({"A": _entry(2)})[0] not in (None, op_id)
+
+
+def test_ledger_join_sees_the_error():
+    ledger = pcx_cart.CartWriteLedger()
+    ledger.begin({"A": _entry(1)})
+    _, future = ledger.begin({"A": _entry(1)})
+    ledger.finish({"A": _entry(1)}, error=requests.ConnectionError("down"))
+    with pytest.raises(requests.ConnectionError):
+        future.result(timeout=1)
+
+
+def test_ledger_newer_write_supersedes_older_entries():
+    ledger = pcx_cart.CartWriteLedger()
+    old, _ = ledger.begin({"A": _entry(1), "B": _entry(1)})
+    new, _ = ledger.begin({"A": _entry(3)})
+    assert ledger.owned(old, {"A": _entry(1), "B": _entry(1)}) == {"B": _entry(1)}
+    assert ledger.owned(new, {"A": _entry(3)}) == {"A": _entry(3)}
+    assert ledger.stats()["superseded"] == 1
+
+
+def test_entries_applied_uses_absolute_quantities():
+    cart = _cart(A=2)
+    assert pcx_cart.entries_applied(cart, {"A": _entry(2)})
+    assert not pcx_cart.entries_applied(cart, {"A": _entry(3)})
+    assert pcx_cart.entries_applied(cart, {"B": _entry(0)})
+    assert not pcx_cart.entries_applied(cart, {"A": _entry(0)})
+
+
+@pytest.fixture
+def api(token):
+    return PCExpressAPI(token, "cart", cart_write_retries=2)
+
+
+def _scripted(api, outcomes: list, cart: dict):
+    """Make the API's POSTs follow `outcomes` (exceptions raised, else returned) and its
+    reconciliation reads return `cart`. Returns the list of entries each POST sent."""
+    sent = []
+
+    def send(entries):
+        sent.append(entries)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    api._send_cart_entries = send
+    api._reconcile_cart = lambda: cart
+    return sent
+
+
+def test_write_that_landed_is_reconciled_not_resent(api):
+    sent = _scripted(api, [requests.Timeout("slow")], _cart(A=2))
+    assert api._post_cart_entries({"A": _entry(2)}) == _cart(A=2)
+    assert len(sent) == 1
+    assert api.cart_ops.stats()["reconciled"] == 1
+
+
+def test_write_that_did_not_land_is_retried(api):
+    sent = _scripted(api, [requests.ConnectionError("reset"), _cart(A=2)], _cart())
+    assert api._post_cart_entries({"A": _entry(2)}) == _cart(A=2)
+    assert sent == [{"A": _entry(2)}, {"A": _entry(2)}]
+    assert api.cart_ops.stats()["retries"] == 1
+
+
+def test_client_errors_are_not_retried(api):
+    response = requests.Response()
+    response.status_code = 400
+    sent = _scripted(api, [requests.HTTPError("bad", response=response)], _cart())
+    with pytest.raises(requests.HTTPError):
+        api._post_cart_entries({"A": _entry(2)})
+    assert len(sent) == 1
+
+
+def test_retry_only_resends_entries_not_superseded(api):
+    sent = []
+
+    def send(entries):
+        sent.append(entries)
+        if len(sent) == 1:
+            # A newer write for A is registered while this one's outcome is unknown.
+            api.cart_ops.begin({"A": _entry(5)})
+            raise requests.Timeout("slow")
+        return _cart(A=5, B=1)
+
+    api._send_cart_entries = send
+    api._reconcile_cart = lambda: _cart()
+    api._post_cart_entries({"A": _entry(1), "B": _entry(1)})
+    assert sent[1] == {"B": _entry(1)}
+
+
+def test_write_that_timed_out_at_the_deadline_is_still_reconciled(api):
+    reads = []
+
+    def send(entries):
+        raise requests.Timeout("timed out at the deadline")
+
+    def get_json(url, **kwargs):
+        pcx_deadline.check()
+        reads.append(kwargs)
+        return _cart(A=2)
+
+    api._send_cart_entries = send
+    api._get_json = get_json
+    expired = pcx_deadline.CallContext("add_to_cart", 1)
+    expired.deadline = 0
+    token = pcx_deadline.current.set(expired)
+    try:
+        assert api._post_cart_entries({"A": _entry(2)}) == _cart(A=2)
+    finally:
+        pcx_deadline.current.reset(token)
+    assert reads and reads[0]["timeout"] == api.cart_write_timeout
+    assert reads[0]["priority"] == pcx_limiter.WRITE
+    assert api.cart_ops.stats()["reconciled"] == 1
+
+
+def test_cart_delta_reports_added_removed_and_changed_lines():
+    before = _cart(A=1, B=2)
+    after = _cart(A=3, C=1)
+    for entry in after["orders"][0]["entries"]:
+        entry["totalPrice"] = entry["quantity"] * 2.5
+    delta = pcx_cart.cart_delta(before, after)
+    assert [line["code"] for line in delta["added"]] == ["C"]
+    assert [line["code"] for line in delta["removed"]] == ["B"]
+    assert delta["changed"][0]["code"] == "A"
+    assert delta["changed"][0]["quantity"] == {"from": 1, "to": 3}
+    assert delta["lineCount"] == 2
+    assert delta["subtotal"] == 10.0
+
+
+def test_cart_delta_of_a_coalesced_write_reports_only_its_own_product():
+    # B and C were written in the same batch by other calls.
+    delta = pcx_cart.cart_delta(_cart(A=1), _cart(A=2, B=1, C=4), codes=("A",))
+    assert [c["code"] for c in delta["changed"]] == ["A"]
+    assert delta["added"] == [] and delta["removed"] == []
+    assert delta["lineCount"] == 3
+
+
+def test_batcher_coalesces_a_burst_into_one_post():
+    posts = []
+    batcher = pcx_cart.CartWriteBatcher(
+        lambda entries: posts.append(dict(entries)) or {"n": len(posts)}, 0.05)
+    results = []
+    threads = [threading.Thread(target=lambda c=c: results.append(batcher.submit(c, _entry(1))))
+               for c in ("A", "B", "C")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert posts == [{"A": _entry(1), "B": _entry(1), "C": _entry(1)}]
+    assert results == [{"n": 1}] * 3
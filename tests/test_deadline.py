@@ -0,0 +1,50 @@
+"""Tool deadlines: per-tool defaults, and what a cart write says when it runs out of time."""
+import asyncio
+import time
+
+import pcexpress_mcp_server as server
+import pcx_deadline
+
+
+def test_sync_heavy_tools_and_cart_writes_get_longer_defaults(monkeypatch):
+    monkeypatch.delenv("PCEXPRESS_TOOL_DEADLINE", raising=False)
+    monkeypatch.setenv("PCEXPRESS_TOOL_DEADLINES", "suggest_restock=45")
+    default, per_tool = pcx_deadline.deadlines_from_env()
+    assert default == pcx_deadline.DEFAULT_DEADLINE
+    assert per_tool["purchase_analytics"] > default
+    assert per_tool["add_to_cart"] > default
+    assert per_tool["suggest_restock"] == 45
+    assert "search_products" not in per_tool
+
+
+def test_no_deadline_means_none_per_tool_either(monkeypatch):
+    monkeypatch.setenv("PCEXPRESS_TOOL_DEADLINE", "0")
+    monkeypatch.delenv("PCEXPRESS_TOOL_DEADLINES", raising=False)
+    assert pcx_deadline.deadlines_from_env() == (0.0, {})
+
+
+def _timed_out(monkeypatch, name):
+    async def valid(_name, _arguments):
+        return None
+
+    monkeypatch.setattr(server, "_check_input", valid)
+    monkeypatch.setattr(server, "_call_tool", lambda *_: time.sleep(0.3))
+    monkeypatch.setattr(server, "TOOL_DEADLINES", {name: 0.05})
+
+    async def call():
+        result = await server.call_tool(name, {})
+        return result, pcx_deadline.current.get()
+
+    result, left_over = asyncio.run(call())
+    return result.content[0].text, left_over
+
+
+def test_cart_write_past_its_deadline_reports_unknown_outcome(monkeypatch):
+    text, left_over = _timed_out(monkeypatch, "add_to_cart")
+    assert "may or may not" in text and "stopped" not in text
+    assert left_over is None
+
+
+def test_read_past_its_deadline_is_stopped(monkeypatch):
+    text, _ = _timed_out(monkeypatch, "search_products")
+    assert "was stopped" in text
@@ -0,0 +1,62 @@
+"""Hedger: where reads run, and taking the hedge over a slow primary."""
+import threading
+import time
+
+import pcx_hedge
+
+
+def _warm(hedger, kind="search", latency=0.0):
+    for _ in range(pcx_hedge.MIN_SAMPLES):
+        hedger._observe(kind, latency)
+
+
+def test_unhedgeable_read_runs_on_callers_thread():
+    hedger = pcx_hedge.Hedger(budget=0.0, max_workers=1)
+    hedger._credit = 0
+    _warm(hedger)
+    assert hedger.run("search", threading.current_thread) is threading.current_thread()
+    assert hedger.run("cold", threading.current_thread) is threading.current_thread()
+
+
+def test_reads_are_not_capped_by_the_pool():
+    hedger = pcx_hedge.Hedger(budget=1.0, max_workers=1)
+    _warm(hedger, latency=1.0)   # p95 of a second: nothing here gets hedged
+    release = threading.Event()
+    started = []
+
+    def slow():
+        started.append(1)
+        release.wait(5)
+        return "ok"
+
+    threads = [threading.Thread(target=hedger.run, args=("search", slow)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 2
+    while len(started) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(started) == 4
+    release.set()
+    for t in threads:
+        t.join()
+
+
+def test_slow_primary_loses_to_hedge():
+    hedger = pcx_hedge.Hedger(budget=1.0, max_workers=2)
+    _warm(hedger, latency=0.01)
+    calls = []
+    discarded = []
+
+    def read():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    start = time.monotonic()
+    assert hedger.run("search", read, discard=discarded.append) == "hedge"
+    assert time.monotonic() - start < 0.4
+    assert hedger.stats()["hedge_wins"] == 1
+    time.sleep(0.6)
+    assert discarded == ["primary"]
@@ -0,0 +1,27 @@
+"""pcx_http: one tuned session shared by the API client and the token manager."""
+import pcexpress_mcp_server as server
+import pcx_http
+
+
+def test_build_session_mounts_a_sized_pool_per_host(monkeypatch):
+    monkeypatch.setenv("PCEXPRESS_POOL_SIZE", "6")
+    monkeypatch.setenv("PCEXPRESS_POOL_SIZES", f"{pcx_http.PCID_HOST}=2")
+    stats = pcx_http.pool_stats(pcx_http.build_session())
+    assert stats[pcx_http.API_HOST]["pool_size"] == 6
+    assert stats[pcx_http.PCID_HOST]["pool_size"] == 2
+    assert stats[pcx_http.API_HOST]["requests"] == 0
+
+
+def test_api_client_and_token_manager_share_the_session(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "api_client", None)
+    monkeypatch.setattr(server, "_env_loaded", True)   # keep a developer's .env out of it
+    monkeypatch.setenv("PCEXPRESS_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("PCEXPRESS_REFRESH_TOKEN", "refresh")
+    monkeypatch.setenv("PCEXPRESS_CART_ID", "cart")
+    monkeypatch.setenv("PCEXPRESS_STORE_BUDGET_MB", "0")
+    monkeypatch.delenv("PCEXPRESS_WORKER_DIR", raising=False)
+
+    client = server.get_api_client()
+    assert client.tokens._session is client.session
+    assert set(pcx_http.pool_stats(client.session)) == {pcx_http.API_HOST, pcx_http.PCID_HOST}
+    assert server.get_api_client() is client
@@ -0,0 +1,43 @@
+"""pcx_json: the orjson and stdlib paths produce the same documents."""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import pcx_json
+
+PAYLOAD = {
+    "name": "Pâté de campagne 2%",
+    "prices": [4.99, 0.5, 12],
+    "stock": {"inStock": True, "lowStock": None},
+    "lines": [{"code": "20132621001_EA", "quantity": 2}],
+}
+
+
+def test_stdlib_output_is_what_orjson_writes():
+    orjson = pytest.importorskip("orjson")
+    indented = orjson.dumps(PAYLOAD, option=orjson.OPT_INDENT_2).decode()
+    assert pcx_json.stdlib_dumps(PAYLOAD) == indented
+    assert pcx_json.stdlib_dumps(PAYLOAD, indent=False) == orjson.dumps(PAYLOAD).decode()
+
+
+@pytest.mark.parametrize("indent", [True, False])
+def test_round_trip_matches_the_stdlib(indent):
+    text = pcx_json.dumps(PAYLOAD, indent=indent)
+    assert text == pcx_json.stdlib_dumps(PAYLOAD, indent=indent)
+    assert pcx_json.loads(text.encode()) == pcx_json.stdlib_loads(text) == PAYLOAD
+
+
+@pytest.mark.parametrize("obj", [{1: "non-str key"}, {"big": 2 ** 70}])
+def test_values_orjson_refuses_fall_back_to_the_stdlib(obj):
+    assert pcx_json.dumps(obj, indent=False) == pcx_json.stdlib_dumps(obj, indent=False)
+
+
+def test_env_forces_the_stdlib():
+    root = Path(__file__).resolve().parent.parent
+    backend = subprocess.run(
+        [sys.executable, "-c", "import pcx_json; print(pcx_json.BACKEND)"],
+        cwd=root, env={"PCEXPRESS_JSON": "stdlib"}, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert backend == "json"
@@ -0,0 +1,177 @@
+"""AdaptiveLimiter: how the limit moves, and waiting for a slot under a tool call's deadline."""
+import contextlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import pcx_deadline
+import pcx_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(pcx_limiter, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def _round(limiter, clock, latency: float, overloaded: bool = False, requests: int = 0):
+    """`requests` (default: the whole limit) concurrent requests, all taking `latency`."""
+    with contextlib.ExitStack() as stack:
+        count = requests or int(limiter.limit)
+        reports = [stack.enter_context(limiter.slot()) for _ in range(count)]
+        clock.now += latency
+        if overloaded:
+            for report in reports:
+                report()
+
+
+def test_fast_rounds_at_full_use_add_up_to_one_each(clock):
+    limiter = pcx_limiter.AdaptiveLimiter(initial=4)
+    for _ in range(3):
+        _round(limiter, clock, 0.05)
+    assert 5 < limiter.limit < 7   # the first requests of a round find it less than half used
+
+
+def test_a_limit_not_in_use_does_not_grow(clock):
+    limiter = pcx_limiter.AdaptiveLimiter(initial=8)
+    for _ in range(20):
+        _round(limiter, clock, 0.05, requests=1)
+    assert limiter.limit == 8
+
+
+def test_an_overload_burst_halves_once_per_round_trip(clock):
+    limiter = pcx_limiter.AdaptiveLimiter(initial=16)
+    _round(limiter, clock, 0.1, requests=1)
+    _round(limiter, clock, 0.1, overloaded=True, requests=6)
+    assert limiter.limit == 8 and limiter.stats()["decreases"] == 1
+    clock.now += 1
+    _round(limiter, clock, 0.1, overloaded=True, requests=1)
+    assert limiter.limit == 4 and limiter.stats()["overloads"] == 7
+
+
+def test_slow_responses_back_off(clock):
+    limiter = pcx_limiter.AdaptiveLimiter(initial=8)
+    _round(limiter, clock, 0.05, requests=1)
+    for _ in range(4):
+        _round(limiter, clock, 0.5, requests=1)
+    assert 7 < limiter.limit < 8
+
+
+def _full_limiter():
+    limiter = pcx_limiter.AdaptiveLimiter(initial=1, max_limit=1)
+    held = limiter.slot()
+    held.__enter__()
+    return limiter, held
+
+
+def _in_call(call, fn):
+    token = pcx_deadline.current.set(call)
+    try:
+        return fn()
+    finally:
+        pcx_deadline.current.reset(token)
+
+
+def test_wait_ends_at_the_deadline():
+    limiter, held = _full_limiter()
+    call = pcx_deadline.CallContext("search_products", 0.2)
+    start = time.monotonic()
+    with pytest.raises(pcx_deadline.DeadlineExceeded):
+        _in_call(call, lambda: limiter.slot().__enter__())
+    assert time.monotonic() - start < 1
+    assert limiter.stats()["waiting"] == 0
+    held.__exit__(None, None, None)
+
+
+def test_cancel_wakes_the_waiter():
+    limiter, held = _full_limiter()
+    call = pcx_deadline.CallContext("search_products", None)
+    errors = []
+
+    def wait():
+        try:
+            _in_call(call, lambda: limiter.slot().__enter__())
+        except pcx_deadline.CallCancelled as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.1)
+    call.cancel()
+    waiter.join(1)
+    assert not waiter.is_alive() and len(errors) == 1
+    assert limiter.stats()["classes"]["read"]["waiting"] == 0
+    held.__exit__(None, None, None)
+
+
+def test_abandoned_write_does_not_block_reads():
+    limiter, held = _full_limiter()
+    writer = pcx_deadline.CallContext("add_to_cart", 0.2)
+    reader = pcx_deadline.CallContext("search_products", 5)
+    got = []
+
+    def read():
+        with _in_call(reader, lambda: limiter.slot(pcx_limiter.READ)):
+            got.append(1)
+
+    def write():
+        try:
+            _in_call(writer, lambda: limiter.slot(pcx_limiter.WRITE).__enter__())
+        except pcx_deadline.DeadlineExceeded:
+            pass
+
+    threads = [threading.Thread(target=write), threading.Thread(target=read)]
+    for t in threads:
+        t.start()
+    time.sleep(0.4)   # the write has given up; the read is still queued for the one slot
+    held.__exit__(None, None, None)
+    for t in threads:
+        t.join(1)
+    assert got == [1]
+
+
+def test_a_waiting_write_goes_before_an_earlier_read():
+    limiter, held = _full_limiter()
+    order = []
+
+    def request(priority, name):
+        with limiter.slot(priority):
+            order.append(name)
+
+    threads = []
+    for priority, name in ((pcx_limiter.BACKGROUND, "background"), (pcx_limiter.READ, "read"),
+                           (pcx_limiter.WRITE, "write")):
+        threads.append(threading.Thread(target=request, args=(priority, name)))
+        threads[-1].start()
+        time.sleep(0.05)   # queue them in this order
+    held.__exit__(None, None, None)
+    for t in threads:
+        t.join(1)
+    assert order == ["write", "read", "background"]
+
+
+def test_background_holds_at_most_its_share():
+    limiter = pcx_limiter.AdaptiveLimiter(initial=4, max_limit=4)
+    share = int(4 * pcx_limiter.BACKGROUND_SHARE)
+    with contextlib.ExitStack() as stack:
+        for _ in range(share):
+            stack.enter_context(limiter.slot(pcx_limiter.BACKGROUND))
+        call = pcx_deadline.CallContext("warm-up", 0.1)
+        with pytest.raises(pcx_deadline.DeadlineExceeded):
+            _in_call(call, lambda: limiter.slot(pcx_limiter.BACKGROUND).__enter__())
+        with limiter.slot(pcx_limiter.READ):   # the rest of the limit is still free for tool calls
+            assert limiter.stats()["in_flight"] == share + 1
+
+
+def test_background_pauses_while_tool_calls_use_half_the_limit():
+    limiter = pcx_limiter.AdaptiveLimiter(initial=4, max_limit=4)
+    with limiter.slot(), limiter.slot():
+        call = pcx_deadline.CallContext("warm-up", 0.1)
+        with pytest.raises(pcx_deadline.DeadlineExceeded):
+            _in_call(call, lambda: limiter.slot(pcx_limiter.BACKGROUND).__enter__())
+    assert limiter.stats()["background_pauses"] == 1
+    with limiter.slot(pcx_limiter.BACKGROUND):
+        assert limiter.stats()["classes"]["background"]["in_flight"] == 1
@@ -0,0 +1,128 @@
+"""Incremental order-history parsing at every chunk boundary."""
+import json
+
+import pcx_orders
+
+BODY = json.dumps({
+    "onlineOrdersCount": 3,
+    "note": "a \"quoted\" [bracket] {brace} and \\ backslash",
+    "orderHistory": [
+        {"orderId": "1", "store": "Zehrs \"Downtown\"", "items": [{"name": "Milk ]}"}]},
+        {"orderId": "2", "total": 12.5, "tags": [], "nested": {"a": [1, {"b": "}"}]}},
+        {"orderId": "3", "text": "ünïcode ✓"},
+    ],
+    "offlineOrdersCount": 4,
+}, ensure_ascii=False).encode()
+
+
+def _chunked(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_every_chunk_size_parses_the_same():
+    expected = json.loads(BODY)["orderHistory"]
+    for size in range(1, len(BODY) + 1):
+        meta = {}
+        parsed = pcx_orders.iter_json_array(_chunked(BODY, size), "orderHistory", meta)
+        assert list(parsed) == expected, size
+        assert meta == {"onlineOrdersCount": 3, "offlineOrdersCount": 4}, size
+
+
+def test_stopping_early_leaves_the_rest_unread():
+    read = []
+
+    def chunks():
+        for chunk in _chunked(BODY, 16):
+            read.append(chunk)
+            yield chunk
+
+    first = next(iter(pcx_orders.iter_json_array(chunks(), "orderHistory")))
+    assert first["orderId"] == "1"
+    assert sum(map(len, read)) < len(BODY)
+
+
+def test_missing_or_empty_array():
+    assert list(pcx_orders.iter_json_array([b'{"other": [1, 2]}'], "orderHistory")) == []
+    empty = _chunked(b'{"orderHistory": [ ]}', 3)
+    assert list(pcx_orders.iter_json_array(empty, "orderHistory")) == []
+
+
+def test_truncated_body_yields_only_complete_elements():
+    cut = BODY[:BODY.index(b'"orderId": "2"') + 5]
+    parsed = pcx_orders.iter_json_array(_chunked(cut, 7), "orderHistory")
+    assert [o["orderId"] for o in parsed] == ["1"]
+
+
+def _api_with_history(token, orders: int):
+    from pcexpress_mcp_server import PCExpressAPI
+
+    api = PCExpressAPI(token, "cart", fan_out=8)
+    history = {"orderHistory": [
+        {"orderId": str(i), "orderDate": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}"}
+        for i in range(orders)]}
+    fetched = []
+
+    def order_items(ids):
+        fetched.extend(ids)
+        return {oid: [{"code": "1_EA", "name": "Milk" if oid == "5" else "Bread"}] for oid in ids}
+
+    api.order_items = order_items
+    return api, pcx_orders.OrderIndex(history), fetched
+
+
+def test_item_search_stops_at_max_scan_and_says_so(token):
+    api, index, fetched = _api_with_history(token, 500)
+    scan = {}
+    assert api.search_orders(10, contains_item="eggs", index=index, max_scan=100, scan=scan) == []
+    assert len(fetched) == 100
+    assert scan == {"scanned": 100, "candidates": 500, "truncated": True}
+
+
+def test_item_search_within_the_scan_is_not_truncated(token):
+    api, index, fetched = _api_with_history(token, 20)
+    scan = {}
+    found = api.search_orders(1, contains_item="milk", index=index, max_scan=100, scan=scan)
+    assert [o["orderId"] for o in found] == ["5"]
+    assert scan["truncated"] is False
+
+
+def test_order_lines_reads_each_known_entry_list():
+    detail = {
+        "order": {"entries": [{"product": {"code": "1_EA", "name": "Milk"}, "quantity": 2}]},
+        "orders": [{"lineItems": [{"code": "2_EA", "name": "Bread"}, {"name": "no code"}]}],
+    }
+    lines = pcx_orders.order_lines(detail)
+    assert [(line["code"], line["name"]) for line in lines] == [("1_EA", "Milk"), ("2_EA", "Bread")]
+    assert pcx_orders.order_lines(None) == []
+
+
+def test_include_items_inlines_lines_for_the_first_orders(token, monkeypatch):
+    import pcexpress_mcp_server as server
+
+    api, index, _ = _api_with_history(token, 6)
+    del api.order_items   # the real one, over get_order_details
+    fetched = []
+
+    def get_order_details(oid, max_age=0):
+        fetched.append(oid)
+        if oid == "4":
+            raise RuntimeError("order 4 unavailable")
+        return {"entries": [{"code": f"{oid}_EA", "name": f"Item {oid}", "quantity": 1}]}
+
+    api.get_order_details = get_order_details
+    api.get_historical_orders = lambda: index.source
+    monkeypatch.setattr(server, "api_client", api)
+    monkeypatch.setattr(server, "HISTORY_STREAM", False)
+    monkeypatch.setattr(server, "ORDER_PREFETCH", 2)
+    monkeypatch.setattr(server, "TOOL_RESULTS", "compact")
+
+    arguments = {"limit": 3, "include_items": True, "items_for": 2}
+    result = server._call_tool("search_past_orders", arguments)
+    orders = json.loads(result[0].text)["orders"]
+    assert [o["orderId"] for o in orders] == ["5", "4", "3"]   # newest first
+    assert orders[0]["items"] == [{"code": "5_EA", "name": "Item 5", "quantity": 1, "price": None}]
+    assert orders[1]["items"] == {"error": "order 4 unavailable"}
+    assert "items" not in orders[2]
+
+    api._background.shutdown(wait=True)   # the next two are warmed for get_order_items
+    assert sorted(fetched) == ["2", "3", "4", "5"]
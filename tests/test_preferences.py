@@ -0,0 +1,69 @@
+"""Which product a generic term resolves to, and when it shouldn't resolve at all."""
+import pcx_preferences
+
+
+def _bought(prefs, code: str, name: str, times: int, brand: str = None):
+    for _ in range(times):
+        prefs.learn_purchases([{"code": code, "name": name, "brand": brand}])
+
+
+def test_head_noun_outweighs_a_modifier():
+    prefs = pcx_preferences.PreferenceMap()
+    _bought(prefs, "BAR", "Milk Chocolate Bar", 3)
+    _bought(prefs, "MILK", "2% Milk 4L", 2)
+    assert prefs.resolve("milk")["code"] == "MILK"
+    assert prefs.resolve("chocolate bar")["code"] == "BAR"
+
+
+def test_percentages_and_sizes_are_words():
+    prefs = pcx_preferences.PreferenceMap()
+    _bought(prefs, "BAR", "Milk Chocolate Bar", 3)
+    _bought(prefs, "SKIM", "Skim Milk 4L", 3)
+    _bought(prefs, "MILK", "2% Milk 4L", 2)
+    assert prefs.resolve("2% milk")["code"] == "MILK"
+
+
+def test_modifier_only_matches_do_not_resolve():
+    prefs = pcx_preferences.PreferenceMap()
+    _bought(prefs, "BAR", "Milk Chocolate Bar", 3)
+    assert prefs.resolve("milk") is None
+
+
+def test_too_few_orders_or_no_clear_winner_do_not_resolve():
+    prefs = pcx_preferences.PreferenceMap()
+    _bought(prefs, "WHITE", "White Bread", 1)
+    assert prefs.resolve("bread") is None
+    _bought(prefs, "WHITE", "White Bread", 1)
+    assert prefs.resolve("bread")["code"] == "WHITE"
+    _bought(prefs, "RYE", "Rye Bread", 2)
+    assert prefs.resolve("bread") is None
+
+
+def test_brand_words_are_not_terms():
+    prefs = pcx_preferences.PreferenceMap()
+    _bought(prefs, "EGGS", "Neilson Large Eggs", 3, brand="Neilson")
+    assert prefs.resolve("neilson") is None
+    assert prefs.resolve("eggs")["code"] == "EGGS"
+
+
+def test_a_pick_after_search_resolves_and_persists(tmp_path):
+    path = str(tmp_path / "prefs.json")
+    prefs = pcx_preferences.PreferenceMap(path)
+    prefs.note_search("oat milk", [{"code": "OAT", "name": "Oat Beverage"}])
+    prefs.note_add("OAT")
+    assert prefs.resolve("oat milk")["source"] == "choice"
+    assert pcx_preferences.PreferenceMap(path).resolve("oat milk")["code"] == "OAT"
+
+
+def test_workers_sharing_the_file_keep_each_others_picks(tmp_path):
+    path = str(tmp_path / "preferences.json")
+    workers = [pcx_preferences.PreferenceMap(path), pcx_preferences.PreferenceMap(path)]
+    for prefs in workers:
+        prefs.note_search("milk", [{"code": "MILK", "name": "2% Milk 4L"}])
+    for _ in range(2):
+        for prefs in workers:
+            prefs.note_add("MILK")   # each worker starts from the same saved count
+
+    fresh = pcx_preferences.PreferenceMap(path)
+    assert fresh._choices["milk"]["MILK"] == 4
+    assert fresh.resolve("milk")["source"] == "choice"
@@ -0,0 +1,59 @@
+"""Tool results in each PCEXPRESS_TOOL_RESULTS mode, and the outputSchema check."""
+import asyncio
+import json
+
+import pytest
+from mcp.types import CallToolRequest, CallToolRequestParams, CallToolResult
+
+import pcexpress_mcp_server as server
+
+CART = {"cart": {"code": "cart"}, "lines": [{"code": "1_EA", "quantity": 2}], "lineCount": 1}
+
+
+@pytest.fixture
+def mode(monkeypatch):
+    monkeypatch.setattr(server, "_output_validators", {})
+    return lambda value: monkeypatch.setattr(server, "TOOL_RESULTS", value)
+
+
+def test_compact_is_single_line_json(mode):
+    mode("compact")
+    [content] = server._tool_result("view_cart", CART)
+    assert "\n" not in content.text and json.loads(content.text) == CART
+
+
+def test_indented_is_two_space_json(mode):
+    mode("indented")
+    [content] = server._tool_result("view_cart", CART)
+    assert content.text == json.dumps(CART, indent=2)
+
+
+def test_structured_carries_the_result_and_a_compact_copy(mode):
+    mode("structured")
+    result = server._tool_result("search_past_orders", {"orders": [{"orderId": "1"}]})
+    assert isinstance(result, CallToolResult) and not result.isError
+    assert result.structuredContent == {"orders": [{"orderId": "1"}]}
+    assert result.content[0].text == '{"orders":[{"orderId":"1"}]}'
+
+
+def test_structured_result_the_schema_rejects_is_an_error(mode):
+    mode("structured")
+    result = server._tool_result("search_past_orders", {"orders": "not a list"})
+    assert result.isError and result.content[0].text.startswith("Output validation error")
+
+
+@pytest.mark.parametrize("value, declared", [("compact", False), ("structured", True)])
+def test_output_schemas_are_declared_only_when_structured(mode, value, declared):
+    mode(value)
+    tools = asyncio.run(server.list_tools())
+    assert all((tool.outputSchema is not None) == declared for tool in tools)
+
+
+def test_mcp_layer_passes_a_structured_result_through(mode, monkeypatch):
+    mode("structured")
+    monkeypatch.setattr(server, "_call_tool", lambda name, _: server._tool_result(name, CART))
+    handler = server.app.request_handlers[CallToolRequest]
+    params = CallToolRequestParams(name="view_cart", arguments={})
+    request = CallToolRequest(method="tools/call", params=params)
+    result = asyncio.run(handler(request)).root
+    assert not result.isError and result.structuredContent == CART
@@ -0,0 +1,44 @@
+"""Spelling suggestions in search_products never replace a query that finds something."""
+import pytest
+
+from pcexpress_mcp_server import PCExpressAPI
+
+CATALOG = {"pear": ["Bartlett Pear"], "peas": ["Green Peas", "Frozen Peas"], "rise": [],
+           "rice": ["Wild Rice", "Basmati Rice"]}
+
+
+@pytest.fixture
+def api(token):
+    api = PCExpressAPI(token, "cart")
+    api.names.add([("1", "Green Peas"), ("2", "Wild Rice")])
+    api.searched = []
+
+    def search_term(term, size):
+        api.searched.append(term)
+        names = CATALOG.get(term, [])
+        return len(names), [{"code": n, "name": n} for n in names]
+
+    api._search_term = search_term
+    return api
+
+
+def test_valid_word_is_searched_as_given_with_a_suggestion(api):
+    result = api.search_products("pear")
+    assert api.searched == ["pear"]
+    assert [p["name"] for p in result["products"]] == ["Bartlett Pear"]
+    assert result["didYouMean"] == "peas"
+    assert "correctedFrom" not in result
+
+
+def test_correction_is_searched_when_the_query_finds_nothing(api):
+    result = api.search_products("rise")
+    assert api.searched == ["rise", "rice"]
+    assert result["query"] == "rice"
+    assert result["correctedFrom"] == "rise"
+    assert "didYouMean" not in result
+
+
+def test_exact_skips_suggestions(api):
+    result = api.search_products("rise", exact=True)
+    assert api.searched == ["rise"]
+    assert "didYouMean" not in result and "localMatches" not in result
@@ -0,0 +1,45 @@
+"""SessionTracker: per-session memory estimate and the pending-call cap."""
+import pytest
+
+import pcx_sessions
+
+SESSION_ID = "0123456789abcdef0123456789abcdef"
+
+
+def _tracker(**kwargs):
+    tracker = pcx_sessions.SessionTracker(**kwargs)
+    session = tracker.open("bearer-test", lambda: None)
+    tracker.sent(session, f"event: endpoint\ndata: /messages/?session_id={SESSION_ID}\n\n".encode())
+    return tracker, session
+
+
+def test_estimate_counts_queued_messages_and_running_calls():
+    tracker, session = _tracker()
+    assert session.est_bytes == pcx_sessions.SESSION_OVERHEAD
+
+    assert tracker.received(SESSION_ID, 5_000, calls=1) is None
+    assert (session.queued, session.queued_bytes) == (1, 5_000)
+    tracker.delivered(SESSION_ID, 5_000)
+    tracker.call_started(SESSION_ID, 4_000)
+    assert session.est_bytes == pcx_sessions.SESSION_OVERHEAD + 4_000
+    assert tracker.stats()["busiest"][0]["est_bytes"] == session.est_bytes
+
+    tracker.call_finished(SESSION_ID, 4_000)
+    assert session.est_bytes == pcx_sessions.SESSION_OVERHEAD
+    assert tracker.stats()["est_bytes"] == pcx_sessions.SESSION_OVERHEAD
+
+
+def test_queued_message_keeps_session_from_idling():
+    tracker, session = _tracker()
+    tracker.received(SESSION_ID, 100)
+    assert session.idle(session.last_active + 3600) == 0
+    tracker.delivered(SESSION_ID, 100)
+    assert session.idle(session.last_active + 3600) == pytest.approx(3600)
+
+
+def test_calls_over_max_pending_are_refused():
+    tracker, session = _tracker(max_pending=1)
+    tracker.call_started(SESSION_ID)
+    assert tracker.received(SESSION_ID, 100, calls=1) == 1
+    assert session.queued == 0
+    assert tracker.stats()["pending_refused"] == 1
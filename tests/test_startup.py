@@ -0,0 +1,28 @@
+"""Cold start: importing the server and listing tools stays off the HTTP stack and auth."""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# dotenv is not listed: mcp's own settings loader imports it before the server does.
+DEFERRED = ("requests", "urllib3", "pcid_token")
+
+LIST_TOOLS = """
+import asyncio, json, sys
+import pcexpress_mcp_server as server
+tools = asyncio.run(server.list_tools())
+print(json.dumps({"tools": len(tools), "loaded": [m for m in %r if m in sys.modules],
+                  "client": server.api_client is not None}))
+""" % (DEFERRED,)
+
+
+def test_list_tools_loads_no_deferred_module():
+    env = {"PCEXPRESS_HTTP": "0"}   # and no credentials: listing tools must not need them
+    out = subprocess.run(
+        [sys.executable, "-c", LIST_TOOLS], cwd=Path(__file__).resolve().parent.parent,
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    report = json.loads(out)
+    assert report["tools"] > 0
+    assert report["loaded"] == []
+    assert report["client"] is False
@@ -0,0 +1,89 @@
+"""DiskStore budget, value-per-byte eviction, and recovery on open."""
+import os
+
+import pcx_store
+
+
+def _blob(n: int) -> str:
+    return os.urandom(n).hex()  # barely compressible, so sizes are predictable
+
+
+def test_stays_within_budget(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 40_000)
+    for i in range(40):
+        store.put(f"k{i}", _blob(2_000))
+    assert store.bytes <= store.budget
+    assert store.stats()["evictions"] > 0
+    assert store.get("k39") is not None
+
+
+def test_evicts_cheapest_per_byte_first(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 40_000)
+    for i in range(4):
+        assert store.put(f"order{i}", _blob(2_000), value=4)
+    for i in range(20):
+        store.put(f"product{i}", _blob(2_000), value=1)
+    assert all(store.get(f"order{i}") is not None for i in range(4))
+    assert store.bytes <= store.budget
+
+
+def test_low_value_entry_does_not_evict_higher_value(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 40_000)
+    for i in range(30):
+        store.put(f"order{i}", _blob(2_000), value=4)
+    orders = store.stats()["entries"]
+    assert not store.put("product", _blob(2_000), value=1)
+    assert store.stats()["entries"] == orders
+
+
+def test_equal_value_entries_replace_each_other(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 40_000)
+    for i in range(30):
+        assert store.put(f"product{i}", _blob(2_000)), i
+    assert store.get("product29") is not None
+    assert store.stats()["evictions"] >= 10
+
+
+def test_oversized_entry_is_skipped(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 4_000)
+    assert not store.put("big", _blob(4_000))
+    assert store.stats()["skipped"] == 1
+
+
+def test_reopen_keeps_entries_and_cleans_up(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 100_000)
+    store.put("a", {"x": 1}, value=2)
+    store.put("b", {"y": 2})
+    (tmp_path / "leftover.tmp").write_bytes(b"partial")
+    (tmp_path / "README").write_text("not ours")
+    broken = next(n for n in os.listdir(tmp_path) if n.startswith(store._digest("b")))
+    (tmp_path / broken).write_bytes(b"not zlib")
+
+    reopened = pcx_store.DiskStore(str(tmp_path), 100_000)
+    assert reopened.get("a") == {"x": 1}
+    assert reopened.get("b") is None          # unreadable: dropped
+    assert not (tmp_path / "leftover.tmp").exists()
+    assert (tmp_path / "README").exists()
+    assert reopened.stats()["entries"] == 1
+
+
+def test_delete(tmp_path):
+    store = pcx_store.DiskStore(str(tmp_path), 100_000)
+    store.put("a", [1, 2, 3])
+    store.delete("a")
+    assert store.get("a") is None
+    assert store.bytes == 0
+
+
+def test_shared_store_removes_single_process_leftovers(tmp_path):
+    disk = pcx_store.DiskStore(str(tmp_path), 100_000)
+    disk.put("order1", _blob(2_000), value=4)
+    (tmp_path / "half-written.tmp").write_bytes(b"x")
+    (tmp_path / "README").write_text("not ours")
+
+    shared = pcx_store.SharedStore(str(tmp_path / "shared.db"), 100_000)
+    left = sorted(os.listdir(tmp_path))
+    assert not [n for n in left if n.endswith((".z", ".tmp"))]
+    assert "README" in left
+    assert shared.put("order1", {"x": 1}, value=4)
+    assert shared.get("order1") == {"x": 1}
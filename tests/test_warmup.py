@@ -0,0 +1,63 @@
+"""Startup warm-up: what it pays for up front and what /health/ready reports meanwhile."""
+import pytest
+from starlette.testclient import TestClient
+
+import pcexpress_mcp_server as server
+
+
+class _Client:
+    def __init__(self, token, fail: Exception = None):
+        self.tokens = token
+        self.fail = fail
+        self.fetched = []
+
+    @property
+    def cart_id(self):
+        if self.fail:
+            raise self.fail
+        self.fetched.append("cart")
+        return "cart"
+
+    def get_historical_orders(self):
+        self.fetched.append("orders")
+
+
+@pytest.fixture
+def status(monkeypatch):
+    monkeypatch.setattr(server, "warmup_status", {"state": "cold", "error": None})
+    for name in ("admission", "router", "sessions"):   # _build_http_app sets these
+        monkeypatch.setattr(server, name, getattr(server, name))
+    return server.warmup_status
+
+
+def _ready() -> tuple:
+    resp = TestClient(server._build_http_app()).get("/health/ready")   # no lifespan: state as set
+    return resp.status_code, resp.json()
+
+
+def test_warm_up_resolves_the_cart_and_optionally_the_orders(monkeypatch, status, token):
+    client = _Client(token)
+    monkeypatch.setattr(server, "get_api_client", lambda: client)
+    server.warm_up()
+    assert status["state"] == "ready" and client.fetched == ["cart"]
+    server.warm_up(prefill_orders=True)
+    assert client.fetched == ["cart", "cart", "orders"]
+
+
+def test_failed_warm_up_is_degraded_not_fatal(monkeypatch, status, token):
+    client = _Client(token, fail=RuntimeError("profile 500"))
+    monkeypatch.setattr(server, "get_api_client", lambda: client)
+    server.warm_up()
+    assert status == {"state": "degraded", "error": "profile 500"}
+    assert _ready() == (200, {"status": "degraded", "error": "profile 500"})
+
+
+@pytest.mark.parametrize("state", ["cold", "warming"])
+def test_not_ready_until_warm_up_finishes(status, state):
+    status["state"] = state
+    assert _ready()[0] == 503
+
+
+def test_ready_once_warm(status):
+    status["state"] = "ready"
+    assert _ready() == (200, {"status": "ready"})
@@ -0,0 +1,48 @@
+"""PeerRouter: forwarding a post past siblings that fail mid-exchange."""
+import asyncio
+import os
+
+import pcx_workers
+
+
+async def _peer(directory: str, name: str, answer: bytes):
+    async def serve(reader, writer):
+        await reader.readline()
+        writer.write(answer)
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_unix_server(serve, path=os.path.join(directory, name))
+
+
+def test_forward_skips_peers_that_die_or_answer_garbage(tmp_path):
+    async def run():
+        peers = [
+            await _peer(str(tmp_path), "a-truncated.sock", b'{"status": 202, "bo'),
+            await _peer(str(tmp_path), "b-garbage.sock", b"not json\n"),
+            await _peer(str(tmp_path), "c-owner.sock",
+                        b'{"status": 202, "headers": [], "body": "ok"}\n'),
+        ]
+        router = pcx_workers.PeerRouter(str(tmp_path))
+        try:
+            return await router.forward({"path": "/messages/"}), router
+        finally:
+            for peer in peers:
+                peer.close()
+
+    response, router = asyncio.run(run())
+    assert response == {"status": 202, "headers": [], "body": "ok"}
+    assert router.forwarded == 1
+
+
+def test_forward_gives_up_when_no_peer_answers(tmp_path):
+    async def run():
+        peer = await _peer(str(tmp_path), "a.sock", b"")
+        router = pcx_workers.PeerRouter(str(tmp_path))
+        try:
+            return await router.forward({"path": "/messages/"}), router
+        finally:
+            peer.close()
+
+    response, router = asyncio.run(run())
+    assert response is None and router.unroutable == 1